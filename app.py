@@ -1,77 +1,148 @@
 """Flask app for FetchFolio app."""
 
 import os
-from dotenv import load_dotenv
-from flask import Flask, jsonify, request, g, abort
+from flask import Flask, Blueprint, jsonify, request, g, abort, url_for
 from flask_cors import CORS
-from flask_debugtoolbar import DebugToolbarExtension
-from sqlalchemy import or_
+from sqlalchemy import or_, select, delete
 from sqlalchemy.exc import IntegrityError
 from werkzeug.utils import secure_filename
-from werkzeug.exceptions import BadRequest, Unauthorized
+from werkzeug.exceptions import BadRequest, Unauthorized, HTTPException
 import jwt
 import logging
 import uuid
 
 
 from models import (db, connect_db, User, UserSchema, Dog, DogSchema,Command, CommandSchema,
-                    CommandNote, CommandNoteSchema, CommandTemplate, Event, EventSchema)
-from auth_middleware import require_user
+                    CommandNote, CommandNoteSchema, CommandTemplate,
+                    CommandTemplateSchema, Event, EventSchema)
+from auth_middleware import (require_user, require_metrics_token, AuthGlobals,
+                             token_revocations)
+from ownership import (get_owned_dog, get_owned_command, lock_owned_dog,
+                       lock_owned_command,
+                       delete_owned_dog, delete_owned_command,
+                       owned_dog_version, add_owned_commands_from_templates)
+from serializers import serializer
+from pool_metrics import pool_metrics
+from loading import (DOG_DETAIL_PLAN, COMMAND_DETAIL_PLAN, USER_FIELDS,
+                     DOG_FIELDS, COMMAND_FIELDS, get_fields_arg,
+                     get_include_arg, fields_plan, command_list_plan)
+from pagination import (get_page_args, wants_stream, keyset_page,
+                        newest_first_page, page_response, stream_response)
+from config import configs
+from app_logging import configure_logging
+from hashing import password_hasher
+from request_metrics import request_metrics, timed
+from conditional import conditional
+from cache import response_cache, cached
+from json_provider import FetchFolioJSONProvider
+from compression import response_compression
+from batch import validate_batch, apply_batch, MAX_BATCH_SIZE
+from request_fields import parse_datetime_field, parse_proficiency_field
+from note_buffer import note_buffer
+from event_calendar import get_window_args, get_dog_events, get_user_events
+from search import search_index, get_search_args, load_results
+import summaries
+import history
+from ical_feed import (user_feed_version, dog_feed_version, user_feed_stmt,
+                       dog_feed_stmt, feed_response)
+
+logger = logging.getLogger(__name__)
+
+api = Blueprint("api", __name__)
+
+
+def create_app(config=None, async_mode=False):
+    """Create FetchFolio app.
+
+    config is a profile name from config.configs ("development", "test",
+    "production") or a config class. Defaults to the FETCHFOLIO_CONFIG
+    environment variable, then "development".
+
+    async_mode sets the app up to be served by asgi.py, with an async
+    database driver; it can then only be run from there."""
+
+    config = config or os.environ.get("FETCHFOLIO_CONFIG", "development")
+    if isinstance(config, str):
+        config = configs[config]
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+    app.config["ASYNC_MODE"] = async_mode
+    app.app_ctx_globals_class = AuthGlobals
+
+    configure_logging(app)
+    app.json = FetchFolioJSONProvider(app)
+    request_metrics.init_app(app)
+    response_compression.init_app(app)
+    CORS(app)
+    connect_db(app)
+    password_hasher.init_app(app)
+    token_revocations.init_app(app)
+    response_cache.init_app(app)
+    note_buffer.init_app(app)
+    search_index.init_app(app)
+
+    if app.config["DEBUG_TOOLBAR"]:
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    app.register_blueprint(api)
+    app.cli.add_command(summaries.summaries_cli)
+
+    return app
+
+
+# list views don't include nested relationships unless asked with ?include=
+serialize_user = serializer(UserSchema)
+serialize_user_summary = serializer(UserSchema, only=USER_FIELDS)
+serialize_dog = serializer(DogSchema)
+serialize_dog_summary = serializer(DogSchema, only=DOG_FIELDS)
+serialize_command = serializer(CommandSchema)
+serialize_command_note = serializer(CommandNoteSchema)
+serialize_event = serializer(EventSchema)
+serialize_command_template = serializer(CommandTemplateSchema)
+# commands created from templates have no notes to load
+serialize_new_command = serializer(
+    CommandSchema,
+    only=tuple(name for name in CommandSchema.Meta.fields if name != "notes"),
+)
+
+# response cache namespace for GET /dogs; invalidate on any write to dogs
+PUBLIC_DOGS = "public_dogs"
+# response cache namespace for GET /command-templates; templates are only
+# written by migrations and seed scripts, so cached pages expire by CACHE_TTL
+COMMAND_TEMPLATES = "command_templates"
+
+# most templates one apply-templates request can add
+MAX_TEMPLATES_PER_REQUEST = 200
 
-load_dotenv()
-
-app = Flask(__name__)
-CORS(app)
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['DATABASE_URL']
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = True
-app.config['SECRET_KEY'] = os.environ['SECRET_KEY']
-
-connect_db(app)
-
-# logging.getLogger('flask_cors').level = logging.DEBUG
-
-# Having the Debug Toolbar show redirects explicitly is often useful;
-# however, if you want to turn it off, you can uncomment this line:
-#
-# app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
-
-debug = DebugToolbarExtension(app)
-
-users_schema = UserSchema()
-dogs_schema = DogSchema()
-commands_schema = CommandSchema()
-commands_notes_schema = CommandNoteSchema()
-events_schema = EventSchema()
 
 ######################################################  User Signup/Login/Logout
 
-@app.before_request
+@api.before_app_request
 def add_user_to_g():
-    """If there is a user logged in, add the current user to Flask global."""
+    """If there is a valid token, add the username and token version to Flask
+    global. Only the token is checked here; the User is loaded from the
+    database the first time a route reads g.user."""
 
-    token = None
-    if "Authorization" in request.headers:
-        token = request.headers["Authorization"]
+    g.username = None
+    g.token_version = None
+
+    token = request.headers.get("Authorization")
 
     if token:
-        try:
-            data = jwt.decode(token, os.environ['SECRET_KEY'], algorithms=["HS256"])
-            current_user = User.query.get(data["username"])
-            if current_user is None:
-                raise Unauthorized("Invalid token.")
-            else:
-                g.user = current_user
-                print("\033[96m"+ 'PRINT >>>>> ' + "\033[00m", "g", g.user)
-            
-        except Exception as e:
-            g.user = None
-    
-    else:
-        g.user = None    
-    
+        with timed("auth"):
+            try:
+                data = User.decode_token(token)
+                g.username = data["username"]
+                g.token_version = data["ver"]
+                logger.debug("Authenticated request for %s", g.username)
+
+            except jwt.InvalidTokenError:
+                g.username = None
+
 
-@app.post('/signup')
+@api.post('/signup')
 def signup():
     """Handle user signup. Take inputted JSON user data and create new user in DB.
       Requires:
@@ -83,11 +154,13 @@ def signup():
         "user_image_url": file // optional
       }
 
-    Return JWT string. If errors, throw BadRequest Error.
+    Return JWT string. If errors, throw BadRequest Error. If the password
+    hashing pool is saturated, returns 429 (or 503 if hashing times out) with
+    a Retry-After header.
     """
 
     try:
-        User.signup(
+        user = User.signup(
             username=request.json["username"],
             password=request.json["password"],
             name=request.json["name"],
@@ -101,17 +174,20 @@ def signup():
         db.session.rollback()
         raise BadRequest("Username already in use. No user created.")
 
-    token = User.create_token(request.json["username"])
+    token = User.create_token(user)
     return jsonify(token)
 
 
-@app.post('/login')
+@api.post('/login')
 def login():
     """Handle user login. Take JSON email/username and password:
     {"username": "jules",
     "password": "password"}
     
-    Return JWT string if valid user. If invalid, throw Unauthorized Error."""
+    Return JWT string if valid user. If invalid, throw Unauthorized Error.
+
+    Password checks run on a bounded pool; if it is saturated, returns 429
+    (or 503 if the check times out) with a Retry-After header."""
 
     user = User.login(
         username=request.json["username"],
@@ -119,7 +195,9 @@ def login():
     )
 
     if user:
-        token = User.create_token(user.username)
+        # saves the password if login rehashed it at a new bcrypt cost
+        db.session.commit()
+        token = User.create_token(user)
         return jsonify(token)
     
     else:
@@ -128,7 +206,7 @@ def login():
 
 #################################################################### User Routes
 
-@app.get('/users')
+@api.get('/users')
 @require_user
 def get_users():
     """Get all users. Returns:
@@ -144,15 +222,35 @@ def get_users():
         }, ...
     ]
 
+    Paginated by username. Takes optional query params:
+    - limit: page size, defaults to 50
+    - after: cursor from the previous page's Link header
+    - stream: if "true", stream all users (after cursor) instead of a page
+    - fields: comma-separated list of user fields to return, e.g.
+      ?fields=username,name. Defaults to all.
+
+    If there is another page, its URL is in the Link header with rel="next".
+
     Must be logged in.
     """
 
-    users_instances = User.query.all()
-    users = [user_instance.serialize() for user_instance in users_instances]
+    fields = get_fields_arg(USER_FIELDS)
+    stmt = select(User).options(*fields_plan(User, fields))
+    serialize = serializer(UserSchema, only=fields)
+    limit, after_key = get_page_args()
+
+    if wants_stream():
+        return stream_response(
+            stmt, User.username, serialize, after_key=after_key)
+
+    users_instances, next_cursor = keyset_page(
+        stmt, User.username, limit, after_key)
+    with timed("serialize"):
+        users = [serialize(user_instance) for user_instance in users_instances]
 
-    return jsonify(users)
+    return page_response(users, next_cursor, limit)
 
-@app.get('/users/current')
+@api.get('/users/current')
 @require_user
 def get_user():
     """Get user. Returns:
@@ -166,13 +264,23 @@ def get_user():
         "user_image_url": "https://image.com"
         }
 
+    Takes optional query params:
+    - fields: comma-separated list of user fields to return, e.g.
+      ?fields=username,name. Defaults to all.
+    - include: "dogs" to include the user's dog ids (the default), or empty
+      (?include=) to leave them out.
+
     Must be logged in."""
 
-    user_instance = g.user
-    user = users_schema.dump(user_instance)
+    fields = get_fields_arg(USER_FIELDS)
+    includes = get_include_arg(("dogs",), default=("dogs",))
+
+    user_instance = g.load_user(*fields_plan(User, fields, includes))
+    with timed("serialize"):
+        user = serializer(UserSchema, only=fields + includes)(user_instance)
     return jsonify(user)
 
-@app.patch('/users/current')
+@api.patch('/users/current')
 @require_user
 def update_user_profile():
     """Update a user's information. Can take:
@@ -213,55 +321,83 @@ def update_user_profile():
         raise BadRequest
 
     updated_user_instance = User.query.get(user.username)
-    updated_user = users_schema.dump(updated_user_instance)
+    with timed("serialize"):
+        updated_user = serialize_user(updated_user_instance)
     return jsonify(updated_user)
 
-@app.put('/users/current')
+@api.put('/users/current')
 @require_user
-def update_password(username):
+def update_password():
     """Updates a user's password. Requires:
     {old_password, new_passwword}
-    
+
+    Tokens issued before the change stop working. Returns a new JWT string.
+
     Must be logged in as same user in params."""
    
     user = g.user
 
     try:
-        user.update_password
+        user.update_password(
+            request.json["old_password"],
+            request.json["new_password"],
+        )
         db.session.commit()
+        token_revocations.revoke(user.username, user.token_version)
 
     except Unauthorized:
         db.session.rollback()
         raise Unauthorized("Password incorrect")
-    
+
+    except HTTPException:
+        db.session.rollback()
+        raise
+
     except:
         db.session.rollback()
         raise BadRequest
 
+    token = User.create_token(user)
+    return jsonify(token)
+
    
-@app.delete('/users/current')
+@api.delete('/users/current')
 @require_user
-def delete_user(username):
-    """Delete a user's account. Must be logged in."""
+def delete_user():
+    """Delete a user's account. Returns "username deleted".
 
-    user = g.user
-    
-    ## TODO: need to delete dogs, commands, command notes, events
+    The user is removed in a single statement; the database cascades the delete
+    to their dogs and the dogs' commands, command notes and events.
 
-    # return f"{username} deleted"
-    return "this method is coming soon"
+    Must be logged in."""
+
+    # loading g.user checks the token against the stored token_version
+    username = g.user.username
+
+    try:
+        db.session.execute(delete(User).where(User.username == username))
+        db.session.commit()
+        response_cache.invalidate(PUBLIC_DOGS)
+        search_index.remove_user(username)
+
+    except:
+        db.session.rollback()
+        raise BadRequest
+
+    return f"{username} deleted"
 
 
 ##################################################################### Dog Routes
 
-@app.get('/dogs')
+@api.get('/dogs')
 @require_user
+@cached(PUBLIC_DOGS, skip=wants_stream)
 def get_dogs():
     """Get all dogs in databse not marked private. Returns:
     [
         {
             "bio": "good dog",
-            "birth_date": "Mon, 03 Aug 2020 00:00:00 GMT",
+            "birth_date": "2020-08-03T00:00:00",
             "breed": "Border Collie",
             "id": 1,
             "image_url": "https://paradepets.com/.image/c_limit%2Ccs_srgb%2Cq_auto:good%2Cw_760/MTkxMzY1Nzg4MTM2NzExNzc4/teacup-dogs-jpg.webp",
@@ -272,21 +408,47 @@ def get_dogs():
         },...
     ]
     
+    Paginated by id. Takes optional query params:
+    - limit: page size, defaults to 50
+    - after: cursor from the previous page's Link header
+    - stream: if "true", stream all dogs (after cursor) instead of a page
+    - fields: comma-separated list of dog fields to return, e.g.
+      ?fields=id,name,image_url. Defaults to all.
+
+    If there is another page, its URL is in the Link header with rel="next".
+
+    Pages are the same for every user, so they are served from the shared
+    response cache (X-Cache: HIT/MISS) until a dog is added, changed or
+    deleted. Streamed responses are not cached.
+
     Must be logged in."""
 
-    dogs_instances = Dog.query.filter_by(private=False).all()
-    dogs = [dog_instance.serialize() for dog_instance in dogs_instances]
+    fields = get_fields_arg(DOG_FIELDS)
+    stmt = (
+        select(Dog)
+        .options(*fields_plan(Dog, fields))
+        .where(Dog.private == False)
+    )
+    serialize = serializer(DogSchema, only=fields)
+    limit, after_key = get_page_args()
 
-    return jsonify(dogs)
+    if wants_stream():
+        return stream_response(stmt, Dog.id, serialize, after_key=after_key)
+
+    dogs_instances, next_cursor = keyset_page(stmt, Dog.id, limit, after_key)
+    with timed("serialize"):
+        dogs = [serialize(dog_instance) for dog_instance in dogs_instances]
 
-@app.get('/dogs/current')
+    return page_response(dogs, next_cursor, limit)
+
+@api.get('/dogs/current')
 @require_user
 def get_users_dogs():
     """Get all dogs for current user. Returns:
     [
         {
             "bio": "good dog",
-            "birth_date": "Mon, 03 Aug 2020 00:00:00 GMT",
+            "birth_date": "2020-08-03T00:00:00",
             "breed": "Border Collie",
             "id": 1,
             "image_url": "https://paradepets.com/.image/c_limit%2Ccs_srgb%2Cq_auto:good%2Cw_760/MTkxMzY1Nzg4MTM2NzExNzc4/teacup-dogs-jpg.webp",
@@ -296,18 +458,34 @@ def get_users_dogs():
             "size": "large"
         },...
     ]
+
+    Takes optional query params:
+    - fields: comma-separated list of dog fields to return, e.g.
+      ?fields=id,name,image_url. Defaults to all.
+    - include: "commands" to include each dog's commands, as in a dog's
+      details. Defaults to none.
     
     Must be logged in."""
 
-    username = g.user.username
+    username = g.username
+    fields = get_fields_arg(DOG_FIELDS)
+    includes = get_include_arg(("commands",))
     
-    dogs_instances = Dog.query.filter_by(owner_username=username).all()
-    dogs = [dog_instance.serialize() for dog_instance in dogs_instances]
+    dogs_instances = (
+        Dog.query
+        .options(*fields_plan(Dog, fields, includes))
+        .filter_by(owner_username=username)
+        .all()
+    )
+    serialize = serializer(DogSchema, only=fields + includes)
+    with timed("serialize"):
+        dogs = [serialize(dog_instance) for dog_instance in dogs_instances]
 
     return jsonify(dogs)
 
-@app.get('/dogs/current/<int:dog_id>')
+@api.get('/dogs/current/<int:dog_id>')
 @require_user
+@conditional(owned_dog_version)
 def get_users_dog(dog_id):
     """Get dog. Returns:
     {
@@ -324,20 +502,27 @@ def get_users_dog(dog_id):
         "size": "large"
     }
 
+    Takes optional query params:
+    - fields: comma-separated list of dog fields to return, e.g.
+      ?fields=id,name. Defaults to all.
+    - include: "commands" to include the dog's commands (the default), or
+      empty (?include=) to leave them out.
+
+    Sends ETag and Last-Modified. Returns 304 with no body if If-None-Match
+    or If-Modified-Since show the dog and its commands haven't changed.
+
     Must be logged in. Dog has to belong to current user."""
-   
-    user = g.user
-    dog_instance = Dog.query.get(dog_id)
 
-    # dog is not one of logged in user's dogs
-    if dog not in user.dogs:
-        raise Unauthorized    
-    
-    dog = dogs_schema.dump(dog_instance)
+    fields = get_fields_arg(DOG_FIELDS)
+    includes = get_include_arg(("commands",), default=("commands",))
+   
+    dog_instance = get_owned_dog(dog_id, *fields_plan(Dog, fields, includes))
+    with timed("serialize"):
+        dog = serializer(DogSchema, only=fields + includes)(dog_instance)
 
     return jsonify(dog)
 
-@app.post('/dogs/current')
+@api.post('/dogs/current')
 @require_user
 def add_dog():
     """Add dog. Requires:
@@ -368,12 +553,12 @@ def add_dog():
     
     Must be logged in."""
 
-    username = g.user.username
+    username = g.username
 
     try:
         new_dog = Dog(
             name=request.json["name"],
-            birth_date=request.json.get("birth_date"),
+            birth_date=parse_datetime_field(request.json.get("birth_date")),
             breed=request.json["breed"],
             size=request.json["size"],
             bio=request.json.get("bio"),
@@ -383,8 +568,15 @@ def add_dog():
         )
 
         db.session.add(new_dog)
+        db.session.flush()
+        dog_id = new_dog.id
         db.session.commit()
-        dog = dogs_schema.dump(new_dog)
+        response_cache.invalidate(PUBLIC_DOGS)
+        search_index.reindex_dogs([dog_id])
+
+        dog_instance = get_owned_dog(dog_id, *DOG_DETAIL_PLAN)
+        with timed("serialize"):
+            dog = serialize_dog(dog_instance)
         return jsonify(dog)
 
     # TODO: I'm not sure this is fully debugged. The error has gone away, but
@@ -392,10 +584,10 @@ def add_dog():
     except Exception as e:
         db.session.rollback()
         # raise BadRequest("Dog not created.")
-        print("\033[96m"+ 'PRINT >>>>> ' + "\033[00m", e)
+        logger.warning("Dog not created: %s", e)
         raise BadRequest
     
-@app.patch('/dog/current/<int:dog_id>')
+@api.patch('/dog/current/<int:dog_id>')
 @require_user
 def update_dog(dog_id):
     """Update dog. Can take:
@@ -424,21 +616,18 @@ def update_dog(dog_id):
     
     Must be logged in. Dog has to belong to current user."""
 
-    user = g.user
-    dog = Dog.query.get(dog_id)
-
-    # dog is not one of logged in user's dogs
-    if dog not in user.dogs:
-        raise Unauthorized
+    dog = get_owned_dog(dog_id)
     
     try:
-        dog.name=request.json.get("name"),
-        dog.birth_date=request.json.get("birth_date"),
-        dog.breed=request.json.get("breed"),
-        dog.size=request.json.get("size"),
-        dog.bio=request.json.get("bio"),
-        dog.image_url=request.json.get("image_url"),
-        dog.private=request.json.get("private") == "True",
+        dog.name = request.json.get("name", dog.name)
+        if "birth_date" in request.json:
+            dog.birth_date = parse_datetime_field(request.json["birth_date"])
+        dog.breed = request.json.get("breed", dog.breed)
+        dog.size = request.json.get("size", dog.size)
+        dog.bio = request.json.get("bio", dog.bio)
+        dog.image_url = request.json.get("image_url", dog.image_url)
+        if "private" in request.json:
+            dog.private = str(request.json["private"]).lower() == "true"
        
         db.session.commit()
     
@@ -446,49 +635,48 @@ def update_dog(dog_id):
         db.session.rollback()
         raise BadRequest
 
-    updated_dog_instance = Dog.query.get(dog_id)
-    updated_dog = dogs_schema.dump(updated_dog_instance)
+    response_cache.invalidate(PUBLIC_DOGS)
+    search_index.reindex_dogs([dog_id])
+
+    updated_dog_instance = get_owned_dog(dog_id, *DOG_DETAIL_PLAN)
+    with timed("serialize"):
+        updated_dog = serialize_dog(updated_dog_instance)
     return jsonify(updated_dog)
 
-@app.delete('/dogs/current/<int:dog_id>')
+@api.delete('/dogs/current/<int:dog_id>')
 @require_user
 def delete_dog(dog_id):
     """Remove a dog. Returns "dog_name deleted".
-    Must be logged in. Dog has to belong to current user."""
-
-    user = g.user
-    dog = Dog.query.get(dog_id)
-
-    # dog is not one of logged in user's dogs
-    if dog not in user.dogs:
-        raise Unauthorized
-    
-    commands = dog.commands
 
-    try:
-        # delete command notes
-        [db.session.delete(command.notes) for command in commands]
+    The dog is removed in a single statement; the database cascades the delete
+    to its commands, command notes and events.
 
-        # delete commands
-        Command.query.filter(Command.dog_id==dog_id).delete()
+    Must be logged in. Dog has to belong to current user."""
 
-        # delete events
-        Event.query.filter(Event.dog_id==dog_id).delete()
+    # locked first, so a command added concurrently is either in the
+    # summary rows remove_dog reads or fails on the deleted dog
+    lock_owned_dog(dog_id)
+    summaries.remove_dog(dog_id)
+    dog_name = delete_owned_dog(dog_id)
 
-        # delete dog
-        db.session.delete(dog)
+    try:
         db.session.commit()
 
-        return f"{dog.name} deleted"
-    
     except:
+        db.session.rollback()
         raise BadRequest
 
+    response_cache.invalidate(PUBLIC_DOGS)
+    search_index.reindex_dogs([dog_id])
+
+    return f"{dog_name} deleted"
+
     
 ############################################################# Dog Command Routes
 
-@app.get('/dogs/current/<int:dog_id>/commands')
+@api.get('/dogs/current/<int:dog_id>/commands')
 @require_user
+@conditional(owned_dog_version)
 def get_commands(dog_id):
     """Get all of a dog's commands. Returns:
     [
@@ -504,20 +692,30 @@ def get_commands(dog_id):
             "type": "obedience",
             "voice_command": "sit"
         }, ...
-    ]    
+    ]
+
+    Takes optional query params:
+    - fields: comma-separated list of command fields to return, e.g.
+      ?fields=id,name,proficiency. Defaults to all.
+    - include: "notes" to include each command's notes (the default), or
+      empty (?include=) to leave them out.
+
+    Sends ETag and Last-Modified. Returns 304 with no body if If-None-Match
+    or If-Modified-Since show the dog's commands haven't changed.
+
     Must be logged in and dog must belong to current user."""
 
-    user = g.user
-    dog = Dog.query.get(dog_id)
+    fields = get_fields_arg(COMMAND_FIELDS)
+    includes = get_include_arg(("notes",), default=("notes",))
 
-    # dog is not one of logged in user's dogs
-    if dog not in user.dogs:
-        raise Unauthorized
-    
-    commands = [commands_schema.dump(command) for command in dog.commands]
+    dog = get_owned_dog(dog_id, *command_list_plan(fields, includes))
+
+    serialize = serializer(CommandSchema, only=fields + includes)
+    with timed("serialize"):
+        commands = [serialize(command) for command in dog.commands]
     return jsonify(commands)
 
-@app.get('/dogs/current/<int:dog_id>/commands/<int:command_id>')
+@api.get('/dogs/current/<int:dog_id>/commands/<int:command_id>')
 @require_user
 def get_command_details(dog_id, command_id):
     """Get a dog's command details. Returns:
@@ -533,25 +731,24 @@ def get_command_details(dog_id, command_id):
         "type": "obedience",
         "voice_command": "sit"
     }
-    Must be logged in and dog must belong to current user."""
 
-    user = g.user
-    dog = Dog.query.get(dog_id)
+    Takes optional query params fields and include, as for a dog's command
+    list.
 
-    # dog is not one of logged in user's dogs
-    if dog not in user.dogs:
-        raise Unauthorized
-    
-    command_instance = Command.query.get(command_id)
+    Must be logged in and dog must belong to current user."""
 
-    # command is not one of dog's commands
-    if command_instance not in dog.commands:
-        abort(404)
+    fields = get_fields_arg(COMMAND_FIELDS)
+    includes = get_include_arg(("notes",), default=("notes",))
 
-    command = commands_schema.dump(command_instance)
+    command_instance = get_owned_command(
+        dog_id, command_id, *fields_plan(Command, fields, includes))
+
+    with timed("serialize"):
+        command = serializer(CommandSchema, only=fields + includes)(
+            command_instance)
     return jsonify(command)
 
-@app.post('/dogs/current/<int:dog_id>/commands')
+@api.post('/dogs/current/<int:dog_id>/commands')
 @require_user
 def add_command(dog_id):
     """Add command. Requires:
@@ -583,12 +780,7 @@ def add_command(dog_id):
     
     Must be logged in and dog must belong to current user."""
     
-    user = g.user
-    dog = Dog.query.get(dog_id)
-
-    # dog is not one of logged in user's dogs
-    if dog not in user.dogs:
-        raise Unauthorized
+    dog = get_owned_dog(dog_id)
     
     try:
         new_command = Command(
@@ -597,22 +789,33 @@ def add_command(dog_id):
             voice_command=request.json.get("voice_command"),
             visual_command=request.json.get("visual_command"),
             command_video_url=request.json.get("command_video_url"),
-            proficiency=request.json.get("proficiency"),
+            proficiency=parse_proficiency_field(
+                request.json.get("proficiency")),
             performance_video_url=request.json.get("performance_video_url"),
             type=request.json.get("type"),
             dog_id=dog.id,
         )
 
         db.session.add(new_command)
+        db.session.flush()
+        command_id = new_command.id
+        summaries.record(
+            dog_id, added=[(new_command.type, new_command.proficiency)])
+        history.record(dog_id, [(command_id, new_command.proficiency)])
         db.session.commit()
-        command = commands_schema.dump(new_command)
+        search_index.reindex_commands(dog_id, [command_id])
+
+        command_instance = get_owned_command(
+            dog_id, command_id, *COMMAND_DETAIL_PLAN)
+        with timed("serialize"):
+            command = serialize_command(command_instance)
         return jsonify(command)
     
     except:
         db.session.rollback()
         raise BadRequest
 
-@app.patch('/dogs/current/<int:dog_id>/commands/<int:command_id>')
+@api.patch('/dogs/current/<int:dog_id>/commands/<int:command_id>')
 @require_user
 def update_command(dog_id, command_id):
     """Add command. Can take:
@@ -643,18 +846,10 @@ def update_command(dog_id, command_id):
     }    
     Must be logged in and dog must belong to current user."""
 
-    user = g.user
-    dog = Dog.query.get(dog_id)
-
-    # dog is not one of logged in user's dogs
-    if dog not in user.dogs:
-        raise Unauthorized
-
-    command = Command.query.get(command_id)
-
-    # command is not one of dog's commands
-    if command not in dog.commands:
-        abort(404)
+    # locked, so concurrent updates don't both take the same old key out of
+    # the summaries
+    command = lock_owned_command(dog_id, command_id)
+    old_key = (command.type, command.proficiency)
 
     try:
         command.name=request.json.get("name", command.name)
@@ -662,55 +857,746 @@ def update_command(dog_id, command_id):
         command.voice_command=request.json.get("voice_command", command.voice_command)
         command.visual_command=request.json.get("visual_command", command.visual_command)
         command.command_video_url=request.json.get("command_video_url", command.command_video_url)
-        command.proficiency=request.json.get("proficiency", command.proficiency)
+        if "proficiency" in request.json:
+            command.proficiency = parse_proficiency_field(
+                request.json["proficiency"])
         command.performance_viddeo_url=request.json.get("performance_video_url", command.performance_video_url)
         command.type=request.json.get("type", command.type)
 
         command.update_date()
+        summaries.record(
+            dog_id, removed=[old_key],
+            added=[(command.type, command.proficiency)])
+        if command.proficiency != old_key[1]:
+            history.record(dog_id, [(command_id, command.proficiency)])
 
         db.session.commit()
 
     except:
         db.session.rollback()
         raise BadRequest
+
+    search_index.reindex_commands(dog_id, [command_id])
     
-    updated_command_instance = Command.query.get(command_id)
-    command = commands_schema.dump(updated_command_instance)
+    updated_command_instance = get_owned_command(
+        dog_id, command_id, *COMMAND_DETAIL_PLAN)
+    with timed("serialize"):
+        command = serialize_command(updated_command_instance)
     return jsonify(command)
 
-@app.delete('/dogs/current/<int:dog_id>/commands/<int:command_id>')
+@api.post('/dogs/current/<int:dog_id>/commands/batch')
 @require_user
-def delete_command(dog_id, command_id):
-    """Remove a command. Returns "command_name deleted".
-    Must be logged in. Dog has to belong to current user."""
+def batch_commands(dog_id):
+    """Create and update many of a dog's commands at once. Requires:
+    {
+        "commands": [
+            {"name": "sit", "type": "obedience", "proficiency": 2},
+            {"id": 5, "proficiency": 4},
+            ...
+        ]
+    }
 
-    user = g.user
-    dog = Dog.query.get(dog_id)
+    Items without "id" create a command and need at least name and type.
+    Items with "id" update only the fields they give. Fields are as in
+    add_command.
 
-    # dog is not one of logged in user's dogs
-    if dog not in user.dogs:
-        raise Unauthorized
+    Returns a result for each item, in order:
+    [
+        {"status": "created", "command": {"id": 9, "name": "sit", ...}},
+        {"status": "updated", "command": {"id": 5, "proficiency": 4, ...}},
+        ...
+    ]
 
-    command = Command.query.get(command_id)
+    All items are validated before any are applied. If any are invalid,
+    nothing is changed and returns 400 with the problems per item:
+    [
+        {"status": "valid"},
+        {"status": "invalid", "errors": {"id": "Not one of this dog's commands."}},
+        ...
+    ]
+
+    Everything is applied in one transaction. Takes up to 200 items.
+
+    Must be logged in and dog must belong to current user."""
+
+    items = request.json.get("commands")
+
+    if not isinstance(items, list) or not items:
+        raise BadRequest("commands must be a list of commands.")
 
-    # command is not one of dog's commands
-    if command not in dog.commands:
-        abort(404)
+    if len(items) > MAX_BATCH_SIZE:
+        raise BadRequest(f"At most {MAX_BATCH_SIZE} commands per request.")
+
+    errors = validate_batch(dog_id, items)
+
+    if any(errors):
+        results = [
+            {"status": "invalid", "errors": item_errors}
+            if item_errors else {"status": "valid"}
+            for item_errors in errors
+        ]
+        return jsonify(results), 400
 
     try:
-        # delete command notes
-        [db.session.delete(note) for note in command.notes]
+        commands_instances = apply_batch(dog_id, items)
+        command_ids = [command.id for command in commands_instances]
+
+        # serialize before commit expires the rows just written
+        with timed("serialize"):
+            results = [
+                {"status": "updated", "command": serialize_command(command)}
+                if "id" in item else
+                {"status": "created",
+                 "command": {**serialize_new_command(command), "notes": []}}
+                for item, command in zip(items, commands_instances)
+            ]
+
+        db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+        logger.warning("Command batch not applied: %s", e)
+        raise BadRequest
+
+    search_index.reindex_commands(dog_id, command_ids)
+
+    return jsonify(results)
+
+@api.post('/dogs/current/<int:dog_id>/commands/templates')
+@require_user
+def add_commands_from_templates(dog_id):
+    """Add a command to a dog for each of the chosen command templates.
+    Requires:
+    {
+        "template_ids": [1, 2, 3]
+    }
+
+    Returns the new commands, with fields copied from their templates:
+    [
+        {
+            "command_video_url": "",
+            "date_introduced": "2023-10-12T02:54:29.134549",
+            "date_updated": "2023-10-12T02:54:29.134549",
+            "description": "standard sit",
+            "id": 5,
+            "name": "sit",
+            "notes": [],
+            "proficiency": 1,
+            "type": "obedience",
+            "voice_command": "sit"
+        }, ...
+    ]
+
+    All commands are added in a single statement. If any template id doesn't
+    exist or is given more than once, none are added and returns 400.
+
+    Must be logged in and dog must belong to current user."""
 
-        # delete command
-        db.session.delete(command)
+    template_ids = request.json.get("template_ids")
+
+    if (not isinstance(template_ids, list) or not template_ids
+            or not all(isinstance(id, int) for id in template_ids)):
+        raise BadRequest("template_ids must be a list of template ids.")
+
+    if len(template_ids) > MAX_TEMPLATES_PER_REQUEST:
+        raise BadRequest(
+            f"At most {MAX_TEMPLATES_PER_REQUEST} templates per request.")
+
+    if len(set(template_ids)) != len(template_ids):
+        raise BadRequest("template_ids must not repeat a template id.")
+
+    try:
+        commands_instances = add_owned_commands_from_templates(
+            dog_id, template_ids)
+        summaries.record(dog_id, added=[
+            (command.type, command.proficiency)
+            for command in commands_instances])
+        history.record(dog_id, [
+            (command.id, command.proficiency)
+            for command in commands_instances])
+
+        # serialize before commit expires the rows RETURNING just loaded
+        with timed("serialize"):
+            commands = [
+                {**serialize_new_command(command), "notes": []}
+                for command in commands_instances
+            ]
 
         db.session.commit()
 
-        return f"{command.name} deleted"
-    
+    except HTTPException:
+        db.session.rollback()
+        raise
+
     except Exception as e:
-        print("\033[96m"+ 'PRINT >>>>> ' + "\033[00m", e)
+        db.session.rollback()
+        logger.warning("Commands not added from templates: %s", e)
         raise BadRequest
 
+    search_index.reindex_commands(
+        dog_id, [command["id"] for command in commands])
+
+    return jsonify(commands)
+
+@api.delete('/dogs/current/<int:dog_id>/commands/<int:command_id>')
+@require_user
+def delete_command(dog_id, command_id):
+    """Remove a command and its notes in a single statement. Returns
+    "command_name deleted".
+    Must be logged in. Dog has to belong to current user."""
+
+    deleted = delete_owned_command(dog_id, command_id)
+
+    try:
+        summaries.record(
+            dog_id, removed=[(deleted.type, deleted.proficiency)])
+        # a delete leaves no newer command date_updated to version by
+        Dog.touch(dog_id)
+        db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+        logger.warning("Command %s not deleted: %s", command_id, e)
+        raise BadRequest
+
+    search_index.reindex_commands(dog_id, [command_id])
+
+    return f"{deleted.name} deleted"
+
+
+
+############################################################ Command Note Routes
+
+@api.post('/dogs/current/<int:dog_id>/commands/<int:command_id>/notes')
+@require_user
+def add_command_note(dog_id, command_id):
+    """Add a training note to a command. Requires:
+    {
+        "note": "held sit for 10 seconds with distractions"
+    }
+
+    The note is queued and written with other notes in the background, so
+    returns 202 with the queued note:
+    {
+        "command_id": 2,
+        "note": "held sit for 10 seconds with distractions",
+        "date": "2023-10-12T03:19:12.587642"
+    }
+
+    It shows up in the command's notes within NOTE_FLUSH_INTERVAL seconds.
+    If too many notes are waiting to be written, returns 503 with a
+    Retry-After header.
+
+    Must be logged in and dog must belong to current user."""
+
+    note = request.json.get("note")
+
+    if not isinstance(note, str) or not note.strip():
+        raise BadRequest("note must be a non-empty string.")
+
+    get_owned_command(dog_id, command_id)
+
+    row = note_buffer.add(command_id, note)
+    return jsonify({**row, "date": row["date"].isoformat()}), 202
+
+@api.get('/dogs/current/<int:dog_id>/commands/<int:command_id>/notes')
+@require_user
+def get_command_notes(dog_id, command_id):
+    """Get a command's notes, newest first. Returns:
+    [
+        {
+            "date": "2023-10-12T03:19:12.587642",
+            "id": 7,
+            "note": "held sit for 10 seconds with distractions"
+        }, ...
+    ]
+
+    Paginated by date. Takes optional query params:
+    - limit: page size, defaults to 50
+    - after: cursor from the previous page's Link header
+
+    If there is another page, its URL is in the Link header with rel="next".
+
+    Must be logged in and dog must belong to current user."""
+
+    limit, after_key = get_page_args()
+
+    get_owned_command(dog_id, command_id)
+
+    notes_instances, next_cursor = newest_first_page(
+        select(CommandNote).where(CommandNote.command_id == command_id),
+        (CommandNote.date, CommandNote.id),
+        limit,
+        after_key,
+    )
+
+    with timed("serialize"):
+        notes = [serialize_command_note(note) for note in notes_instances]
+
+    return page_response(notes, next_cursor, limit)
+
+
+################################################################ Calendar Routes
+
+@api.get('/dogs/current/<int:dog_id>/events')
+@require_user
+def get_dog_calendar(dog_id):
+    """Get a dog's events that overlap a time window. Requires query params:
+    - from: start of window, ISO 8601 (inclusive)
+    - to: end of window, ISO 8601 (exclusive)
+
+    Takes optional query param fields, a comma-separated list of event
+    fields to return, e.g. ?fields=id,title,start_time. Defaults to all.
+
+    Returns events ordered by start time:
+    [
+        {
+            "dog_id": 1,
+            "end_time": "2023-10-14T10:00:00",
+            "id": 3,
+            "location": "Denver Dog Park",
+            "start_time": "2023-10-14T09:00:00",
+            "title": "Puppy class",
+            "type": "class"
+        }, ...
+    ]
+
+    Must be logged in and dog must belong to current user."""
+
+    start, end = get_window_args()
+    fields = get_fields_arg(EventSchema.Meta.fields)
+
+    events_instances = get_dog_events(
+        dog_id, start, end, *fields_plan(Event, fields))
+
+    serialize = serializer(EventSchema, only=fields)
+    with timed("serialize"):
+        events = [serialize(event) for event in events_instances]
+
+    return jsonify(events)
+
+@api.get('/users/current/events')
+@require_user
+def get_user_calendar():
+    """Get events of all of the current user's dogs that overlap a time
+    window, in a single query. Takes the same query params and returns the
+    same fields as a dog's calendar, ordered by start time.
+
+    Must be logged in."""
+
+    start, end = get_window_args()
+    fields = get_fields_arg(EventSchema.Meta.fields)
+
+    events_instances = get_user_events(start, end, *fields_plan(Event, fields))
+
+    serialize = serializer(EventSchema, only=fields)
+    with timed("serialize"):
+        events = [serialize(event) for event in events_instances]
+
+    return jsonify(events)
+
+@api.get('/users/current/feeds')
+@require_user
+def get_calendar_feeds():
+    """Get iCalendar feed URLs for the current user's events and each of
+    their dogs' events, to subscribe to from a calendar app:
+    {
+        "events": "https://.../feeds/users/jules/events.ics?token=...",
+        "dogs": [
+            {
+                "id": 1,
+                "name": "Bear",
+                "events": "https://.../feeds/dogs/1/events.ics?token=..."
+            }, ...
+        ]
+    }
+
+    The URLs carry a token that can only read feeds. It stays valid until
+    the user's password changes.
+
+    Must be logged in."""
+
+    token = User.create_feed_token(g.user)
+
+    dogs = db.session.execute(
+        select(Dog.id, Dog.name)
+        .where(Dog.owner_username == g.username)
+        .order_by(Dog.id)
+    ).all()
+
+    return jsonify(
+        events=url_for(
+            "api.get_user_feed", username=g.username, token=token,
+            _external=True),
+        dogs=[
+            {
+                "id": dog_id,
+                "name": name,
+                "events": url_for(
+                    "api.get_dog_feed", dog_id=dog_id, token=token,
+                    _external=True),
+            }
+            for dog_id, name in dogs
+        ],
+    )
+
+@api.get('/feeds/users/<username>/events.ics')
+@conditional(user_feed_version)
+def get_user_feed(username):
+    """Get iCalendar feed of the events of all of username's dogs. Requires
+    query param token, a feed token from /users/current/feeds.
+
+    The feed is streamed. Polls with If-None-Match get 304 until an event or
+    dog changes."""
+
+    return feed_response(user_feed_stmt(username), f"{username}'s dogs")
+
+@api.get('/feeds/dogs/<int:dog_id>/events.ics')
+@conditional(dog_feed_version)
+def get_dog_feed(dog_id):
+    """Get iCalendar feed of dog's events. Requires query param token, a feed
+    token from /users/current/feeds of the dog's owner.
+
+    The feed is streamed. Polls with If-None-Match get 304 until an event or
+    the dog changes."""
+
+    name = db.session.scalar(select(Dog.name).where(Dog.id == dog_id))
+
+    return feed_response(dog_feed_stmt(dog_id), f"{name}'s events")
+
+
+######################################################## Training Summary Routes
+
+@api.get('/dogs/current/<int:dog_id>/summary')
+@require_user
+def get_dog_summary(dog_id):
+    """Get a summary of a dog's training. Returns:
+    {
+        "by_type": {"obedience": 10, "trick": 2},
+        "commands": 12,
+        "last_updated": "2023-10-12T03:19:12.587643",
+        "mean_proficiency": 2.08,
+        "proficiency": {"1": 3, "2": 5, "3": 4}
+    }
+
+    proficiency counts commands at each proficiency level. mean_proficiency
+    and last_updated are null if the dog has never had commands. Costs the
+    same however many commands the dog has.
+
+    Must be logged in and dog must belong to current user."""
+
+    rows = summaries.dog_summary_rows(dog_id, g.username)
+
+    if not rows:
+        # only look up the dog to tell 401 from a dog without commands
+        get_owned_dog(dog_id)
+
+    return jsonify(summaries.summarize(rows))
+
+@api.get('/users/current/summary')
+@require_user
+def get_user_summary():
+    """Get a summary of the training of all of the current user's dogs, with
+    the same fields as a dog's summary.
+
+    Must be logged in."""
+
+    return jsonify(summaries.summarize(summaries.user_summary_rows(g.username)))
+
+
+##################################################### Proficiency History Routes
+
+@api.get('/dogs/current/<int:dog_id>/history')
+@require_user
+def get_dog_history(dog_id):
+    """Get a dog's proficiency over time, one point per day or week. Takes
+    query params:
+    - from: first day, ISO 8601 date
+    - to: day after the last, ISO 8601 date (optional, defaults to tomorrow)
+    - bucket: "day" or "week" (optional, defaults to "week")
+
+    Returns:
+    {
+        "bucket": "week",
+        "from": "2023-10-02",
+        "to": "2023-10-16",
+        "series": [
+            {
+                "changes": 5,
+                "commands": 12,
+                "date": "2023-10-02",
+                "mean_proficiency": 2.08
+            }, ...
+        ]
+    }
+
+    Each point is as of the end of its bucket: how many of the dog's commands
+    had a proficiency by then and their mean proficiency. changes counts
+    proficiency changes in the bucket. from and to are widened to whole
+    buckets. Reads only the history inside the window.
+
+    Must be logged in and dog must belong to current user."""
+
+    start, end, bucket = history.get_series_args()
+    series = history.get_dog_series(dog_id, start, end, bucket)
+
+    return jsonify({
+        "bucket": bucket,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "series": series,
+    })
+
+@api.get('/dogs/current/<int:dog_id>/commands/<int:command_id>/history')
+@require_user
+def get_command_history(dog_id, command_id):
+    """Get a command's proficiency over time, one point per day or week.
+    Takes the same query params as a dog's history. Returns:
+    {
+        "bucket": "week",
+        "from": "2023-10-02",
+        "to": "2023-10-16",
+        "series": [
+            {
+                "changes": 2,
+                "date": "2023-10-02",
+                "max_proficiency": 3,
+                "min_proficiency": 2,
+                "proficiency": 3
+            }, ...
+        ]
+    }
+
+    proficiency is the command's proficiency at the end of the bucket;
+    min_proficiency and max_proficiency are the lowest and highest it was
+    during it. They are null before the command's history starts.
+
+    Must be logged in and dog must belong to current user."""
+
+    start, end, bucket = history.get_series_args()
+    series = history.get_command_series(
+        dog_id, command_id, start, end, bucket)
+
+    return jsonify({
+        "bucket": bucket,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "series": series,
+    })
+
+
+################################################################## Search Routes
+
+@api.get('/search/dogs')
+@require_user
+def search_dogs():
+    """Search public dogs and the current user's dogs by name, breed and bio.
+    Requires query param q, e.g. ?q=border coll. Every word must match the
+    start of a word in the dog. Returns best matches first:
+    [
+        {
+            "bio": "good dog",
+            "birth_date": "2020-08-03T00:00:00",
+            "breed": "Border Collie",
+            "id": 1,
+            "image_url": "https://paradepets.com/.image/c_limit%2Ccs_srgb%2Cq_auto:good%2Cw_760/MTkxMzY1Nzg4MTM2NzExNzc4/teacup-dogs-jpg.webp",
+            "name": "Petey",
+            "owner_username": "jules",
+            "private": false,
+            "size": "large"
+        },...
+    ]
+
+    Paginated; takes optional query params limit and after like /dogs. If
+    there is another page, its URL is in the Link header with rel="next".
+
+    Must be logged in."""
+
+    terms, limit, offset = get_search_args()
+
+    dog_ids = search_index.dog_ids(terms, g.username, limit + 1, offset)
+    dogs_instances, next_cursor = load_results(
+        Dog, dog_ids, limit, offset,
+        where=[or_(Dog.private == False, Dog.owner_username == g.username)])
+
+    with timed("serialize"):
+        dogs = [serialize_dog_summary(dog_instance) for dog_instance in dogs_instances]
+
+    return page_response(dogs, next_cursor, limit)
+
+@api.get('/dogs/current/<int:dog_id>/commands/search')
+@require_user
+def search_commands(dog_id):
+    """Search a dog's commands by name and description. Requires query param
+    q, e.g. ?q=stay. Every word must match the start of a word in the
+    command. Returns best matches first:
+    [
+        {
+            "command_video_url": "",
+            "date_introduced": "2023-10-12T03:19:12.587642",
+            "date_updated": "2023-10-12T03:19:12.587643",
+            "description": "stay until released",
+            "id": 2,
+            "name": "stay",
+            "notes": [],
+            "proficiency": 3,
+            "type": "obedience",
+            "voice_command": "stay"
+        }, ...
+    ]
+
+    Paginated; takes optional query params limit and after like /dogs.
+
+    Must be logged in and dog must belong to current user."""
+
+    terms, limit, offset = get_search_args()
+
+    command_ids = search_index.command_ids(
+        terms, dog_id, g.username, limit + 1, offset)
+
+    if not command_ids:
+        # only look up the dog to tell 401 from no matches
+        get_owned_dog(dog_id)
+
+    commands_instances, next_cursor = load_results(
+        Command, command_ids, limit, offset, *COMMAND_DETAIL_PLAN,
+        where=[Command.dog_id == dog_id,
+               Command.dog.has(Dog.owner_username == g.username)])
+
+    with timed("serialize"):
+        commands = [serialize_command(command) for command in commands_instances]
+
+    return page_response(commands, next_cursor, limit)
+
+
+######################################################## Command Template Routes
+
+@api.get('/command-templates')
+@require_user
+@cached(COMMAND_TEMPLATES)
+def get_command_templates():
+    """Get the catalog of command templates. Returns:
+    [
+        {
+            "command_video_url": "",
+            "description": "standard sit",
+            "id": 1,
+            "name": "sit",
+            "performance_video_url": "",
+            "proficiency": 1,
+            "type": "obedience",
+            "visual_command": "raise pinched fingers to lips",
+            "voice_command": "sit"
+        }, ...
+    ]
+
+    Ordered by type, then name. The catalog is the same for every user and
+    is served from the shared response cache (X-Cache: HIT/MISS).
+
+    Must be logged in."""
+
+    templates_instances = db.session.scalars(
+        select(CommandTemplate)
+        .order_by(CommandTemplate.type, CommandTemplate.name)
+    ).all()
+
+    with timed("serialize"):
+        templates = [
+            serialize_command_template(template)
+            for template in templates_instances
+        ]
+    return jsonify(templates)
+
+
+################################################################ Metrics Routes
+
+@api.get('/metrics/db-pool')
+@require_metrics_token
+def get_db_pool_metrics():
+    """Get database connection pool stats for this worker. Returns:
+    {
+        "checkouts": 1042,
+        "overflow_checkouts": 12,
+        "peak_overflow": 3,
+        "timeouts": 0,
+        "wait_ms_total": 95.1,
+        "wait_ms_avg": 0.09,
+        "wait_ms_max": 41.7,
+        "pool_size": 5,
+        "checked_out": 2,
+        "overflow": 0
+    }
+
+    Requires the operator token, see require_metrics_token."""
+
+    return jsonify(pool_metrics.snapshot(db.engine.pool))
+
+
+@api.get('/metrics/requests')
+@require_metrics_token
+def get_request_metrics():
+    """Get per-endpoint request timings and SQL statement counts for this
+    worker. Returns:
+    {
+        "api.get_users_dog": {
+            "requests": 120,
+            "statements_avg": 3.0,
+            "statements_max": 3,
+            "n_plus_one": 0,
+            "total_ms_avg": 4.81,
+            "auth_ms_avg": 0.12,
+            "query_ms_avg": 1.94,
+            "serialize_ms_avg": 0.31,
+            "jsonify_ms_avg": 0.09
+        }, ...
+    }
+
+    n_plus_one counts requests that ran one statement N_PLUS_ONE_THRESHOLD or
+    more times.
+
+    Requires the operator token, see require_metrics_token."""
+
+    return jsonify(request_metrics.snapshot())
+
+
+@api.get('/metrics/cache')
+@require_metrics_token
+def get_cache_metrics():
+    """Get response cache stats for this worker. Returns:
+    {
+        "backend": "MemoryBackend",
+        "hits": 950,
+        "misses": 50,
+        "hit_rate": 0.95,
+        "stores": 50,
+        "invalidations": 12,
+        "age_s_avg": 8.2,
+        "age_s_max": 59.7
+    }
+
+    age_s is how old cached responses were when served.
+
+    Requires the operator token, see require_metrics_token."""
+
+    return jsonify(response_cache.snapshot())
+
+
+@api.get('/metrics/notes')
+@require_metrics_token
+def get_note_buffer_metrics():
+    """Get command note write buffer stats for this worker. Returns:
+    {
+        "pending": 12,
+        "accepted": 5210,
+        "rejected": 0,
+        "written": 5198,
+        "dropped": 0,
+        "batches": 61
+    }
+
+    rejected notes got 503 because the buffer was full; dropped notes were
+    accepted but couldn't be written.
 
+    Requires the operator token, see require_metrics_token."""
 
+    return jsonify(note_buffer.snapshot())
@@ -0,0 +1,83 @@
+"""Logging setup for FetchFolio app."""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+# attributes every LogRecord has; anything else was passed with extra={...}
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message"}
+
+
+class JSONFormatter(logging.Formatter):
+    """Format each record as one JSON object per line:
+    {"time": "...", "level": "INFO", "logger": "app", "message": "...", ...}
+
+    Values passed with extra={...} are added as top-level keys."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+_listener = None
+
+
+def stop_listener():
+    """Flush queued log records and stop the background writer, if any."""
+
+    global _listener
+
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_listener)
+
+
+def configure_logging(app):
+    """Set up root logger from app config LOG_LEVEL, LOG_FORMAT and LOG_ASYNC.
+
+    With LOG_ASYNC the request thread only puts records on a queue; a
+    background thread formats and writes them."""
+
+    global _listener
+
+    stop_listener()
+
+    handler = logging.StreamHandler(sys.stdout)
+    if app.config["LOG_FORMAT"] == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            "[%(asctime)s] %(levelname)s in %(name)s: %(message)s"))
+
+    if app.config["LOG_ASYNC"]:
+        log_queue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(log_queue, handler)
+        _listener.start()
+        handler = logging.handlers.QueueHandler(log_queue)
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(app.config["LOG_LEVEL"])
+
+    # Flask's own logger has its own handler in debug mode; use the root one
+    app.logger.handlers.clear()
+    app.logger.propagate = True
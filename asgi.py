@@ -0,0 +1,205 @@
+"""Async (ASGI) serving mode for FetchFolio API.
+
+Under a WSGI server every request holds a worker thread for as long as it
+runs, most of which is spent waiting on PostgreSQL or bcrypt, so concurrency
+is capped at the number of threads. This module serves the same app - the
+same routes, code and responses - from an ASGI server, with every request
+running on one event loop:
+
+- Each request runs in a greenlet, using SQLAlchemy's greenlet_spawn (what
+  AsyncSession is built on). The engine uses an async driver (asyncpg, or
+  aiosqlite for SQLite; see ASYNC_DATABASE_DRIVERS), so whenever a query
+  waits on the database the greenlet hands control back to the event loop,
+  which goes on with other requests. Route code stays as it is.
+- Connections are checked out of a pool that waits on the event loop.
+- bcrypt still runs on password_hasher's thread pool; the request awaits it.
+- Bodies are read before the request runs and responses, streamed ones
+  included, are sent as they are produced.
+
+Concurrency is then bounded by the database pool (DB_POOL_SIZE plus
+DB_MAX_OVERFLOW) rather than by threads. Anything else that blocks holds up
+the whole loop: keep LOG_ASYNC on, and note the "redis" cache backend's calls
+are blocking.
+
+Needs an ASGI server and the async driver, e.g.
+    pip install -r requirements-optional.txt
+    FETCHFOLIO_CONFIG=production uvicorn --factory asgi:create_asgi_app
+
+Migrations and other flask commands keep using the synchronous driver.
+"""
+
+import asyncio
+import io
+import sys
+from sqlalchemy.util import await_only, greenlet_spawn
+
+from app import create_app
+from note_buffer import note_buffer
+
+
+def wsgi_environ(scope, body):
+    """Return WSGI environ for an ASGI http scope and its request body."""
+
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+
+    script_name = scope.get("root_path", "").encode("UTF-8").decode("latin-1")
+    path_info = scope["path"].encode("UTF-8").decode("latin-1")
+    if script_name and path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": script_name,
+        "PATH_INFO": path_info,
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+
+    for name, value in scope.get("headers", ()):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+
+        if name == "CONTENT_TYPE":
+            key = "CONTENT_TYPE"
+        elif name == "CONTENT_LENGTH":
+            key = "CONTENT_LENGTH"
+        else:
+            key = f"HTTP_{name}"
+
+        # repeated headers are joined, as a WSGI server would
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+    return environ
+
+
+class ASGIApp:
+    """ASGI app running a Flask app's requests in greenlets on the event
+    loop; see module docstring."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.loop = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            await self.http(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        else:
+            raise RuntimeError(f"Unsupported ASGI scope {scope['type']!r}")
+
+    def start(self):
+        """Remember the event loop and have background writes run on it."""
+
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            note_buffer.set_runner(self.run_from_thread)
+
+    def run_from_thread(self, fn, *args):
+        """Run fn(*args) in a greenlet on the event loop from another thread
+        and return its result."""
+
+        return asyncio.run_coroutine_threadsafe(
+            greenlet_spawn(fn, *args), self.loop).result()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message["type"] == "lifespan.startup":
+                self.start()
+                await send({"type": "lifespan.startup.complete"})
+
+            elif message["type"] == "lifespan.shutdown":
+                # write queued notes while the loop is still there to run
+                # their writes
+                await self.loop.run_in_executor(None, note_buffer.stop)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def read_body(self, receive):
+        """Return request body, or None if the client disconnected first."""
+
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+    async def http(self, scope, receive, send):
+        self.start()
+
+        body = await self.read_body(receive)
+        if body is None:
+            return
+
+        await greenlet_spawn(self.run, wsgi_environ(scope, body), send)
+
+    def run(self, environ, send):
+        """Run the Flask app on environ and send its response. Runs in a
+        greenlet, so sends are awaited with await_only."""
+
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            start.update(
+                type="http.response.start",
+                status=int(status.split(" ", 1)[0]),
+                headers=[
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in headers
+                ],
+            )
+
+        chunks = self.flask_app(environ, start_response)
+        try:
+            # hold each chunk back until the next one, so a response in one
+            # chunk goes out in a single body message
+            pending = None
+            for chunk in chunks:
+                if not chunk:
+                    continue
+
+                if pending is None:
+                    await_only(send(start))
+                else:
+                    await_only(send({
+                        "type": "http.response.body",
+                        "body": pending,
+                        "more_body": True,
+                    }))
+                pending = chunk
+
+            if pending is None:
+                await_only(send(start))
+            await_only(send({
+                "type": "http.response.body",
+                "body": pending or b"",
+            }))
+
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+
+def create_asgi_app(config=None):
+    """Create FetchFolio app in async mode, wrapped for an ASGI server.
+    config is as for app.create_app."""
+
+    return ASGIApp(create_app(config, async_mode=True))
@@ -1,19 +1,158 @@
+import hmac
 import os
-from flask import request, g
+import threading
+import time
+from flask import current_app, request, g
+from flask.ctx import _AppCtxGlobals
 from functools import wraps
-from werkzeug.exceptions import Unauthorized
+from werkzeug.exceptions import NotFound, Unauthorized
+
+from request_metrics import timed
+
+
+class AuthGlobals(_AppCtxGlobals):
+    """Flask global namespace that loads g.user on first access.
+
+    add_user_to_g only verifies the token and sets g.username and
+    g.token_version, and require_user checks it against token_revocations
+    without a database lookup. The User row is fetched, and its
+    token_version compared with the token's, the first time a handler reads
+    g.user, so routes that never touch it never load it."""
+
+    def __getattr__(self, name):
+        if name != "user":
+            return super().__getattr__(name)
+
+        return self.load_user()
+
+    def load_user(self, *options):
+        """Return g.user, loading it with loader options applied to the query
+        (like fields_plan's) if it hasn't been loaded yet."""
+
+        if "user" in self.__dict__:
+            return self.__dict__["user"]
+
+        username = self.__dict__.get("username")
+        user = None
+
+        if username:
+            from sqlalchemy.orm import undefer
+            from models import db, User
+
+            with timed("auth"):
+                # token_version is always loaded, for the check below
+                user = db.session.get(
+                    User, username,
+                    options=[*options, undefer(User.token_version)])
+
+            # user was deleted or token was revoked since it was issued
+            if user is None or user.token_version != self.token_version:
+                raise Unauthorized("Invalid token.")
+
+        self.__dict__["user"] = user
+        return user
+
+
+class TokenRevocations:
+    """Lowest token version still valid for users who changed their password
+    recently, so require_user can reject revoked tokens without a database
+    lookup.
+
+    Entries are kept for TOKEN_EXPIRATION, after which every token issued
+    before the change has expired anyway. With CACHE_BACKEND "redis" they are
+    shared by all workers; otherwise they are held in this process, and other
+    workers only reject a revoked token on routes that load g.user (which
+    compares token_version with the database) until it expires.
+    """
+
+    def __init__(self):
+        self.redis = None
+        self.ttl = 3600
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Pick the store from app config."""
+
+        from models import TOKEN_EXPIRATION
+
+        self.ttl = int(TOKEN_EXPIRATION.total_seconds())
+        self._entries = {}
+        self.redis = None
+
+        if app.config.get("CACHE_BACKEND", "memory") == "redis":
+            from cache import RedisBackend
+
+            self.redis = RedisBackend(app.config["CACHE_REDIS_URL"],
+                                      prefix="fetchfolio:revoked:")
+
+    def revoke(self, username, token_version):
+        """Reject username's tokens with a version below token_version."""
+
+        if self.redis:
+            self.redis.set(username, token_version, self.ttl)
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            self._entries = {
+                name: entry for name, entry in self._entries.items()
+                if entry[1] > now
+            }
+            self._entries[username] = (token_version, now + self.ttl)
+
+    def is_revoked(self, username, token_version):
+        """Return True if username's token with token_version was revoked."""
+
+        if self.redis:
+            valid_from = self.redis.get(username)
+            return valid_from is not None and token_version < int(valid_from)
+
+        with self._lock:
+            entry = self._entries.get(username)
+
+        return (entry is not None and entry[1] > time.monotonic()
+                and token_version < entry[0])
+
+
+token_revocations = TokenRevocations()
+
 
 def require_user(f):
-    """Check request has a valid JWT for logged in user."""
+    """Check request has a valid JWT for logged in user that isn't in
+    token_revocations. Nothing is read from the database; g.user is loaded
+    lazily if the route uses it."""
 
     @wraps(f)
     def decorated(*args, **kwargs):
-        print("REQUIRE_USER DECORATOR")
-        
-        if g.user:
+        if g.get("username"):
+            if token_revocations.is_revoked(g.username, g.token_version):
+                raise Unauthorized("Invalid token.")
+
             return f(*args, **kwargs)
-        
+
         else:
             raise Unauthorized()
-    
-    return decorated
\ No newline at end of file
+
+    return decorated
+
+
+def require_metrics_token(f):
+    """Check request has the operator token METRICS_TOKEN in its
+    X-Metrics-Token header. Routes are hidden (404) if METRICS_TOKEN isn't
+    set. User tokens don't give access."""
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = current_app.config.get("METRICS_TOKEN")
+        if not token:
+            raise NotFound()
+
+        given = request.headers.get("X-Metrics-Token", "")
+        if not hmac.compare_digest(given.encode("UTF-8"),
+                                   token.encode("UTF-8")):
+            raise Unauthorized()
+
+        return f(*args, **kwargs)
+
+    return decorated
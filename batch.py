@@ -0,0 +1,214 @@
+"""Batch create/update of a dog's commands for FetchFolio API.
+
+A batch is a list of command items. Items with an "id" are partial updates of
+that command; items without one create a command. The whole batch is
+validated first, with one query for the dog's matching command ids and one
+for the command types used, and is then applied with one multi-row INSERT
+... RETURNING for the creates and an executemany UPDATE by primary key for
+the updates, so the route commits once however many items there are.
+"""
+
+from datetime import datetime
+from sqlalchemy import select, insert, update, and_
+from werkzeug.exceptions import Unauthorized
+from flask import g
+
+from models import db, Dog, Command, CommandType
+from loading import COMMAND_DETAIL_PLAN
+from request_fields import parse_proficiency_field
+import summaries
+import history
+
+# Command columns a batch item can set
+COMMAND_FIELDS = (
+    "name", "description", "voice_command", "visual_command",
+    "command_video_url", "proficiency", "performance_video_url", "type",
+)
+
+MAX_BATCH_SIZE = 200
+
+
+def owned_command_ids(dog_id, command_ids):
+    """Return set of command_ids that are commands of current user's dog with
+    dog_id.
+
+    Raise Unauthorized if dog doesn't exist or is not one of the user's
+    dogs."""
+
+    rows = db.session.execute(
+        select(Dog.id, Command.id)
+        .outerjoin(
+            Command,
+            and_(Command.dog_id == Dog.id, Command.id.in_(command_ids)),
+        )
+        .where(Dog.id == dog_id, Dog.owner_username == g.username)
+    ).all()
+
+    if not rows:
+        raise Unauthorized
+
+    return {command_id for _, command_id in rows if command_id is not None}
+
+
+def item_errors(item, command_ids, types):
+    """Return {field: message} of problems with one batch item, given the
+    dog's command_ids matching the batch and the known command types."""
+
+    if not isinstance(item, dict):
+        return {"item": "Must be an object."}
+
+    errors = {}
+    columns = Command.__table__.columns
+
+    if "id" in item:
+        if not isinstance(item["id"], int) or item["id"] not in command_ids:
+            errors["id"] = "Not one of this dog's commands."
+    else:
+        for field in ("name", "type"):
+            if field not in item:
+                errors[field] = "Required to create a command."
+
+    for field, value in item.items():
+        if field == "id":
+            continue
+
+        if field not in COMMAND_FIELDS:
+            errors[field] = "Unknown field."
+
+        elif field == "proficiency":
+            try:
+                if parse_proficiency_field(value) is None:
+                    errors[field] = "Must be an integer."
+            except ValueError:
+                errors[field] = "Must be an integer."
+
+        elif not isinstance(value, str):
+            errors[field] = "Must be a string."
+
+        elif columns[field].type.length and \
+                len(value) > columns[field].type.length:
+            errors[field] = (
+                f"Must be at most {columns[field].type.length} characters.")
+
+        elif field == "type" and value not in types:
+            errors[field] = "Unknown command type."
+
+    return errors
+
+
+def validate_batch(dog_id, items):
+    """Validate every item in items for dog with dog_id. Return list with a
+    {field: message} dict per item, empty for valid items.
+
+    Raise Unauthorized if dog is not one of current user's dogs."""
+
+    ids = [
+        item["id"] for item in items
+        if isinstance(item, dict) and isinstance(item.get("id"), int)
+    ]
+    command_ids = owned_command_ids(dog_id, ids)
+
+    type_names = {
+        item["type"] for item in items
+        if isinstance(item, dict) and isinstance(item.get("type"), str)
+    }
+    types = set(db.session.scalars(
+        select(CommandType.type).where(CommandType.type.in_(type_names))
+    )) if type_names else set()
+
+    errors = [item_errors(item, command_ids, types) for item in items]
+
+    seen = set()
+    for index, item in enumerate(items):
+        if isinstance(item, dict) and isinstance(item.get("id"), int):
+            if item["id"] in seen:
+                errors[index].setdefault("id", "Command appears twice.")
+            seen.add(item["id"])
+
+    return errors
+
+
+def command_values(item):
+    """Return column values of a validated batch item, with proficiency
+    parsed like the single-command routes do."""
+
+    values = dict(item)
+    if "proficiency" in values:
+        values["proficiency"] = parse_proficiency_field(values["proficiency"])
+
+    return values
+
+
+def apply_batch(dog_id, items):
+    """Create and update the commands in validated items for dog with dog_id,
+    and the training summaries and proficiency history to match. Return commands in the order of
+    items; caller commits."""
+
+    now = datetime.utcnow()
+    creates = [command_values(item) for item in items if "id" not in item]
+    updates = [command_values(item) for item in items if "id" in item]
+
+    created = []
+    if creates:
+        # every row sets the same columns, so they go in one INSERT
+        defaults = {
+            name: Command.__table__.columns[name].default.arg
+            for name in COMMAND_FIELDS
+            if Command.__table__.columns[name].default is not None
+        }
+        created = list(db.session.scalars(
+            insert(Command).returning(Command, sort_by_parameter_order=True),
+            [
+                {**defaults, **item, "dog_id": dog_id,
+                 "date_introduced": now, "date_updated": now}
+                for item in creates
+            ],
+        ))
+
+    updated = {}
+    old = {}
+    if updates:
+        old = {
+            command_id: (command_type, proficiency)
+            for command_id, command_type, proficiency in db.session.execute(
+                select(Command.id, Command.type, Command.proficiency)
+                .where(Command.id.in_([item["id"] for item in updates]))
+                # locked, in id order, so concurrent writes of these
+                # commands wait and see the values this batch leaves
+                .order_by(Command.id)
+                .with_for_update()
+            )
+        }
+
+        # grouped by the set of fields each item sets; see engine_options
+        # for how PostgreSQL sends each group in few round trips
+        db.session.execute(
+            update(Command),
+            [{**item, "date_updated": now} for item in updates],
+        )
+
+        updated = {
+            command.id: command
+            for command in db.session.scalars(
+                select(Command)
+                .options(*COMMAND_DETAIL_PLAN)
+                .where(Command.id.in_([item["id"] for item in updates]))
+                .execution_options(populate_existing=True)
+            )
+        }
+
+    summaries.record(dog_id, removed=old.values(), added=[
+        (command.type, command.proficiency)
+        for command in [*created, *updated.values()]
+    ])
+    history.record(dog_id, [
+        (command.id, command.proficiency)
+        for command in [*created, *updated.values()]
+        if command.id not in old or command.proficiency != old[command.id][1]
+    ])
+
+    created = iter(created)
+    return [
+        updated[item["id"]] if "id" in item else next(created)
+        for item in items
+    ]
@@ -0,0 +1,132 @@
+"""Compare JSON encoders and response compression on representative payloads.
+
+Builds the bodies of three of the largest responses from in-memory model
+instances (no database): a /dogs page, a /users page and a dog's command list
+with notes. Each is encoded with every available JSON_ENCODER, and the encoded
+body is compressed with each Content-Encoding the app can send. Reports mean
+encode/compress time and bytes on the wire.
+
+    python -m benchmarks.json_encoding --repeat 200 --page 500 --commands 50
+
+Encoders and encodings whose packages (orjson, brotli) aren't installed are
+skipped. Results are written to stderr.
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.stats import percentile
+
+
+def payloads(page, commands, notes):
+    """Return {name: serializer output} for the benchmark responses."""
+
+    from app import (serialize_dog_summary, serialize_user_summary,
+                     serialize_command)
+    from models import User, Dog, Command, CommandNote
+
+    now = datetime(2023, 10, 12, 2, 54, 29, 134549)
+
+    dogs = [
+        Dog(id=i, name=f"Petey {i}", birth_date=now - timedelta(days=i),
+            breed="Border Collie", size="large", bio="good dog " * 10,
+            image_url="https://example.com/dog.webp", private=False,
+            owner_username=f"user{i}")
+        for i in range(page)
+    ]
+    users = [
+        User(username=f"user{i}", name=f"User {i}",
+             email=f"user{i}@example.com", bio="likes dogs " * 5,
+             location="Denver", user_image_url="https://example.com/u.webp")
+        for i in range(page)
+    ]
+    dog_commands = [
+        Command(id=i, name=f"command {i}", date_introduced=now,
+                date_updated=now + timedelta(seconds=i),
+                description="standard sit " * 5, voice_command="sit",
+                visual_command="raise pinched fingers to lips",
+                command_video_url="", proficiency=i % 5 + 1,
+                performance_video_url="", type="obedience", dog_id=1,
+                notes=[
+                    CommandNote(id=i * notes + j, note=f"note {j} " * 8,
+                                date=now + timedelta(minutes=j))
+                    for j in range(notes)
+                ])
+        for i in range(commands)
+    ]
+
+    return {
+        "dogs page": [serialize_dog_summary(dog) for dog in dogs],
+        "users page": [serialize_user_summary(user) for user in users],
+        "dog commands": [
+            serialize_command(command) for command in dog_commands],
+    }
+
+
+def mean_ms(fn, repeat):
+    """Return (mean ms, p95 ms) of repeat calls of fn."""
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    samples.sort()
+    return statistics.mean(samples), percentile(samples, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--page", type=int, default=500,
+                        help="dogs and users per list page")
+    parser.add_argument("--commands", type=int, default=50,
+                        help="commands in the command list")
+    parser.add_argument("--notes", type=int, default=10,
+                        help="notes per command")
+    args = parser.parse_args()
+
+    from flask import Flask
+    from compression import ResponseCompression
+    from json_provider import FetchFolioJSONProvider, ENCODERS, orjson
+
+    bodies = payloads(args.page, args.commands, args.notes)
+
+    providers = {}
+    for encoder in ENCODERS:
+        if encoder == "orjson" and orjson is None:
+            continue
+        app = Flask(__name__)
+        app.config["JSON_ENCODER"] = encoder
+        providers[encoder] = FetchFolioJSONProvider(app)
+
+    app = Flask(__name__)
+    compression = ResponseCompression()
+    compression.init_app(app)
+
+    print(f"{args.repeat} repeats", file=sys.stderr)
+    print(f"{'payload':<14} {'step':<16} {'mean ms':>9} {'p95 ms':>9} "
+          f"{'bytes':>9}", file=sys.stderr)
+
+    for name, body in bodies.items():
+        encoded = None
+        for encoder, provider in providers.items():
+            mean, p95 = mean_ms(lambda: provider.dumps_bytes(body), args.repeat)
+            encoded = provider.dumps_bytes(body)
+            print(f"{name:<14} {encoder:<16} {mean:>9.3f} {p95:>9.3f} "
+                  f"{len(encoded):>9}", file=sys.stderr)
+
+        for encoding in compression.encoders:
+            mean, p95 = mean_ms(
+                lambda: encoding.compress(encoded), args.repeat)
+            size = len(encoding.compress(encoded))
+            print(f"{name:<14} {encoding.name:<16} {mean:>9.3f} {p95:>9.3f} "
+                  f"{size:>9}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""HTTP load benchmark for the FetchFolio API.
+
+Each worker thread signs up a new user, logs in as one of the seeded users,
+and then cycles through the dog and command routes until the run ends:
+
+    GET    /dogs
+    GET    /dogs/current/<id>
+    GET    /dogs/current/<id>/commands
+    POST   /dogs/current/<id>/commands
+    GET    /dogs/current/<id>/commands/<id>
+    PATCH  /dogs/current/<id>/commands/<id>
+    DELETE /dogs/current/<id>/commands/<id>
+
+Throughput and mean/p50/p95/p99 latency are reported per route, and the
+results are saved as JSON so runs can be compared:
+
+    python -m benchmarks.load --workers 8 --duration 30 --users 100
+    python -m benchmarks.load --compare benchmarks/results/load-<before>.json
+
+Without --url the app is served in-process with the test profile against
+TEST_DATABASE_URL (or a temporary SQLite file), which is dropped and seeded
+with benchmarks.seed_data first. Workers share it, so in-memory SQLite isn't
+accepted; use PostgreSQL for numbers that mean something in production. With --url, requests go to an already
+running server whose database was seeded with the same --users/--dogs
+arguments:
+
+    python -m benchmarks.seed_data --users 100 --dogs 3
+    python -m benchmarks.load --url http://localhost:5000 --users 100
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import requests
+
+from benchmarks.seed_data import (BENCH_PASSWORD, add_arguments,
+                                  bench_username, seed_from_args,
+                                  bench_database_url, bench_config)
+from benchmarks.stats import summarize
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# re-login every this many cycles, so login shows up without dominating
+LOGIN_EVERY = 20
+
+
+class Worker(threading.Thread):
+    """Run the route cycle against base_url as seeded user number n until
+    deadline, recording latencies in self.latencies and failures in
+    self.errors, both keyed by route."""
+
+    def __init__(self, base_url, n, deadline, cycles):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.username = bench_username(n)
+        self.deadline = deadline
+        self.cycles = cycles
+        self.session = requests.Session()
+        self.latencies = {}
+        self.errors = {}
+
+    def call(self, route, method, path, **kwargs):
+        """Send request and record its latency under route. Return the
+        response, or None if it failed."""
+
+        start = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, self.base_url + path, timeout=30, **kwargs)
+        except requests.RequestException:
+            response = None
+        elapsed = (time.perf_counter() - start) * 1000
+
+        self.latencies.setdefault(route, []).append(elapsed)
+        if response is None or not response.ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+            return None
+
+        return response
+
+    def login(self):
+        response = self.call("POST /login", "POST", "/login", json={
+            "username": self.username,
+            "password": BENCH_PASSWORD,
+        })
+        if response is not None:
+            self.session.headers["Authorization"] = response.json()
+
+        return response is not None
+
+    def signup(self):
+        username = f"load-{uuid.uuid4().hex[:12]}"
+        self.call("POST /signup", "POST", "/signup", json={
+            "username": username,
+            "password": BENCH_PASSWORD,
+            "name": "Load Test",
+            "email": f"{username}@example.com",
+        })
+
+    def cycle(self, dog_id):
+        self.call("GET /dogs", "GET", "/dogs")
+        self.call("GET /dogs/current/<id>", "GET", f"/dogs/current/{dog_id}")
+
+        commands = f"/dogs/current/{dog_id}/commands"
+        self.call("GET /dogs/current/<id>/commands", "GET", commands)
+
+        response = self.call(
+            "POST /dogs/current/<id>/commands", "POST", commands, json={
+                "name": "load test",
+                "voice_command": "load",
+                "proficiency": 2,
+                "type": "obedience",
+            })
+        if response is None:
+            return
+
+        command = f"{commands}/{response.json()['id']}"
+        self.call("GET /dogs/current/<id>/commands/<id>", "GET", command)
+        self.call("PATCH /dogs/current/<id>/commands/<id>", "PATCH", command,
+                  json={"proficiency": 3})
+        self.call("DELETE /dogs/current/<id>/commands/<id>", "DELETE", command)
+
+    def run(self):
+        self.signup()
+        if not self.login():
+            return
+
+        response = self.call("GET /dogs/current", "GET", "/dogs/current")
+        dog_ids = [dog["id"] for dog in response.json()] if response else []
+        if not dog_ids:
+            return
+
+        count = 0
+        while time.monotonic() < self.deadline:
+            if self.cycles and count >= self.cycles:
+                break
+            if count and count % LOGIN_EVERY == 0:
+                self.login()
+
+            self.cycle(dog_ids[count % len(dog_ids)])
+            count += 1
+
+
+def run_load(base_url, args):
+    """Run args.workers workers against base_url for args.duration seconds
+    (or args.cycles cycles each). Return results dict for save_results."""
+
+    deadline = time.monotonic() + args.duration
+    workers = [
+        Worker(base_url, n % args.users, deadline, args.cycles)
+        for n in range(args.workers)
+    ]
+
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - start
+
+    latencies = {}
+    errors = {}
+    for worker in workers:
+        for route, samples in worker.latencies.items():
+            latencies.setdefault(route, []).extend(samples)
+        for route, count in worker.errors.items():
+            errors[route] = errors.get(route, 0) + count
+
+    routes = {}
+    for route, samples in sorted(latencies.items()):
+        routes[route] = summarize(samples, seconds)
+        routes[route]["errors"] = errors.get(route, 0)
+
+    everything = [sample for samples in latencies.values() for sample in samples]
+    total = summarize(everything, seconds)
+    total["errors"] = sum(errors.values())
+
+    return {"seconds": round(seconds, 3), "routes": routes, "total": total}
+
+
+def serve_in_process(args):
+    """Seed the test database and serve the app on a free local port.
+    Return (base_url, server, data counts)."""
+
+    # before the app is imported, as config reads the environment then
+    database_url = bench_database_url("load.db")
+    os.environ["TEST_DATABASE_URL"] = database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+
+    from werkzeug.serving import make_server
+    from app import create_app
+    from models import db
+
+    app = create_app(bench_config(args.config, database_url))
+
+    with app.app_context():
+        data = seed_from_args(db, args)
+
+    # one log line per request would slow the server down
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return f"http://127.0.0.1:{server.server_port}", server, data
+
+
+def git_revision():
+    """Return short hash of the checked-out commit, or None."""
+
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(results, path):
+    """Write results as JSON to path, creating its directory."""
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2)
+
+
+def print_results(results, baseline=None, file=sys.stdout):
+    """Print per-route table. With a baseline results dict, add the change
+    in throughput and p95 for routes present in both."""
+
+    header = (f"{'route':<42} {'req':>6} {'err':>5} {'req/s':>8} "
+              f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    if baseline:
+        header += f" {'Δ req/s':>9} {'Δ p95':>8}"
+    print(header, file=file)
+
+    rows = list(results["routes"].items()) + [("total", results["total"])]
+    for route, stats in rows:
+        if not stats["requests"]:
+            continue
+
+        line = (f"{route:<42} {stats['requests']:>6} {stats['errors']:>5} "
+                f"{stats['throughput']:>8.1f} {stats['p50_ms']:>8.2f} "
+                f"{stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f}")
+
+        before = (baseline["total"] if route == "total"
+                  else baseline["routes"].get(route)) if baseline else None
+        if before and before.get("requests"):
+            line += (f" {change(before['throughput'], stats['throughput']):>9}"
+                     f" {change(before['p95_ms'], stats['p95_ms']):>8}")
+
+        print(line, file=file)
+
+
+def change(before, after):
+    """Return percent change from before to after, like "+12.5%"."""
+
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="server to test; default in-process")
+    parser.add_argument("--config", default="test",
+                        help="config profile for the in-process server")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10,
+                        help="seconds to run")
+    parser.add_argument("--cycles", type=int, default=0,
+                        help="stop each worker after this many route cycles")
+    parser.add_argument("--output", help="results file; default "
+                        "benchmarks/results/load-<timestamp>.json")
+    parser.add_argument("--compare", help="earlier results file to compare")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    started = datetime.utcnow()
+    server = None
+    data = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        base_url, server, data = serve_in_process(args)
+
+    try:
+        results = run_load(base_url, args)
+    finally:
+        if server:
+            server.shutdown()
+
+    results = {
+        "started": started.isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "url": args.url,
+        "config": None if args.url else args.config,
+        "workers": args.workers,
+        "data": data,
+        "args": vars(args),
+        **results,
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"load-{started:%Y%m%d-%H%M%S}.json")
+    save_results(results, output)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+    print_results(results, baseline)
+    print(f"saved {output}")
+
+
+if __name__ == "__main__":
+    main()
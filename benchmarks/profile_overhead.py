@@ -0,0 +1,127 @@
+"""Compare per-request overhead of the development and production profiles.
+
+Runs the same authenticated GETs through each profile's app in-process and
+reports mean and p50/p95 latency. The development profile echoes SQL, runs
+the debug toolbar and logs at DEBUG; the production profile does none of that.
+
+    python -m benchmarks.profile_overhead --requests 500
+
+Uses TEST_DATABASE_URL if set, otherwise a temporary SQLite file. Tables are
+created (and dropped afterwards) in that database, so don't point it at a
+database you care about. Output from the apps themselves is discarded; results
+are written to stderr.
+"""
+
+import argparse
+import contextlib
+import os
+import statistics
+import sys
+import time
+
+from benchmarks.seed_data import bench_database_url, bench_config
+from benchmarks.stats import percentile
+
+
+def seed(db, commands):
+    """Add one user with one dog with commands commands. Return (user, dog)."""
+
+    from models import User, Dog, Command, CommandType
+
+    db.session.add(CommandType(type="obedience"))
+    user = User.signup("bench", "password", "Bench", "bench@example.com", None)
+    dog = Dog(name="Petey", breed="Border Collie", size="large",
+              owner_username="bench", private=False)
+    db.session.add(dog)
+    db.session.flush()
+
+    db.session.add_all(
+        Command(name=f"command {i}", type="obedience", dog_id=dog.id)
+        for i in range(commands)
+    )
+    db.session.commit()
+
+    return user, dog.id
+
+
+def run_profiles(profiles, database_url, args):
+    """Time args.requests GETs against an app built with each profile, all
+    on database_url. Requests alternate between the apps so both see the
+    same conditions. Return {profile: sorted latencies in ms}."""
+
+    from app import create_app
+    from app_logging import stop_listener
+    from models import db, User
+
+    apps = {
+        profile: create_app(bench_config(profile, database_url))
+        for profile in profiles
+    }
+
+    # profiles share one database; seed it once
+    with next(iter(apps.values())).app_context():
+        db.drop_all()
+        db.create_all()
+        user, dog_id = seed(db, args.commands)
+        token = User.create_token(user)
+
+    headers = {"Authorization": token}
+    urls = [f"/dogs/current/{dog_id}", f"/dogs/current/{dog_id}/commands"]
+    clients = {profile: app.test_client() for profile, app in apps.items()}
+    latencies = {profile: [] for profile in profiles}
+
+    for client in clients.values():
+        for url in urls:
+            client.get(url, headers=headers)
+
+    for i in range(args.requests):
+        url = urls[i % len(urls)]
+        for profile, client in clients.items():
+            start = time.perf_counter()
+            response = client.get(url, headers=headers)
+            latencies[profile].append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.status_code
+
+    with next(iter(apps.values())).app_context():
+        db.drop_all()
+
+    # flush log records still queued by the production profile
+    stop_listener()
+
+    return {profile: sorted(samples) for profile, samples in latencies.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--commands", type=int, default=20,
+                        help="commands on the benchmark dog")
+    args = parser.parse_args()
+
+    # every profile reads the same database; set before the app is
+    # imported, as config reads the environment then
+    database_url = bench_database_url("bench.db")
+    os.environ["TEST_DATABASE_URL"] = database_url
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = run_profiles(("development", "production"), database_url,
+                               args)
+
+    print(f"{args.requests} requests, {args.commands} commands per dog",
+          file=sys.stderr)
+    print(f"{'profile':<12} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}",
+          file=sys.stderr)
+    for profile, latencies in results.items():
+        print(f"{profile:<12} {statistics.mean(latencies):>9.3f} "
+              f"{percentile(latencies, 50):>9.3f} "
+              f"{percentile(latencies, 95):>9.3f}", file=sys.stderr)
+
+    saved = (statistics.mean(results["development"])
+             - statistics.mean(results["production"]))
+    print(f"production saves {saved:.3f} ms per request", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Generate benchmark data: users with dogs, commands and command notes, plus
+the training summaries and proficiency history of the commands.
+
+    python -m benchmarks.seed_data --users 100 --dogs 3 --commands 20 --notes 5
+
+Writes to the database of the chosen profile (FETCHFOLIO_CONFIG, default
+"development"), dropping and recreating its tables first, so don't point it
+at a database you care about. Every user is named user<n> and has the
+password BENCH_PASSWORD, so the load benchmark can log in as any of them.
+
+Data is generated from --seed, so the same arguments produce the same rows.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+
+BENCH_PASSWORD = "bench-password"
+COMMAND_TYPES = ("obedience", "trick", "agility", "manners")
+EVENT_TYPES = ("class", "vet", "walk")
+SIZES = ("small", "medium", "large")
+BREEDS = ("Border Collie", "Poodle", "Beagle", "Labrador", "Mutt")
+WORDS = ("sit", "down", "stay", "come", "heel", "spin", "touch", "wait",
+         "leave", "place", "bow", "paw")
+
+# rows per INSERT statement
+CHUNK_SIZE = 1000
+
+
+def bench_username(n):
+    """Return username of the nth generated user."""
+
+    return f"user{n}"
+
+
+def _insert(db, model, rows):
+    """Insert rows into model's table in chunks."""
+
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(insert(model), rows[start:start + CHUNK_SIZE])
+
+
+def generate(db, users=10, dogs=2, commands=10, notes=3, private=0.2, seed=0):
+    """Reset tables and add users users, each with dogs dogs, each with
+    commands commands, each with notes notes. About private of the dogs are
+    private. Each command's history climbs a level a day up to its
+    proficiency, from 1 if it was introduced long enough ago. Return counts:
+    {"users": 10, "dogs": 20, "commands": 200, "notes": 600, "history": 600}
+    """
+
+    from models import (User, Dog, Command, CommandNote, CommandType,
+                        EventType, ProficiencyHistory)
+    from hashing import password_hasher
+    import summaries
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    db.drop_all()
+    db.create_all()
+
+    db.session.add_all(CommandType(type=type) for type in COMMAND_TYPES)
+    db.session.add_all(EventType(type=type) for type in EVENT_TYPES)
+
+    # every user shares one hash; bcrypt per user would dominate seeding
+    password = password_hasher.hash(BENCH_PASSWORD)
+
+    _insert(db, User, [
+        {
+            "username": bench_username(n),
+            "password": password,
+            "email": f"{bench_username(n)}@example.com",
+            "name": f"User {n}",
+        }
+        for n in range(users)
+    ])
+
+    dog_rows = []
+    for n in range(users):
+        for d in range(dogs):
+            dog_rows.append({
+                "id": len(dog_rows) + 1,
+                "name": f"Dog {n}-{d}",
+                "birth_date": now - timedelta(days=rng.randint(60, 4000)),
+                "breed": rng.choice(BREEDS),
+                "size": rng.choice(SIZES),
+                "private": rng.random() < private,
+                "owner_username": bench_username(n),
+            })
+    _insert(db, Dog, dog_rows)
+
+    command_rows = []
+    note_rows = []
+    history_rows = []
+    for dog in dog_rows:
+        for c in range(commands):
+            introduced = now - timedelta(days=rng.randint(1, 700))
+            command_rows.append({
+                "id": len(command_rows) + 1,
+                "name": f"{rng.choice(WORDS)} {c}",
+                "date_introduced": introduced,
+                "date_updated": introduced,
+                "voice_command": rng.choice(WORDS),
+                "proficiency": rng.randint(1, 5),
+                "type": rng.choice(COMMAND_TYPES),
+                "dog_id": dog["id"],
+            })
+            # one level per day, so commands introduced lately start higher
+            proficiency = command_rows[-1]["proficiency"]
+            span = (now - introduced).days + 1
+            change_days = sorted(rng.sample(
+                range(span), min(proficiency, span)))
+            first_level = proficiency - len(change_days) + 1
+            for level, days in enumerate(change_days, start=first_level):
+                history_rows.append({
+                    "command_id": len(command_rows),
+                    "day": (introduced + timedelta(days=days)).date(),
+                    "dog_id": dog["id"],
+                    "proficiency": level,
+                    "min_proficiency": max(level - 1, 1),
+                    "max_proficiency": level,
+                    "changes": 1,
+                })
+            for _ in range(notes):
+                note_rows.append({
+                    "note": " ".join(rng.choices(WORDS, k=8)),
+                    "date": introduced + timedelta(days=rng.randint(0, 60)),
+                    "command_id": len(command_rows),
+                })
+    _insert(db, Command, command_rows)
+    _insert(db, CommandNote, note_rows)
+    _insert(db, ProficiencyHistory, history_rows)
+    summaries.rebuild()
+
+    db.session.commit()
+
+    # ids were set explicitly; move PostgreSQL sequences past them
+    if db.engine.dialect.name == "postgresql":
+        for table in ("dogs", "commands"):
+            db.session.execute(db.text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {table}), false)"))
+        db.session.commit()
+
+    return {
+        "users": users,
+        "dogs": len(dog_rows),
+        "commands": len(command_rows),
+        "notes": len(note_rows),
+        "history": len(history_rows),
+    }
+
+
+def add_arguments(parser):
+    """Add data size arguments shared with the load benchmark to parser."""
+
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--dogs", type=int, default=2, help="dogs per user")
+    parser.add_argument("--commands", type=int, default=10,
+                        help="commands per dog")
+    parser.add_argument("--notes", type=int, default=3,
+                        help="notes per command")
+    parser.add_argument("--private", type=float, default=0.2,
+                        help="share of dogs that are private")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def seed_from_args(db, args):
+    """Call generate with the arguments from add_arguments."""
+
+    return generate(db, users=args.users, dogs=args.dogs,
+                    commands=args.commands, notes=args.notes,
+                    private=args.private, seed=args.seed)
+
+
+def bench_database_url(filename):
+    """Return TEST_DATABASE_URL, or the URL of a new SQLite file named
+    filename in a temporary directory. Threaded servers share the database,
+    so it must be a file or a server with a real connection pool, not an
+    in-memory SQLite database on one shared connection.
+
+    Raise SystemExit if TEST_DATABASE_URL is an in-memory SQLite database."""
+
+    from sqlalchemy.engine import make_url
+
+    url = os.environ.get("TEST_DATABASE_URL")
+    if not url:
+        path = os.path.join(tempfile.mkdtemp(), filename)
+        return f"sqlite:///{path}"
+
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (
+            None, "", ":memory:"):
+        raise SystemExit(
+            "TEST_DATABASE_URL is an in-memory SQLite database; "
+            "use a file or PostgreSQL")
+
+    return url
+
+
+def bench_config(profile, database_url):
+    """Return config class of profile (see config.py) using database_url,
+    whatever the environment held when config was imported."""
+
+    from config import configs
+
+    return type(f"Bench{configs[profile].__name__}", (configs[profile],), {
+        "SQLALCHEMY_DATABASE_URI": database_url,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", help="config profile, see config.py")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    from app import create_app
+    from models import db
+
+    app = create_app(args.config)
+    app.config["SQLALCHEMY_ECHO"] = False
+
+    with app.app_context():
+        db.engine.echo = False
+        print(seed_from_args(db, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Latency summaries shared by the benchmarks."""
+
+import statistics
+
+
+def percentile(samples, pct):
+    """Return pct percentile of sorted samples."""
+
+    index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+def summarize(latencies, seconds):
+    """Summarize latencies (in ms) collected over seconds of wall time:
+    {
+        "requests": 1200,
+        "throughput": 40.0,
+        "mean_ms": 12.1,
+        "p50_ms": 10.4,
+        "p95_ms": 24.9,
+        "p99_ms": 41.3
+    }
+    """
+
+    samples = sorted(latencies)
+    if not samples:
+        return {"requests": 0, "throughput": 0}
+
+    return {
+        "requests": len(samples),
+        "throughput": round(len(samples) / seconds, 2) if seconds else 0,
+        "mean_ms": round(statistics.mean(samples), 3),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+    }
@@ -0,0 +1,299 @@
+"""Shared response cache for FetchFolio API.
+
+Routes whose response is the same for every user (like the public dog
+directory) can be decorated with cached(namespace). Their response body is
+stored under the namespace's current generation and the request's path and
+query string; writes that change what the namespace lists call
+response_cache.invalidate(namespace), which bumps the generation so every
+stored response for it is skipped from then on and ages out of the backend.
+
+The generation is read before the route runs and the response is stored under
+that generation, so a response built from data read before a concurrent
+write is never stored as current.
+
+Backends, picked by CACHE_BACKEND:
+- "memory": LRU with TTL in this process. Invalidation only reaches this
+  process, so with several workers others can serve a stale page for up to
+  CACHE_TTL seconds.
+- "redis": any Redis-compatible server at CACHE_REDIS_URL, shared by all
+  workers. Needs the redis package.
+- "none": no caching.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request
+
+
+class MemoryBackend:
+    """Thread-safe in-process LRU cache whose entries expire after ttl
+    seconds."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return value stored under key, or None if missing or expired."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        """Store value under key for ttl seconds, evicting the least recently
+        used entry if full."""
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def counter(self, key):
+        """Return integer counter key, 0 if never incremented."""
+
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key):
+        """Increment counter key and return its new value."""
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+class RedisBackend:
+    """Cache in a Redis-compatible server, shared by every worker. Keys are
+    prefixed with prefix."""
+
+    def __init__(self, url, prefix="fetchfolio:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def counter(self, key):
+        value = self.client.get(self.prefix + key)
+        return int(value) if value else 0
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+class CacheStats:
+    """Thread-safe hit, miss and invalidation counts, and the age of
+    responses served from the cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.stores = 0
+            self.invalidations = 0
+            self.total_age = 0.0
+            self.max_age = 0.0
+
+    def record_hit(self, age):
+        with self._lock:
+            self.hits += 1
+            self.total_age += age
+            self.max_age = max(self.max_age, age)
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def record_store(self):
+        with self._lock:
+            self.stores += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "stores": self.stores,
+                "invalidations": self.invalidations,
+                "age_s_avg": round(
+                    self.total_age / self.hits, 3) if self.hits else 0,
+                "age_s_max": round(self.max_age, 3),
+            }
+
+
+class ResponseCache:
+    """Generation-invalidated response cache.
+
+    Settings come from app config in init_app:
+    - CACHE_BACKEND: "memory", "redis" or "none"
+    - CACHE_REDIS_URL: server for the redis backend
+    - CACHE_TTL: seconds a stored response is served
+    - CACHE_MAX_ENTRIES: size of the memory backend
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.ttl = 60
+        self.stats = CacheStats()
+
+    def init_app(self, app):
+        """Create the backend from app config."""
+
+        self.ttl = app.config.get("CACHE_TTL", 60)
+        kind = app.config.get("CACHE_BACKEND", "memory")
+
+        if kind == "memory":
+            self.backend = MemoryBackend(
+                app.config.get("CACHE_MAX_ENTRIES", 1024))
+        elif kind == "redis":
+            self.backend = RedisBackend(app.config["CACHE_REDIS_URL"])
+        elif kind == "none":
+            self.backend = None
+        else:
+            raise ValueError(f"Unknown CACHE_BACKEND {kind!r}")
+
+    def generation(self, namespace):
+        """Return current generation of namespace."""
+
+        return self.backend.counter(f"{namespace}:generation")
+
+    def invalidate(self, namespace):
+        """Make every response stored for namespace stale. Call after the
+        write that changes it is committed."""
+
+        if self.backend is None:
+            return
+
+        self.backend.incr(f"{namespace}:generation")
+        self.stats.record_invalidation()
+
+    def get(self, key):
+        """Return (entry dict, age in seconds) stored under key, or None."""
+
+        value = self.backend.get(key)
+        if value is None:
+            return None
+
+        entry = json.loads(value)
+        return entry, time.time() - entry["stored"]
+
+    def set(self, key, response):
+        """Store body, status and headers of response under key."""
+
+        entry = {
+            "body": response.get_data(as_text=True),
+            "status": response.status_code,
+            "headers": [
+                [name, value] for name, value in response.headers
+                if name not in ("Content-Length", "Server-Timing")
+            ],
+            "stored": time.time(),
+        }
+        self.backend.set(key, json.dumps(entry), self.ttl)
+        self.stats.record_store()
+
+    def snapshot(self):
+        """Return stats:
+        {
+            "backend": "MemoryBackend",
+            "hits": 950,
+            "misses": 50,
+            "hit_rate": 0.95,
+            "stores": 50,
+            "invalidations": 12,
+            "age_s_avg": 8.2,
+            "age_s_max": 59.7
+        }
+
+        age is how long ago the served responses were stored."""
+
+        return {
+            "backend": type(self.backend).__name__ if self.backend else None,
+            **self.stats.snapshot(),
+        }
+
+
+response_cache = ResponseCache()
+
+
+def cached(namespace, skip=None):
+    """Decorate a GET route to serve its 200 responses from response_cache.
+    The response must not depend on who is asking. Requests for which
+    skip() returns true (like streamed responses) bypass the cache.
+
+    Responses carry X-Cache: HIT or MISS, and Age on hits."""
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if response_cache.backend is None or (skip and skip()):
+                return f(*args, **kwargs)
+
+            generation = response_cache.generation(namespace)
+            key = f"{namespace}:{generation}:{request.full_path}"
+
+            hit = response_cache.get(key)
+            if hit:
+                entry, age = hit
+                response_cache.stats.record_hit(age)
+
+                response = current_app.response_class(
+                    entry["body"], status=entry["status"],
+                    headers=entry["headers"])
+                response.headers["X-Cache"] = "HIT"
+                response.headers["Age"] = str(int(age))
+                return response
+
+            response_cache.stats.record_miss()
+            response = current_app.make_response(f(*args, **kwargs))
+
+            if response.status_code == 200 and not response.is_streamed:
+                response_cache.set(key, response)
+
+            response.headers["X-Cache"] = "MISS"
+            return response
+
+        return decorated
+
+    return decorator
@@ -0,0 +1,191 @@
+"""Response compression for FetchFolio API.
+
+JSON and iCalendar responses are compressed with the best encoding the
+client's Accept-Encoding allows: brotli ("br") if the brotli package is
+installed, then gzip. Clients that accept neither get the body as it is.
+
+- Responses under COMPRESSION_MIN_SIZE bytes are sent uncompressed; there is
+  little to save and it still costs CPU on every request.
+- Streamed responses (?stream=true lists, iCalendar feeds) are compressed
+  chunk by chunk, flushing after each, so the client still gets rows as they
+  are read. Their size isn't known up front, so they are always compressed.
+- Compressed responses get weak ETags, since their bytes depend on the
+  encoding; conditional.py compares ETags weakly, so 304s still work.
+- Every response that could be compressed carries Vary: Accept-Encoding.
+
+Cached responses (see cache.py) are stored uncompressed and compressed for
+each client.
+"""
+
+import zlib
+from flask import request
+from werkzeug.http import parse_cache_control_header
+
+from request_metrics import timed
+
+# compressing less than this saves less than a packet
+DEFAULT_MIN_SIZE = 1024
+
+DEFAULT_MIMETYPES = ("application/json", "text/calendar")
+
+
+class GzipEncoder:
+    """gzip Content-Encoding with zlib."""
+
+    name = "gzip"
+
+    def __init__(self, level):
+        self.level = level
+
+    def _compressor(self):
+        # wbits 31: deflate with a gzip header and trailer
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        compressor = self._compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def stream(self, chunks):
+        """Yield compressed chunks, flushed after each chunk of input."""
+
+        compressor = self._compressor()
+        for chunk in chunks:
+            output = compressor.compress(chunk)
+            output += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if output:
+                yield output
+
+        yield compressor.flush()
+
+
+class BrotliEncoder:
+    """br Content-Encoding with the brotli package."""
+
+    name = "br"
+
+    def __init__(self, brotli, quality):
+        self.brotli = brotli
+        self.quality = quality
+
+    def compress(self, data):
+        return self.brotli.compress(data, quality=self.quality)
+
+    def stream(self, chunks):
+        """Yield compressed chunks, flushed after each chunk of input."""
+
+        compressor = self.brotli.Compressor(quality=self.quality)
+        for chunk in chunks:
+            output = compressor.process(chunk) + compressor.flush()
+            if output:
+                yield output
+
+        yield compressor.finish()
+
+
+def encoded_chunks(iterable, charset="UTF-8"):
+    """Yield response body chunks as bytes, closing iterable when done or
+    when the response is closed early."""
+
+    try:
+        for chunk in iterable:
+            yield chunk.encode(charset) if isinstance(chunk, str) else chunk
+
+    finally:
+        if hasattr(iterable, "close"):
+            iterable.close()
+
+
+class ResponseCompression:
+    """Compress responses in an after_request hook; see module docstring.
+
+    Settings come from app config in init_app:
+    - COMPRESSION: turn compression on
+    - COMPRESSION_MIN_SIZE: smallest body, in bytes, that is compressed
+    - COMPRESSION_GZIP_LEVEL: zlib level, 1 (fastest) to 9
+    - COMPRESSION_BROTLI_QUALITY: brotli quality, 0 (fastest) to 11
+    - COMPRESSION_MIMETYPES: mimetypes that are compressed
+    """
+
+    def __init__(self):
+        self.encoders = []
+        self.min_size = DEFAULT_MIN_SIZE
+        self.mimetypes = DEFAULT_MIMETYPES
+
+    def init_app(self, app):
+        """Set up encoders from app config and register the hook on app.
+        Call after request_metrics.init_app so compression is timed."""
+
+        if not app.config.get("COMPRESSION", True):
+            return
+
+        self.min_size = app.config.get("COMPRESSION_MIN_SIZE", DEFAULT_MIN_SIZE)
+        self.mimetypes = tuple(
+            app.config.get("COMPRESSION_MIMETYPES", DEFAULT_MIMETYPES))
+
+        # in order of preference when a client accepts several equally
+        self.encoders = []
+        try:
+            import brotli
+        except ImportError:
+            pass
+        else:
+            self.encoders.append(BrotliEncoder(
+                brotli, app.config.get("COMPRESSION_BROTLI_QUALITY", 4)))
+        self.encoders.append(
+            GzipEncoder(app.config.get("COMPRESSION_GZIP_LEVEL", 6)))
+
+        app.after_request(self.compress)
+
+    def choose_encoder(self):
+        """Return the encoder the request's Accept-Encoding rates highest,
+        or None if it accepts none of them."""
+
+        best, best_quality = None, 0
+        for encoder in self.encoders:
+            quality = request.accept_encodings[encoder.name]
+            if quality > best_quality:
+                best, best_quality = encoder, quality
+
+        return best
+
+    def compress(self, response):
+        """Compress response for the request if it's worth it."""
+
+        if (response.mimetype not in self.mimetypes
+                or response.direct_passthrough
+                or response.status_code < 200
+                or response.status_code in (204, 304)
+                or "Content-Encoding" in response.headers
+                or parse_cache_control_header(
+                    response.headers.get("Cache-Control")).no_transform):
+            return response
+
+        response.vary.add("Accept-Encoding")
+
+        encoder = self.choose_encoder()
+        if encoder is None:
+            return response
+
+        if response.is_streamed:
+            response.response = encoder.stream(
+                encoded_chunks(response.response))
+            response.headers.pop("Content-Length", None)
+
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+
+            with timed("compress"):
+                response.set_data(encoder.compress(data))
+
+        response.headers["Content-Encoding"] = encoder.name
+
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+        return response
+
+
+response_compression = ResponseCompression()
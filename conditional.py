@@ -0,0 +1,81 @@
+"""Conditional GET for FetchFolio API.
+
+A route decorated with conditional(version) first runs version(**view_args),
+a cheap query returning a tuple of values that change whenever the response
+would. The tuple is hashed into an ETag, and its latest datetime becomes
+Last-Modified. If the request's If-None-Match (or, without
+one, If-Modified-Since) shows the client already has that version, a 304 is
+returned and the route itself never runs, so nothing is loaded or serialized.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, make_response, request
+
+# clients may keep a copy but must revalidate before using it
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(version):
+    """Return ETag value for version of the current request's resource. The
+    query string is included since it can change the representation."""
+
+    key = f"{request.path}?{request.query_string.decode()}|{version!r}"
+    return hashlib.sha1(key.encode("UTF-8")).hexdigest()
+
+
+def http_datetime(value):
+    """Return naive UTC datetime value as aware UTC, truncated to the whole
+    seconds HTTP dates carry."""
+
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def is_not_modified(etag, last_modified):
+    """Return True if the client's copy, per the request's validators, is
+    still current. If-None-Match wins over If-Modified-Since."""
+
+    if request.if_none_match:
+        # weak comparison, as RFC 9110 requires for If-None-Match
+        return request.if_none_match.contains_weak(etag)
+
+    if request.if_modified_since:
+        return last_modified <= request.if_modified_since
+
+    return False
+
+
+def conditional(version):
+    """Decorate a GET route to answer conditional requests with 304 when
+    version(**view_args) hasn't changed, and to add ETag, Last-Modified and
+    Cache-Control to full responses.
+
+    version takes the route's view args and returns a tuple; see module
+    docstring."""
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            current = version(**kwargs)
+            etag = make_etag(current)
+            last_modified = http_datetime(max(
+                (value for value in current if isinstance(value, datetime)),
+                default=datetime.min,
+            ))
+
+            if is_not_modified(etag, last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                # the version is read before the data; if they race, the
+                # client just gets a full response again on its next poll
+                response = make_response(f(*args, **kwargs))
+
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.headers["Cache-Control"] = CACHE_CONTROL
+            return response
+
+        return decorated
+
+    return decorator
@@ -0,0 +1,129 @@
+"""Configuration profiles for FetchFolio app."""
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def env_int(name, default=None):
+    """Get integer from environment variable name, or default if not set."""
+
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def env_bool(name, default=False):
+    """Get boolean from environment variable name, or default if not set."""
+
+    value = os.environ.get(name)
+    return value.lower() in ("1", "true", "yes") if value else default
+
+
+class Config:
+    """Settings shared by every profile."""
+
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+
+    DEBUG_TOOLBAR = False
+
+    # "text" for human-readable lines, "json" for one JSON object per line
+    LOG_FORMAT = "text"
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    # write log records from a background thread instead of the request
+    LOG_ASYNC = False
+
+    DB_POOL_SIZE = env_int('DB_POOL_SIZE')
+    DB_MAX_OVERFLOW = env_int('DB_MAX_OVERFLOW')
+    DB_POOL_TIMEOUT = env_int('DB_POOL_TIMEOUT')
+    DB_POOL_RECYCLE = env_int('DB_POOL_RECYCLE')
+    DB_POOL_PRE_PING = env_bool('DB_POOL_PRE_PING')
+    DB_STATEMENT_TIMEOUT = env_int('DB_STATEMENT_TIMEOUT')
+
+    # bcrypt cost for new hashes; logins rehash passwords made at other costs
+    BCRYPT_LOG_ROUNDS = env_int('BCRYPT_LOG_ROUNDS', 12)
+    PASSWORD_HASH_WORKERS = env_int('PASSWORD_HASH_WORKERS', 4)
+    PASSWORD_HASH_MAX_PENDING = env_int('PASSWORD_HASH_MAX_PENDING', 16)
+    PASSWORD_HASH_TIMEOUT = env_int('PASSWORD_HASH_TIMEOUT', 5)
+
+    # operator token for the /metrics routes, sent as X-Metrics-Token; the
+    # routes 404 without one
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # per-request SQL counts and phase timings, see request_metrics.py
+    REQUEST_METRICS = env_bool('REQUEST_METRICS', True)
+    SERVER_TIMING = env_bool('SERVER_TIMING', True)
+    N_PLUS_ONE_THRESHOLD = env_int('N_PLUS_ONE_THRESHOLD', 10)
+
+    # JSON encoder, see json_provider.py: "auto", "orjson" or "json"
+    JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto')
+
+    # gzip/brotli response compression, see compression.py
+    COMPRESSION = env_bool('COMPRESSION', True)
+    COMPRESSION_MIN_SIZE = env_int('COMPRESSION_MIN_SIZE', 1024)
+    COMPRESSION_GZIP_LEVEL = env_int('COMPRESSION_GZIP_LEVEL', 6)
+    COMPRESSION_BROTLI_QUALITY = env_int('COMPRESSION_BROTLI_QUALITY', 4)
+
+    # shared response cache, see cache.py: "memory", "redis" or "none"
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_TTL = env_int('CACHE_TTL', 60)
+    CACHE_MAX_ENTRIES = env_int('CACHE_MAX_ENTRIES', 1024)
+
+    # dog and command search, see search.py: "auto", "postgres" or "memory"
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+
+    # write-behind buffer for command notes, see note_buffer.py
+    NOTE_BUFFER_SIZE = env_int('NOTE_BUFFER_SIZE', 10000)
+    NOTE_FLUSH_SIZE = env_int('NOTE_FLUSH_SIZE', 500)
+    NOTE_FLUSH_INTERVAL = float(os.environ.get('NOTE_FLUSH_INTERVAL', 1.0))
+
+    # calendar queries, see event_calendar.py
+    CALENDAR_MAX_WINDOW_DAYS = env_int('CALENDAR_MAX_WINDOW_DAYS', 366)
+
+    # async serving mode, see asgi.py: driver used in place of the configured
+    # one, by database
+    ASYNC_DATABASE_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+    # proficiency history series, see history.py
+    HISTORY_MAX_BUCKETS = env_int('HISTORY_MAX_BUCKETS', 366)
+
+
+class DevelopmentConfig(Config):
+    """Local development: SQL echo, debug toolbar and debug logging."""
+
+    DEBUG = True
+    SQLALCHEMY_ECHO = True
+    DEBUG_TOOLBAR = True
+    DEBUG_TB_INTERCEPT_REDIRECTS = False
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG')
+
+
+class TestConfig(Config):
+    """Tests and benchmarks: separate database, quiet logs."""
+
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'test-secret-key')
+    BCRYPT_LOG_ROUNDS = env_int('BCRYPT_LOG_ROUNDS', 4)
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'WARNING')
+
+
+class ProductionConfig(Config):
+    """Production: structured logs written off the request thread, no SQL
+    echo and no debug toolbar."""
+
+    LOG_FORMAT = "json"
+    LOG_ASYNC = True
+    DB_POOL_PRE_PING = env_bool('DB_POOL_PRE_PING', True)
+    DB_POOL_RECYCLE = env_int('DB_POOL_RECYCLE', 1800)
+
+
+configs = {
+    "development": DevelopmentConfig,
+    "test": TestConfig,
+    "production": ProductionConfig,
+}
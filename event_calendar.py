@@ -0,0 +1,104 @@
+"""Calendar queries for FetchFolio API.
+
+An event is on a calendar window [from, to) if it overlaps it:
+start_time < to and end_time > from. Calendars are read through the
+(dog_id, end_time) index: end_time > from bounds the range scan to events
+still running at or after the window starts, so past events are never read
+however many years of history there are, and start_time < to filters the
+rest. Events may last any length of time.
+"""
+
+from datetime import datetime, timedelta
+from flask import current_app, g, request
+from sqlalchemy import select
+from werkzeug.exceptions import BadRequest
+
+from models import db, Dog, Event
+from ownership import get_owned_dog
+
+
+def parse_datetime(name):
+    """Get required ISO 8601 datetime query param name. Raise BadRequest if
+    missing or invalid. Datetimes with a UTC offset are converted to naive
+    UTC, like the stored times."""
+
+    value = request.args.get(name)
+    if not value:
+        raise BadRequest(f"{name} is required.")
+
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be an ISO 8601 datetime.")
+
+    if parsed.tzinfo is not None:
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+
+    return parsed
+
+
+def get_window_args():
+    """Get (from, to) calendar window from the request query string:
+    ?from=2023-10-01T00:00:00&to=2023-11-01T00:00:00
+
+    Raise BadRequest unless from is before to and the window is at most
+    CALENDAR_MAX_WINDOW_DAYS long."""
+
+    start = parse_datetime("from")
+    end = parse_datetime("to")
+    max_days = current_app.config.get("CALENDAR_MAX_WINDOW_DAYS", 366)
+
+    if start >= end:
+        raise BadRequest("from must be before to.")
+
+    if end - start > timedelta(days=max_days):
+        raise BadRequest(f"Window can be at most {max_days} days.")
+
+    return start, end
+
+
+def events_in_window_stmt(start, end, *options):
+    """Return SELECT of events overlapping [start, end), ordered by start
+    time. Loader options are applied to the query."""
+
+    return (
+        select(Event)
+        .options(*options)
+        .where(
+            Event.end_time > start,
+            Event.start_time < end,
+        )
+        .order_by(Event.start_time, Event.id)
+    )
+
+
+def get_dog_events(dog_id, start, end, *options):
+    """Get events of current user's dog with dog_id overlapping [start, end)
+    in one query.
+
+    Raise Unauthorized if dog doesn't exist or is not one of the user's
+    dogs."""
+
+    events = db.session.scalars(
+        events_in_window_stmt(start, end, *options)
+        .join(Dog, Dog.id == Event.dog_id)
+        .where(Dog.id == dog_id, Dog.owner_username == g.username)
+    ).all()
+
+    if not events:
+        # only look up the dog to tell 401 from an empty window
+        get_owned_dog(dog_id)
+
+    return events
+
+
+def get_user_events(start, end, *options):
+    """Get events of all of current user's dogs overlapping [start, end) in
+    one query."""
+
+    return db.session.scalars(
+        events_in_window_stmt(start, end, *options)
+        .join(Dog, Dog.id == Event.dog_id)
+        .where(Dog.owner_username == g.username)
+    ).all()
+
@@ -0,0 +1,123 @@
+"""Password hashing for FetchFolio app.
+
+bcrypt is deliberately slow, so hashes are computed on a small bounded thread
+pool instead of on every request thread at once. When more hashes are waiting
+than the pool can work through, new ones are refused with 429 right away
+rather than queueing without limit; a hash that waits too long fails with 503.
+
+In async mode (see asgi.py) the request awaits the hash on the event loop,
+which goes on serving other requests, instead of blocking while it waits.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import bcrypt
+from sqlalchemy.util import await_only
+from werkzeug.exceptions import TooManyRequests, ServiceUnavailable
+
+DEFAULT_ROUNDS = 12
+
+
+class PasswordHasher:
+    """Hash and check passwords on a bounded executor.
+
+    Settings come from app config in init_app:
+    - BCRYPT_LOG_ROUNDS: bcrypt cost factor for new hashes
+    - PASSWORD_HASH_WORKERS: threads computing hashes
+    - PASSWORD_HASH_MAX_PENDING: hashes running or queued before refusing more
+    - PASSWORD_HASH_TIMEOUT: seconds to wait for a hash before giving up
+    - ASYNC_MODE: await hashes on the event loop, see asgi.py
+    """
+
+    def __init__(self):
+        self.rounds = DEFAULT_ROUNDS
+        self.max_pending = 16
+        self.timeout = 5
+        self.async_mode = False
+        self._executor = self._make_executor(4)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _make_executor(workers):
+        return ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hash")
+
+    def init_app(self, app):
+        """Configure from app config and restart the executor."""
+
+        self.rounds = app.config.get("BCRYPT_LOG_ROUNDS", DEFAULT_ROUNDS)
+        self.max_pending = app.config.get("PASSWORD_HASH_MAX_PENDING", 16)
+        self.timeout = app.config.get("PASSWORD_HASH_TIMEOUT", 5)
+        self.async_mode = app.config.get("ASYNC_MODE", False)
+
+        self._executor.shutdown(wait=False)
+        self._executor = self._make_executor(
+            app.config.get("PASSWORD_HASH_WORKERS", 4))
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _run(self, fn, *args):
+        """Run fn(*args) on the executor and return its result.
+
+        Raise TooManyRequests if max_pending hashes are already waiting, and
+        ServiceUnavailable if the result takes longer than timeout."""
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise TooManyRequests(
+                    "Too many login attempts in progress. Try again shortly.",
+                    retry_after=1,
+                )
+            self._pending += 1
+
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+
+        try:
+            if self.async_mode:
+                return await_only(asyncio.wait_for(
+                    asyncio.wrap_future(future), self.timeout))
+            return future.result(timeout=self.timeout)
+
+        except (TimeoutError, asyncio.TimeoutError):
+            future.cancel()
+            raise ServiceUnavailable(
+                "Password check timed out. Try again shortly.",
+                retry_after=1,
+            )
+
+    def hash(self, password):
+        """Return bcrypt hash of password at the configured cost."""
+
+        return self._run(_hash, password, self.rounds)
+
+    def check(self, hashed, password):
+        """Return True if password matches hashed."""
+
+        return self._run(_check, hashed, password)
+
+    def needs_rehash(self, hashed):
+        """Return True if hashed was made with a different cost factor than
+        the configured one."""
+
+        # bcrypt hashes look like $2b$12$<salt and hash>
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+
+def _hash(password, rounds):
+    salt = bcrypt.gensalt(rounds)
+    return bcrypt.hashpw(password.encode("UTF-8"), salt).decode("UTF-8")
+
+
+def _check(hashed, password):
+    return bcrypt.checkpw(password.encode("UTF-8"), hashed.encode("UTF-8"))
+
+
+password_hasher = PasswordHasher()
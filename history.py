@@ -0,0 +1,366 @@
+"""Proficiency history for FetchFolio API.
+
+Commands only hold their current proficiency, so every change is also
+written to ProficiencyHistory, packed by day: one row per command per (UTC)
+day it changed on, holding the proficiency it ended the day at, the lowest
+and highest it was at that day, and how many changes there were. A command
+changed fifty times in one session still adds one row; years of history are
+at most one row per command per day. Rows for earlier days are never
+touched again, so the table only grows by appending.
+
+Series are read downsampled to "day" or "week" (Monday to Sunday) buckets
+over a window of at most HISTORY_MAX_BUCKETS buckets. A series reads only the
+rows inside the window, by the (command_id, day) primary key or the
+(dog_id, day) index, plus each command's latest row before the window for
+where it started; never the history before that.
+
+Routes that set proficiency call record() in the same transaction as the
+write. Deleting a command or dog deletes its history with it.
+"""
+
+from datetime import date, datetime, timedelta
+from flask import current_app, g, request
+from sqlalchemy import select, func, case, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.exceptions import BadRequest
+
+from models import db, Dog, Command, ProficiencyHistory
+from ownership import get_owned_dog, get_owned_command
+
+BUCKETS = ("day", "week")
+
+
+def parse_date(name, default=None):
+    """Get ISO 8601 date query param name, or default if not given. Raise
+    BadRequest if invalid, or if missing without a default."""
+
+    value = request.args.get(name)
+    if not value:
+        if default is None:
+            raise BadRequest(f"{name} is required.")
+        return default
+
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be an ISO 8601 date.")
+
+
+def bucket_start(day, bucket):
+    """Return first day of the bucket day falls in."""
+
+    return day - timedelta(days=day.weekday()) if bucket == "week" else day
+
+
+def bucket_length(bucket):
+    """Return length of a bucket as a timedelta."""
+
+    return timedelta(weeks=1) if bucket == "week" else timedelta(days=1)
+
+
+def get_series_args():
+    """Get (from, to, bucket) from the request query string:
+    ?from=2023-01-01&to=2023-11-01&bucket=week
+
+    to is exclusive and defaults to tomorrow, so the series runs through
+    today. bucket defaults to "week". from and to are widened to whole
+    buckets.
+
+    Raise BadRequest unless from is before to and the window is at most
+    HISTORY_MAX_BUCKETS buckets long."""
+
+    bucket = request.args.get("bucket", "week")
+    if bucket not in BUCKETS:
+        raise BadRequest(f"bucket must be one of: {', '.join(BUCKETS)}.")
+
+    start = parse_date("from")
+    end = parse_date("to", datetime.utcnow().date() + timedelta(days=1))
+
+    if start >= end:
+        raise BadRequest("from must be before to.")
+
+    length = bucket_length(bucket)
+    start = bucket_start(start, bucket)
+    # round up to the start of the next bucket, unless already on one
+    end = bucket_start(end - timedelta(days=1), bucket) + length
+
+    max_buckets = current_app.config.get("HISTORY_MAX_BUCKETS", 366)
+    if (end - start) / length > max_buckets:
+        raise BadRequest(f"Window can be at most {max_buckets} {bucket}s.")
+
+    return start, end, bucket
+
+
+def record(dog_id, proficiencies):
+    """Add proficiencies, (command id, proficiency) pairs of commands of dog
+    with dog_id, to today's history, in order. Pairs for commands whose
+    proficiency didn't change should be left out. Caller commits."""
+
+    today = datetime.utcnow().date()
+    days = {}
+    for command_id, proficiency in proficiencies:
+        proficiency = int(proficiency)
+        row = days.get(command_id)
+        if row is None:
+            days[command_id] = {
+                "command_id": command_id,
+                "day": today,
+                "dog_id": dog_id,
+                "proficiency": proficiency,
+                "min_proficiency": proficiency,
+                "max_proficiency": proficiency,
+                "changes": 1,
+            }
+        else:
+            row["proficiency"] = proficiency
+            row["min_proficiency"] = min(row["min_proficiency"], proficiency)
+            row["max_proficiency"] = max(row["max_proficiency"], proficiency)
+            row["changes"] += 1
+
+    if not days:
+        return
+
+    dialect = db.session.get_bind().dialect.name
+    insert_stmt = (postgresql if dialect == "postgresql" else sqlite).insert
+
+    # sorted so concurrent upserts lock rows in the same order
+    stmt = insert_stmt(ProficiencyHistory).values(
+        [days[command_id] for command_id in sorted(days)])
+    excluded = stmt.excluded
+
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=["command_id", "day"],
+        set_={
+            "proficiency": excluded.proficiency,
+            "min_proficiency": case(
+                (excluded.min_proficiency < ProficiencyHistory.min_proficiency,
+                 excluded.min_proficiency),
+                else_=ProficiencyHistory.min_proficiency,
+            ),
+            "max_proficiency": case(
+                (excluded.max_proficiency > ProficiencyHistory.max_proficiency,
+                 excluded.max_proficiency),
+                else_=ProficiencyHistory.max_proficiency,
+            ),
+            "changes": ProficiencyHistory.changes + excluded.changes,
+        },
+    ))
+
+
+def history_columns():
+    """Return the ProficiencyHistory columns the series functions read."""
+
+    return (
+        ProficiencyHistory.command_id,
+        ProficiencyHistory.day,
+        ProficiencyHistory.proficiency,
+        ProficiencyHistory.min_proficiency,
+        ProficiencyHistory.max_proficiency,
+        ProficiencyHistory.changes,
+    )
+
+
+def latest_day_before(command_id, start):
+    """Return scalar subquery of the day of the latest history row of command
+    with command_id (a column or value) before start."""
+
+    earlier = ProficiencyHistory.__table__.alias("earlier")
+
+    return (
+        select(func.max(earlier.c.day))
+        .where(earlier.c.command_id == command_id, earlier.c.day < start)
+        .scalar_subquery()
+    )
+
+
+def command_history_rows(dog_id, command_id, username, start, end):
+    """Return history rows of command with command_id, of username's dog with
+    dog_id, from the latest one before start up to end, ordered by day."""
+
+    return db.session.execute(
+        select(*history_columns())
+        .join(Dog, Dog.id == ProficiencyHistory.dog_id)
+        .where(
+            ProficiencyHistory.command_id == command_id,
+            Dog.id == dog_id,
+            Dog.owner_username == username,
+            ProficiencyHistory.day >= func.coalesce(
+                latest_day_before(command_id, start), start),
+            ProficiencyHistory.day < end,
+        )
+        .order_by(ProficiencyHistory.day)
+    ).all()
+
+
+def dog_history_rows(dog_id, username, start, end):
+    """Return history rows of all commands of username's dog with dog_id in
+    [start, end), plus each command's latest row before start, ordered by
+    day. One query; each command's row before start is found through the
+    primary key, not by reading its earlier history."""
+
+    owned = (Dog.id == dog_id, Dog.owner_username == username)
+
+    in_window = (
+        select(*history_columns())
+        .join(Dog, Dog.id == ProficiencyHistory.dog_id)
+        .where(
+            *owned,
+            ProficiencyHistory.day >= start,
+            ProficiencyHistory.day < end,
+        )
+    )
+
+    before_window = (
+        select(*history_columns())
+        .join(Command, Command.id == ProficiencyHistory.command_id)
+        .join(Dog, Dog.id == Command.dog_id)
+        .where(
+            *owned,
+            ProficiencyHistory.day == latest_day_before(Command.id, start),
+        )
+    )
+
+    rows = union_all(in_window, before_window).subquery()
+
+    return db.session.execute(
+        select(rows).order_by(rows.c.day, rows.c.command_id)
+    ).all()
+
+
+def bucket_starts(start, end, bucket):
+    """Return start days of the buckets in [start, end)."""
+
+    length = bucket_length(bucket)
+    starts = []
+    day = start
+    while day < end:
+        starts.append(day)
+        day += length
+
+    return starts
+
+
+def command_series(rows, start, end, bucket):
+    """Return a command's series from its history rows, one point per bucket:
+    [
+        {
+            "date": "2023-10-09",
+            "proficiency": 3,
+            "min_proficiency": 2,
+            "max_proficiency": 3,
+            "changes": 2
+        }, ...
+    ]
+
+    proficiency is where the command ended the bucket; min and max include
+    where it started it. All but changes are null before the command's
+    history starts."""
+
+    series = []
+    rows = iter(rows)
+    row = next(rows, None)
+    current = None
+
+    for day in bucket_starts(start, end, bucket):
+        bucket_end = day + bucket_length(bucket)
+
+        # rows before the window only give where the command started
+        while row is not None and row.day < day:
+            current = row.proficiency
+            row = next(rows, None)
+
+        low = high = current
+        changes = 0
+        while row is not None and row.day < bucket_end:
+            low = row.min_proficiency if low is None \
+                else min(low, row.min_proficiency)
+            high = row.max_proficiency if high is None \
+                else max(high, row.max_proficiency)
+            current = row.proficiency
+            changes += row.changes
+            row = next(rows, None)
+
+        series.append({
+            "date": day.isoformat(),
+            "proficiency": current,
+            "min_proficiency": low,
+            "max_proficiency": high,
+            "changes": changes,
+        })
+
+    return series
+
+
+def dog_series(rows, start, end, bucket):
+    """Return a dog's series from its commands' history rows, one point per
+    bucket:
+    [
+        {
+            "date": "2023-10-09",
+            "commands": 12,
+            "mean_proficiency": 2.08,
+            "changes": 5
+        }, ...
+    ]
+
+    commands counts the commands with history by the end of the bucket and
+    mean_proficiency is their mean proficiency then (null if none)."""
+
+    series = []
+    rows = iter(rows)
+    row = next(rows, None)
+    # command id: its proficiency as of the rows read so far
+    current = {}
+    total = 0
+
+    for day in bucket_starts(start, end, bucket):
+        bucket_end = day + bucket_length(bucket)
+        changes = 0
+
+        while row is not None and row.day < bucket_end:
+            total += row.proficiency - current.get(row.command_id, 0)
+            current[row.command_id] = row.proficiency
+            if row.day >= start:
+                changes += row.changes
+            row = next(rows, None)
+
+        series.append({
+            "date": day.isoformat(),
+            "commands": len(current),
+            "mean_proficiency":
+                round(total / len(current), 2) if current else None,
+            "changes": changes,
+        })
+
+    return series
+
+
+def get_command_series(dog_id, command_id, start, end, bucket):
+    """Get series of current user's dog with dog_id's command with
+    command_id, see command_series.
+
+    Raise Unauthorized if dog is not one of the user's dogs. Abort with 404 if
+    command is not one of the dog's commands."""
+
+    rows = command_history_rows(dog_id, command_id, g.username, start, end)
+
+    if not rows:
+        # only look up the command to tell 401 and 404 from no history
+        get_owned_command(dog_id, command_id)
+
+    return command_series(rows, start, end, bucket)
+
+
+def get_dog_series(dog_id, start, end, bucket):
+    """Get series of current user's dog with dog_id, see dog_series.
+
+    Raise Unauthorized if dog doesn't exist or is not one of the user's
+    dogs."""
+
+    rows = dog_history_rows(dog_id, g.username, start, end)
+
+    if not rows:
+        # only look up the dog to tell 401 from no history
+        get_owned_dog(dog_id)
+
+    return dog_series(rows, start, end, bucket)
@@ -0,0 +1,232 @@
+"""iCalendar (.ics) event feeds for FetchFolio API.
+
+Calendar apps subscribe to a feed URL and poll it every few minutes, sending
+no Authorization header, so the URL carries a feed token (see
+User.create_feed_token) that can only read feeds.
+
+The feed version functions are both the token check and the conditional
+version: one aggregate query returns the user's token version plus the count
+and latest date_updated of the events (and dogs) in the feed. A poll that
+finds nothing changed gets a 304 after that single query.
+
+Otherwise the feed is written out while it is read: events come from a
+server-side cursor in batches of STREAM_BATCH_SIZE and each batch is turned
+into VEVENT lines and sent, so a feed is never built up in memory.
+"""
+
+import jwt
+from flask import current_app, request, stream_with_context
+from sqlalchemy import select, func
+from werkzeug.exceptions import Unauthorized
+
+from models import db, User, Dog, Event
+from pagination import STREAM_BATCH_SIZE
+
+PRODID = "-//FetchFolio//FetchFolio API//EN"
+
+# UIDs must stay the same across polls whatever host the feed is read from
+UID_DOMAIN = "fetchfolio"
+
+# content lines longer than this many octets are folded, RFC 5545 3.1
+MAX_LINE_OCTETS = 75
+
+
+def feed_claims():
+    """Return claims of the request's ?token= feed token.
+
+    Raise Unauthorized if it is missing or invalid."""
+
+    token = request.args.get("token")
+    if not token:
+        raise Unauthorized("Feed token is required.")
+
+    try:
+        return User.decode_feed_token(token)
+    except jwt.InvalidTokenError:
+        raise Unauthorized("Invalid feed token.")
+
+
+def check_version(claims, row):
+    """Raise Unauthorized unless row, whose first value is the owner's token
+    version, exists and matches the token's."""
+
+    if row is None or row[0] != claims["ver"]:
+        raise Unauthorized("Invalid feed token.")
+
+
+def user_feed_version(username):
+    """Return version of username's events feed, for conditional.
+
+    Raise Unauthorized unless the request has a current feed token for
+    username."""
+
+    claims = feed_claims()
+    if claims["username"] != username:
+        raise Unauthorized("Invalid feed token.")
+
+    row = db.session.execute(
+        select(
+            User.token_version,
+            func.count(Event.id),
+            func.max(Event.date_updated),
+            func.max(Dog.date_updated),
+        )
+        .select_from(User)
+        .outerjoin(Dog, Dog.owner_username == User.username)
+        .outerjoin(Event, Event.dog_id == Dog.id)
+        .where(User.username == username)
+        .group_by(User.token_version)
+    ).first()
+
+    check_version(claims, row)
+    return tuple(row[1:])
+
+
+def dog_feed_version(dog_id):
+    """Return version of events feed of dog with dog_id, for conditional.
+
+    Raise Unauthorized unless the request has a current feed token for the
+    dog's owner."""
+
+    claims = feed_claims()
+
+    row = db.session.execute(
+        select(
+            User.token_version,
+            Dog.date_updated,
+            func.count(Event.id),
+            func.max(Event.date_updated),
+        )
+        .select_from(Dog)
+        .join(User, User.username == Dog.owner_username)
+        .outerjoin(Event, Event.dog_id == Dog.id)
+        .where(Dog.id == dog_id, Dog.owner_username == claims["username"])
+        .group_by(User.token_version, Dog.date_updated)
+    ).first()
+
+    check_version(claims, row)
+    return tuple(row[1:])
+
+
+def escape_text(value):
+    """Return value escaped as an iCalendar TEXT value."""
+
+    return (
+        value.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def format_datetime(value):
+    """Return naive UTC datetime value as an iCalendar UTC DATE-TIME."""
+
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def fold(line):
+    """Return content line with CRLF, folded so no line is longer than
+    MAX_LINE_OCTETS octets. Never splits a UTF-8 character."""
+
+    if len(line) * 4 <= MAX_LINE_OCTETS:
+        return line + "\r\n"
+
+    parts = []
+    part = ""
+    size = 0
+
+    for char in line:
+        char_size = len(char.encode("UTF-8"))
+        if size + char_size > MAX_LINE_OCTETS:
+            parts.append(part)
+            # continuation lines start with a space, which counts too
+            part = " "
+            size = 1
+        part += char
+        size += char_size
+
+    parts.append(part)
+    return "\r\n".join(parts) + "\r\n"
+
+
+def event_lines(event_id, title, start_time, end_time, location, event_type,
+                date_updated):
+    """Return folded content lines of one VEVENT."""
+
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:event-{event_id}@{UID_DOMAIN}",
+        f"DTSTAMP:{format_datetime(date_updated)}",
+        f"DTSTART:{format_datetime(start_time)}",
+        f"DTEND:{format_datetime(end_time)}",
+        f"SUMMARY:{escape_text(title)}",
+    ]
+    if location:
+        lines.append(f"LOCATION:{escape_text(location)}")
+    lines.append(f"CATEGORIES:{escape_text(event_type)}")
+    lines.append("END:VEVENT")
+
+    return "".join(fold(line) for line in lines)
+
+
+def feed_stmt():
+    """Return SELECT of the columns event_lines takes, ordered by start time.
+    Callers add the join and filter for whose events are in the feed."""
+
+    return (
+        select(
+            Event.id,
+            Event.title,
+            Event.start_time,
+            Event.end_time,
+            Event.location,
+            Event.type,
+            Event.date_updated,
+        )
+        .order_by(Event.start_time, Event.id)
+        .execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+
+
+def user_feed_stmt(username):
+    """Return SELECT of events of all of username's dogs."""
+
+    return (
+        feed_stmt()
+        .join(Dog, Dog.id == Event.dog_id)
+        .where(Dog.owner_username == username)
+    )
+
+
+def dog_feed_stmt(dog_id):
+    """Return SELECT of events of dog with dog_id."""
+
+    return feed_stmt().where(Event.dog_id == dog_id)
+
+
+def feed_response(stmt, name):
+    """Return response streaming a VCALENDAR named name with a VEVENT per
+    row of stmt."""
+
+    def generate():
+        yield "".join(fold(line) for line in (
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            f"PRODID:{PRODID}",
+            "CALSCALE:GREGORIAN",
+            "METHOD:PUBLISH",
+            f"X-WR-CALNAME:{escape_text(name)}",
+        ))
+
+        result = db.session.execute(stmt)
+        for batch in result.partitions():
+            yield "".join(event_lines(*row) for row in batch)
+
+        yield fold("END:VCALENDAR")
+
+    return current_app.response_class(
+        stream_with_context(generate()),
+        mimetype="text/calendar",
+    )
@@ -0,0 +1,144 @@
+"""Loading plans for FetchFolio API routes.
+
+Each plan is a tuple of SQLAlchemy loader options that eagerly loads the
+relationships a schema dump walks, restricted to the columns that schema
+outputs. Passing a plan to a query makes a dump take a fixed number of
+queries however many commands or notes a dog has.
+
+List and detail routes also take sparse fieldsets: ?fields= picks the columns
+and ?include= the relationships to return, from the route's whitelist (the
+*_FIELDS tuples below, and the route's includes). fields_plan() turns them
+into loader options that select only those columns, and the route serializes
+with the same names as only=, so columns nobody asked for are neither read
+nor sent. Columns not in a whitelist, like users.password, can't be asked
+for at all."""
+
+from flask import request
+from sqlalchemy.orm import selectinload, load_only
+from werkzeug.exceptions import BadRequest
+
+from models import (User, UserSchema, Dog, DogSchema, Command, CommandSchema,
+                    CommandNote)
+
+# Fields ?fields= may ask for, per resource
+USER_FIELDS = (
+    "username", "name", "email", "bio", "location", "user_image_url")
+DOG_FIELDS = (
+    "id", "name", "birth_date", "breed", "size", "bio", "image_url",
+    "private", "owner_username")
+COMMAND_FIELDS = (
+    "id", "name", "date_introduced", "date_updated", "description",
+    "voice_command", "command_video_url", "proficiency", "type")
+
+
+def schema_columns(model, field_names):
+    """Return model column attributes named in field_names. Relationships and
+    names that are not columns on the model are skipped."""
+
+    columns = model.__table__.columns
+    return [getattr(model, name) for name in field_names if name in columns]
+
+
+def nested_only(schema_class, field_name):
+    """Return the only= field names of a nested field on schema_class."""
+
+    return schema_class._declared_fields[field_name].only
+
+
+def get_names_arg(param, allowed):
+    """Get names from comma-separated query param, as a tuple in the order of
+    allowed, or None if param is not given.
+
+    Raise BadRequest if a name is not in allowed."""
+
+    value = request.args.get(param)
+    if value is None:
+        return None
+
+    requested = set(value.split(",")) - {""}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise BadRequest(f"Unknown {param}: {', '.join(sorted(unknown))}.")
+
+    return tuple(name for name in allowed if name in requested)
+
+
+def get_fields_arg(allowed, default=None):
+    """Get field names from the request's ?fields=id,title,... query param,
+    as a tuple in the order of allowed. Defaults to default, or all of
+    allowed.
+
+    Raise BadRequest if a field is not in allowed."""
+
+    fields = get_names_arg("fields", allowed)
+    if not fields:
+        return tuple(default or allowed)
+
+    return fields
+
+
+def get_include_arg(allowed, default=()):
+    """Get relationship names from the request's ?include=commands,... query
+    param, as a tuple in the order of allowed. Defaults to default; an empty
+    ?include= includes none.
+
+    Raise BadRequest if a relationship is not in allowed."""
+
+    includes = get_names_arg("include", allowed)
+    if includes is None:
+        return tuple(default)
+
+    return includes
+
+
+def fields_plan(model, field_names, includes=()):
+    """Return loader options loading only the columns of model named in
+    field_names, plus the primary key, and the relationships named in
+    includes as in INCLUDE_PLANS."""
+
+    options = [load_only(*schema_columns(model, field_names))]
+    for name in includes:
+        options.extend(INCLUDE_PLANS[model, name])
+
+    return tuple(options)
+
+
+def command_list_plan(field_names, includes):
+    """Return loader options for a dog whose commands are listed with
+    field_names and includes. The dog itself is only needed for its id."""
+
+    return (
+        load_only(Dog.id),
+        selectinload(Dog.commands).options(
+            *fields_plan(Command, field_names, includes)),
+    )
+
+
+# GET /dogs/current/<dog_id>, POST /dogs/current, PATCH /dog/current/<dog_id>:
+# dog with commands as listed in DogSchema.commands
+DOG_DETAIL_PLAN = (
+    selectinload(Dog.commands).load_only(
+        *schema_columns(Command, nested_only(DogSchema, "commands"))
+    ),
+)
+
+# command detail routes: command with notes as listed in CommandSchema.notes
+COMMAND_DETAIL_PLAN = (
+    selectinload(Command.notes).load_only(
+        *schema_columns(CommandNote, nested_only(CommandSchema, "notes"))
+    ),
+)
+
+# GET /users/current: user with their dogs as listed in UserSchema.dogs
+USER_DETAIL_PLAN = (
+    selectinload(User.dogs).load_only(
+        *schema_columns(Dog, nested_only(UserSchema, "dogs"))
+    ),
+)
+
+# loader options for each relationship ?include= can name, by (model, name)
+INCLUDE_PLANS = {
+    (User, "dogs"): USER_DETAIL_PLAN,
+    (Dog, "commands"): DOG_DETAIL_PLAN,
+    (Command, "notes"): COMMAND_DETAIL_PLAN,
+}
@@ -0,0 +1,57 @@
+"""add dog and command search indexes
+
+Revision ID: 115457c60f2a
+Revises: 2b918d57aff4
+Create Date: 2026-10-17 22:42:56.019522
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '115457c60f2a'
+down_revision = '2b918d57aff4'
+branch_labels = None
+depends_on = None
+
+# DOG_SEARCH_DOCUMENT and COMMAND_SEARCH_DOCUMENT in models.py; queries only
+# use the indexes if they repeat these expressions exactly
+DOG_SEARCH_DOCUMENT = (
+    "(setweight(to_tsvector('simple'::regconfig, name), 'A') "
+    "|| setweight(to_tsvector('simple'::regconfig, breed), 'B')) "
+    "|| setweight(to_tsvector('simple'::regconfig, bio), 'C')"
+)
+COMMAND_SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('simple'::regconfig, name), 'A') "
+    "|| setweight(to_tsvector('simple'::regconfig, description), 'B')"
+)
+
+
+def upgrade():
+    # Text search indexes only exist on PostgreSQL; other databases search
+    # in memory. Build them without locking writes; CONCURRENTLY can't run
+    # inside a transaction, hence the autocommit block.
+    if op.get_context().dialect.name != 'postgresql':
+        return
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_dogs_search', 'dogs', [sa.text(f"({DOG_SEARCH_DOCUMENT})")],
+            postgresql_using='gin', postgresql_concurrently=True)
+        op.create_index(
+            'ix_commands_search', 'commands',
+            [sa.text(f"({COMMAND_SEARCH_DOCUMENT})")],
+            postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade():
+    if op.get_context().dialect.name != 'postgresql':
+        return
+
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_commands_search', table_name='commands',
+            postgresql_concurrently=True)
+        op.drop_index(
+            'ix_dogs_search', table_name='dogs', postgresql_concurrently=True)
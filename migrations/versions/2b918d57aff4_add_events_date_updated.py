@@ -0,0 +1,35 @@
+"""add events date_updated
+
+Revision ID: 2b918d57aff4
+Revises: 8dea9fbe79d1
+Create Date: 2026-10-17 22:38:19.890433
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b918d57aff4'
+down_revision = '8dea9fbe79d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column('date_updated', sa.DateTime(), nullable=True))
+
+    # existing events count as updated now, in UTC like the app's own dates
+    events = sa.table('events', sa.column('date_updated', sa.DateTime()))
+    op.execute(events.update().values(date_updated=datetime.utcnow()))
+
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.alter_column('date_updated', nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.drop_column('date_updated')
@@ -0,0 +1,27 @@
+"""add users token_version
+
+Revision ID: 6e024490ffff
+Revises: b75ee95c2208
+Create Date: 2026-10-17 22:16:58.637591
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e024490ffff'
+down_revision = 'b75ee95c2208'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column(
+            'token_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('token_version')
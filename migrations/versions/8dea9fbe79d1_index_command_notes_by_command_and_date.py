@@ -0,0 +1,40 @@
+"""index command notes by command and date
+
+Revision ID: 8dea9fbe79d1
+Revises: de0ca670d8e3
+Create Date: 2026-10-17 22:33:59.876980
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8dea9fbe79d1'
+down_revision = 'de0ca670d8e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The new index leads with command_id, so it replaces the old one. Build
+    # it before dropping the old one, without locking writes; CONCURRENTLY
+    # can't run inside a transaction, hence the autocommit block.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_commands_notes_command_id_date_id', 'commands_notes',
+            ['command_id', 'date', 'id'], unique=False,
+            postgresql_concurrently=True)
+        op.drop_index(
+            'ix_commands_notes_command_id', table_name='commands_notes',
+            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_commands_notes_command_id', 'commands_notes', ['command_id'],
+            unique=False, postgresql_concurrently=True)
+        op.drop_index(
+            'ix_commands_notes_command_id_date_id',
+            table_name='commands_notes', postgresql_concurrently=True)
@@ -0,0 +1,46 @@
+"""add filter and foreign key indexes
+
+Revision ID: 92557462e15f
+Revises: 6e024490ffff
+Create Date: 2026-10-17 22:17:09.541774
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '92557462e15f'
+down_revision = '6e024490ffff'
+branch_labels = None
+depends_on = None
+
+
+# (name, table, columns, extra create_index kwargs)
+INDEXES = [
+    ('ix_dogs_owner_username', 'dogs', ['owner_username'], {}),
+    ('ix_dogs_public_id', 'dogs', ['id'], {
+        'postgresql_where': sa.text('NOT private'),
+        'sqlite_where': sa.text('NOT private'),
+    }),
+    ('ix_commands_dog_id', 'commands', ['dog_id'], {}),
+    ('ix_commands_notes_command_id', 'commands_notes', ['command_id'], {}),
+    ('ix_events_dog_id_start_time', 'events', ['dog_id', 'start_time'], {}),
+    ('ix_events_start_time', 'events', ['start_time'], {}),
+]
+
+
+def upgrade():
+    # Build indexes without locking writes on existing tables. CONCURRENTLY
+    # can't run inside a transaction, hence the autocommit block.
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in INDEXES:
+            op.create_index(
+                name, table, columns, unique=False,
+                postgresql_concurrently=True, **kwargs)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,35 @@
+"""add dogs date_updated
+
+Revision ID: de0ca670d8e3
+Revises: 7fa24831322b
+Create Date: 2026-10-17 22:28:55.332597
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'de0ca670d8e3'
+down_revision = '7fa24831322b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('dogs', schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column('date_updated', sa.DateTime(), nullable=True))
+
+    # existing dogs count as updated now, in UTC like the app's own dates
+    dogs = sa.table('dogs', sa.column('date_updated', sa.DateTime()))
+    op.execute(dogs.update().values(date_updated=datetime.utcnow()))
+
+    with op.batch_alter_table('dogs', schema=None) as batch_op:
+        batch_op.alter_column('date_updated', nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('dogs', schema=None) as batch_op:
+        batch_op.drop_column('date_updated')
@@ -2,28 +2,161 @@
  
 import os
 from dotenv import load_dotenv
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from sqlalchemy import MetaData, event, update, func
+from sqlalchemy.engine import Engine, make_url
+import sqlite3
 from flask_marshmallow import Marshmallow
 from marshmallow import fields
 from datetime import datetime, timedelta
-from flask_bcrypt import Bcrypt
 from werkzeug.exceptions import BadRequest, Unauthorized
 import jwt
 
+from pool_metrics import InstrumentedQueuePool, InstrumentedAsyncQueuePool
+from hashing import password_hasher
+
 load_dotenv()
 
-bcrypt = Bcrypt()
-db = SQLAlchemy()
+# Match PostgreSQL's default constraint names so migrations can refer to
+# constraints in databases created before migrations were added.
+NAMING_CONVENTION = {
+    "ix": "ix_%(column_0_label)s",
+    "uq": "%(table_name)s_%(column_0_name)s_key",
+    "fk": "%(table_name)s_%(column_0_name)s_fkey",
+    "pk": "%(table_name)s_pkey",
+}
+
+db = SQLAlchemy(metadata=MetaData(naming_convention=NAMING_CONVENTION))
 ma = Marshmallow()
+migrate = Migrate()
+
+# Tokens are checked without a database lookup, so keep them short-lived. A
+# password change revokes older ones (see auth_middleware.token_revocations).
+TOKEN_EXPIRATION = timedelta(
+    minutes=int(os.environ.get('TOKEN_EXPIRATION_MINUTES', 60))
+)
+
+# Text search configuration for the PostgreSQL search indexes: "simple", since
+# "english" drops stop words like "down" and "off", which are dog commands.
+# Written out as a literal so queries repeat the indexed expressions exactly.
+SEARCH_CONFIG = db.text("'simple'::regconfig")
+
+def search_document(*weighted_columns):
+    """Return a tsvector expression of (column, weight) pairs, weight being
+    "A" (counts most in ranking) to "D"."""
+
+    document = None
+    for column, weight in weighted_columns:
+        vector = func.setweight(
+            func.to_tsvector(SEARCH_CONFIG, column),
+            db.text(f"'{weight}'"),
+        )
+        document = vector if document is None else document.op("||")(vector)
+
+    return document
+
+def engine_options(config):
+    """Build SQLAlchemy engine options from app config:
+    - DB_POOL_SIZE: connections kept open in the pool
+    - DB_MAX_OVERFLOW: extra connections allowed under burst load
+    - DB_POOL_TIMEOUT: seconds to wait for a connection before failing
+    - DB_POOL_RECYCLE: seconds after which a connection is replaced
+    - DB_POOL_PRE_PING: test connections before handing them out
+    - DB_STATEMENT_TIMEOUT: per-statement timeout in ms (PostgreSQL)
+
+    Settings left as None keep SQLAlchemy's defaults. Pool settings don't
+    apply to SQLite."""
+
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+
+    if backend == 'sqlite':
+        return options
+
+    pool_settings = {
+        'pool_size': config.get('DB_POOL_SIZE'),
+        'max_overflow': config.get('DB_MAX_OVERFLOW'),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT'),
+        'pool_recycle': config.get('DB_POOL_RECYCLE'),
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING'),
+    }
+    options.update(
+        {key: value for key, value in pool_settings.items() if value is not None}
+    )
+    # async drivers need a pool that waits for connections without blocking
+    # the event loop
+    options.setdefault(
+        'poolclass',
+        InstrumentedAsyncQueuePool if config.get('ASYNC_MODE')
+        else InstrumentedQueuePool)
+
+    # send executemany UPDATEs in pages rather than one round trip per row
+    if url.get_driver_name() == 'psycopg2':
+        options.setdefault('executemany_mode', 'values_plus_batch')
+
+    statement_timeout = config.get('DB_STATEMENT_TIMEOUT')
+    if statement_timeout and backend == 'postgresql':
+        connect_args = dict(options.get('connect_args', {}))
+        if url.get_driver_name() == 'asyncpg':
+            connect_args['server_settings'] = {
+                'statement_timeout': str(statement_timeout)}
+        else:
+            connect_args['options'] = f"-c statement_timeout={statement_timeout}"
+        options['connect_args'] = connect_args
+
+    return options
+
+
+def async_database_uri(config):
+    """Return SQLALCHEMY_DATABASE_URI with its driver swapped for the async
+    one ASYNC_DATABASE_DRIVERS gives for the database, see asgi.py."""
+
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    driver = config['ASYNC_DATABASE_DRIVERS'].get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(
+            f"No async driver for {url.get_backend_name()} databases")
+
+    return url.set(
+        drivername=f"{url.get_backend_name()}+{driver}"
+    ).render_as_string(hide_password=False)
 
-SECRET_KEY = os.environ['SECRET_KEY']
 
 def connect_db(app):
-    """Connect to database."""
+    """Connect to database. Engine and pool options are read from app config,
+    see engine_options. In async mode the database is reached through an
+    async driver, see asgi.py."""
+
+    if app.config.get('ASYNC_MODE'):
+        app.config['SQLALCHEMY_DATABASE_URI'] = async_database_uri(app.config)
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
 
-    app.app_context().push()
     db.app = app
     db.init_app(app)
+    migrate.init_app(app, db)
+
+
+def is_sqlite_connection(dbapi_connection):
+    """Return True for sqlite3 connections, and for aiosqlite's adapted ones
+    in async mode."""
+
+    return isinstance(dbapi_connection, sqlite3.Connection) or (
+        type(dbapi_connection).__module__
+        == "sqlalchemy.dialects.sqlite.aiosqlite")
+
+
+@event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite ignores foreign keys (and ON DELETE CASCADE) unless asked."""
+
+    if is_sqlite_connection(dbapi_connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
 
 DEFAULT_IMAGE_URL = "https://paradepets.com/.image/c_limit%2Ccs_srgb%2Cq_auto:good%2Cw_760/MTkxMzY1Nzg4MTM2NzExNzc4/teacup-dogs-jpg.webp"
 
@@ -33,6 +166,12 @@ class CommandNote(db.Model):
 
     __tablename__ = 'commands_notes'
 
+    # a command's notes are read newest first
+    __table_args__ = (
+        db.Index(
+            "ix_commands_notes_command_id_date_id", "command_id", "date", "id"),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True,
@@ -52,7 +191,7 @@ class CommandNote(db.Model):
 
     command_id = db.Column(
         db.Integer,
-        db.ForeignKey('commands.id'),
+        db.ForeignKey('commands.id', ondelete='CASCADE'),
         nullable=False,
     )
 
@@ -138,18 +277,36 @@ class Command(db.Model):
 
     dog_id = db.Column(
         db.Integer,
-        db.ForeignKey('dogs.id'),
+        db.ForeignKey('dogs.id', ondelete='CASCADE'),
         nullable=False,
+        index=True,
     )
 
-    notes = db.relationship("CommandNote", backref="command")
+    notes = db.relationship(
+        "CommandNote",
+        backref="command",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
     # dog = relationship from command to the dog
 
     def update_date(self):
         """Update date_updated to current date."""
 
-        self.date_updated = datetime.utcnow
+        self.date_updated = datetime.utcnow()
+
+
+# full-text search over commands, see search.py
+COMMAND_SEARCH_DOCUMENT = search_document(
+    (Command.__table__.c.name, "A"),
+    (Command.__table__.c.description, "B"),
+)
+
+db.Index(
+    "ix_commands_search", COMMAND_SEARCH_DOCUMENT, postgresql_using="gin",
+    info={"autogenerate": False},
+).ddl_if(dialect="postgresql")
 
 
 class CommandSchema(ma.SQLAlchemyAutoSchema):
@@ -179,6 +336,135 @@ class CommandSchema(ma.SQLAlchemyAutoSchema):
     )
 
 
+class DogTrainingSummary(db.Model):
+    """How many of a dog's commands are of one type at one proficiency. Kept
+    up to date by the command routes, see summaries.py."""
+
+    __tablename__ = 'dogs_training_summaries'
+
+    dog_id = db.Column(
+        db.Integer,
+        db.ForeignKey('dogs.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    type = db.Column(
+        db.String(10),
+        db.ForeignKey('commands_types.type'),
+        primary_key=True,
+    )
+
+    proficiency = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    # rows stay at 0 when their last command goes, so date_updated still
+    # tells when the dog's training last changed
+    count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    date_updated = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+
+class UserTrainingSummary(db.Model):
+    """How many of all of a user's dogs' commands are of one type at one
+    proficiency. Kept up to date by the command routes, see summaries.py."""
+
+    __tablename__ = 'users_training_summaries'
+
+    owner_username = db.Column(
+        db.String(50),
+        db.ForeignKey('users.username', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    type = db.Column(
+        db.String(10),
+        db.ForeignKey('commands_types.type'),
+        primary_key=True,
+    )
+
+    proficiency = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    date_updated = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+
+class ProficiencyHistory(db.Model):
+    """A command's proficiency changes on one day (UTC), packed into one row:
+    the proficiency it ended the day at, the lowest and highest it was at that
+    day, and how many times it changed. Only rows for the current day are
+    ever updated. See history.py."""
+
+    __tablename__ = 'commands_proficiency_history'
+
+    # a dog's history is read by day range
+    __table_args__ = (
+        db.Index(
+            "ix_commands_proficiency_history_dog_id_day", "dog_id", "day"),
+    )
+
+    command_id = db.Column(
+        db.Integer,
+        db.ForeignKey('commands.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    day = db.Column(
+        db.Date,
+        primary_key=True,
+    )
+
+    # a command's dog never changes; kept here so a dog's history is read
+    # without going through its commands
+    dog_id = db.Column(
+        db.Integer,
+        db.ForeignKey('dogs.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+
+    proficiency = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+    min_proficiency = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+    max_proficiency = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+    changes = db.Column(
+        db.Integer,
+        nullable=False,
+        default=1,
+    )
+
+
 class CommandTemplate(db.Model):
     """CommandTemplate class."""
 
@@ -235,6 +521,24 @@ class CommandTemplate(db.Model):
         db.ForeignKey('commands_types.type'),
         nullable=False,
     )
+
+
+class CommandTemplateSchema(ma.SQLAlchemyAutoSchema):
+    """CommandTemplate schema."""
+
+    class Meta():
+        model = CommandTemplate
+        fields = (
+            "id",
+            "name",
+            "description",
+            "voice_command",
+            "visual_command",
+            "command_video_url",
+            "proficiency",
+            "performance_video_url",
+            "type",
+            )
     
 
 class CommandType(db.Model):
@@ -253,6 +557,12 @@ class Event(db.Model):
 
     __tablename__ = "events"
 
+    __table_args__ = (
+        db.Index("ix_events_dog_id_start_time", "dog_id", "start_time"),
+        # calendar windows are range scans on end_time (see event_calendar.py)
+        db.Index("ix_events_dog_id_end_time", "dog_id", "end_time"),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True,
@@ -266,13 +576,14 @@ class Event(db.Model):
     start_time = db.Column(
         db.DateTime,
         nullable=False,
-        default=datetime.utcnow
+        default=datetime.utcnow,
+        index=True,
     )
 
     end_time = db.Column(
         db.DateTime,
         nullable=False,
-        default=datetime.utcnow() + timedelta(hours=1),
+        default=lambda: datetime.utcnow() + timedelta(hours=1),
     )
 
     location = db.Column(
@@ -281,9 +592,17 @@ class Event(db.Model):
         default='',
     )
 
+    # versions the calendar feeds the event is in, see ical_feed.py
+    date_updated = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+    )
+
     dog_id = db.Column(
         db.Integer,
-        db.ForeignKey('dogs.id'),
+        db.ForeignKey('dogs.id', ondelete='CASCADE'),
         nullable=False,
     )
 
@@ -299,8 +618,9 @@ class Event(db.Model):
 class EventSchema(ma.SQLAlchemyAutoSchema):
     """Event schema."""
 
-    model = Event
-    fields = ("id", "title", "start_time", "end_time", "location", "dog_id", "type")
+    class Meta():
+        model = Event
+        fields = ("id", "title", "start_time", "end_time", "location", "dog_id", "type")
 
 
 class EventType(db.Model):
@@ -319,6 +639,16 @@ class Dog(db.Model):
 
     __tablename__ = 'dogs'
 
+    # public dog directory only reads dogs that aren't private
+    __table_args__ = (
+        db.Index(
+            "ix_dogs_public_id",
+            "id",
+            postgresql_where=db.text("NOT private"),
+            sqlite_where=db.text("NOT private"),
+        ),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True,
@@ -363,36 +693,63 @@ class Dog(db.Model):
         default=True,
     )
 
+    # with the commands' date_updated, this versions the dog's responses
+    date_updated = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+    )
+
     owner_username = db.Column(
         db.String(50),
-        db.ForeignKey('users.username'),
+        db.ForeignKey('users.username', ondelete='CASCADE'),
         nullable=False,
+        index=True,
     )
 
-    commands = db.relationship("Command", backref="dog")
+    commands = db.relationship(
+        "Command",
+        backref="dog",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
-    events = db.relationship("Event", backref="dog")
+    events = db.relationship(
+        "Event",
+        backref="dog",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
     # owner = relationship from a dog to it's owner(user)
 
-    def serialize(self):
-        """Make a dictionary of current dog instance."""
-
-        dog = {
-            "id": self.id,
-            "name": self.name,
-            "birth_date": self.birth_date,
-            "breed": self.breed,
-            "size": self.size,
-            "bio": self.bio,
-            "image_url": self.image_url,
-            "private": self.private,
-            "owner_username": self.owner_username,
-        }
-        
-        return dog
+    @classmethod
+    def touch(cls, dog_id):
+        """Set date_updated of dog with dog_id to now, for changes to the dog's
+        commands that don't leave a newer command date_updated behind (like a
+        delete)."""
+
+        db.session.execute(
+            update(cls)
+            .where(cls.id == dog_id)
+            .values(date_updated=datetime.utcnow())
+        )
     
     
+# full-text search over dogs, see search.py
+DOG_SEARCH_DOCUMENT = search_document(
+    (Dog.__table__.c.name, "A"),
+    (Dog.__table__.c.breed, "B"),
+    (Dog.__table__.c.bio, "C"),
+)
+
+db.Index(
+    "ix_dogs_search", DOG_SEARCH_DOCUMENT, postgresql_using="gin",
+    info={"autogenerate": False},
+).ddl_if(dialect="postgresql")
+
+
 class DogSchema(ma.SQLAlchemyAutoSchema):
     """Dog schema."""
 
@@ -464,13 +821,24 @@ class User(db.Model):
         default=DEFAULT_IMAGE_URL,
     )
 
-    dogs = db.relationship("Dog", backref='owner')
+    token_version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    dogs = db.relationship(
+        "Dog",
+        backref='owner',
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
     @classmethod
     def signup(cls, username, password, name, email, user_image_url):
         """Sign up user. Hashes password and adds user to database."""
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = password_hasher.hash(password)
 
         user = User(
             username=username,
@@ -488,49 +856,105 @@ class User(db.Model):
         """Log in user. Find user with "username" and "password" and return that
         user.
         
-        If there is no matching username or the password is wrong, return false."""
+        If there is no matching username or the password is wrong, return false.
+
+        If the stored hash was made with a different bcrypt cost than the
+        configured one, rehash the password; caller commits."""
 
         user = cls.query.filter_by(username=username).first()
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
+            is_auth = password_hasher.check(user.password, password)
             if is_auth:
+                if password_hasher.needs_rehash(user.password):
+                    user.password = password_hasher.hash(password)
                 return user
         
         return False
     
     @classmethod
-    def create_token(cls, username):
-        """Create a JWT for user and return."""
+    def create_token(cls, user):
+        """Create a short-lived JWT for user and return.
+
+        Claims: username, token version ("ver"), issued at and expiry."""
+
+        now = datetime.utcnow()
+        claims = {
+            "username": user.username,
+            "ver": user.token_version or 0,
+            "iat": now,
+            "exp": now + TOKEN_EXPIRATION,
+        }
+
+        return jwt.encode(
+            claims, current_app.config['SECRET_KEY'], algorithm="HS256")
+
+    @classmethod
+    def decode_token(cls, token):
+        """Verify JWT signature and expiry and return its claims. Does not
+        touch the database.
+
+        Raises jwt.InvalidTokenError if token is invalid or expired."""
+
+        return jwt.decode(
+            token,
+            current_app.config['SECRET_KEY'],
+            algorithms=["HS256"],
+            options={"require": ["username", "ver", "exp"]},
+        )
+
+    @classmethod
+    def create_feed_token(cls, user):
+        """Create a JWT that only reads user's calendar feeds and return.
 
-        return jwt.encode({"username": username}, SECRET_KEY, algorithm="HS256")
+        Calendar apps keep a feed URL for good, so it has no expiry; like
+        other tokens, it is revoked when user's token version changes.
+
+        Claims: username, token version ("ver"), scope "feed", issued at."""
+
+        claims = {
+            "username": user.username,
+            "ver": user.token_version or 0,
+            "scope": "feed",
+            "iat": datetime.utcnow(),
+        }
+
+        return jwt.encode(
+            claims, current_app.config['SECRET_KEY'], algorithm="HS256")
+
+    @classmethod
+    def decode_feed_token(cls, token):
+        """Verify feed JWT signature and scope and return its claims. Does not
+        touch the database; caller checks the token version.
+
+        Raises jwt.InvalidTokenError if token is not a valid feed token."""
+
+        claims = jwt.decode(
+            token,
+            current_app.config['SECRET_KEY'],
+            algorithms=["HS256"],
+            options={"require": ["username", "ver", "scope"]},
+        )
+
+        if claims["scope"] != "feed":
+            raise jwt.InvalidTokenError("Not a feed token.")
+
+        return claims
     
     def update_password(self, old_password, new_password):
         """Check user's old_password. If valid, update user's password to 
         new_password."""
 
-        is_auth = bcrypt.check_password_hash(self.password, old_password)
+        is_auth = password_hasher.check(self.password, old_password)
         if is_auth:
-            hashed_pwd = bcrypt.generate_password_hash(new_password).decode('UTF-8')
+            hashed_pwd = password_hasher.hash(new_password)
             self.password = hashed_pwd
+            # invalidate tokens issued before the password change
+            self.token_version = (self.token_version or 0) + 1
             return self
         
         else:
             raise Unauthorized
-
-    def serialize(self):
-        """Make a dictionary of current user instance."""
-
-        user = {
-            "username": self.username,
-            "name": self.name,
-            "email": self.email,
-            "bio": self.bio,
-            "location": self.location,
-            "user_image_url": self.user_image_url
-            }
-        
-        return user
     
 
 class UserSchema(ma.SQLAlchemyAutoSchema):
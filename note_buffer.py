@@ -0,0 +1,280 @@
+"""Write-behind buffer for command notes.
+
+Notes arrive faster during a training session than one INSERT and commit per
+note can keep up with. The note route checks ownership, then only puts the
+note on a bounded in-process queue and returns 202. A background thread takes
+notes off the queue and writes them in batches: one multi-row INSERT plus one
+UPDATE of the commands' date_updated per batch, and one commit. The thread is
+started by the first note queued, so apps that never take notes (CLI
+commands, tests, migrations) don't run one.
+
+A batch is written when NOTE_FLUSH_SIZE notes are waiting or the oldest
+waiting note is NOTE_FLUSH_INTERVAL seconds old, whichever comes first. When
+NOTE_BUFFER_SIZE notes are already queued, new notes are refused with 503
+and Retry-After rather than growing the queue. On shutdown the queue is
+drained and written before the process exits.
+
+Notes still queued are lost if the process is killed outright, and notes
+appear in reads only once their batch is written.
+
+In async mode (see asgi.py) the database can only be used from the event
+loop, so the flusher thread hands each batch to a runner that writes it
+there.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import ServiceUnavailable
+
+from models import db, Command, CommandNote
+
+logger = logging.getLogger(__name__)
+
+
+class NoteBuffer:
+    """Bounded queue of notes written to the database in batches by a
+    background thread.
+
+    Settings come from app config in init_app:
+    - NOTE_BUFFER_SIZE: notes queued before new ones are refused
+    - NOTE_FLUSH_SIZE: most notes written per batch
+    - NOTE_FLUSH_INTERVAL: seconds a note waits before a partial batch is
+      written
+    """
+
+    def __init__(self):
+        self.app = None
+        self.flush_size = 500
+        self.flush_interval = 1.0
+        self._queue = queue.Queue(maxsize=10000)
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.runner = None
+        self.reset_stats()
+
+    def init_app(self, app):
+        """Configure from app config, stopping (and flushing) any flusher
+        thread started for a previous app. The thread for this app starts
+        with the first note added."""
+
+        self.stop()
+
+        self.app = app
+        self.runner = None
+        self.flush_size = app.config.get("NOTE_FLUSH_SIZE", 500)
+        self.flush_interval = app.config.get("NOTE_FLUSH_INTERVAL", 1.0)
+        self._queue = queue.Queue(
+            maxsize=app.config.get("NOTE_BUFFER_SIZE", 10000))
+
+    def _start(self):
+        """Start the flusher thread if it isn't running."""
+
+        with self._thread_lock:
+            if self._thread is not None:
+                return
+
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="note-buffer", daemon=True)
+            self._thread.start()
+
+    def reset_stats(self):
+        """Zero counters."""
+
+        with self._lock:
+            self.accepted = 0
+            self.rejected = 0
+            self.written = 0
+            self.dropped = 0
+            self.batches = 0
+
+    def add(self, command_id, note):
+        """Queue note for command with command_id, dated now. Return the
+        queued row.
+
+        Raise ServiceUnavailable if the buffer is full."""
+
+        self._start()
+
+        row = {
+            "command_id": command_id,
+            "note": note,
+            "date": datetime.utcnow(),
+        }
+
+        try:
+            self._queue.put_nowait(row)
+
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise ServiceUnavailable(
+                "Too many notes waiting to be saved. Try again shortly.",
+                retry_after=1,
+            )
+
+        with self._lock:
+            self.accepted += 1
+
+        return row
+
+    def _take_batch(self):
+        """Wait for notes and return up to flush_size of them, once the batch
+        is full or the first note has waited flush_interval. Returns early
+        (possibly empty) when stopping."""
+
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.flush_size and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _drain(self):
+        """Return everything left on the queue without waiting."""
+
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._take_batch()
+            if batch:
+                self.write(batch)
+
+        # stopping: write whatever is still queued
+        leftover = self._drain()
+        for start in range(0, len(leftover), self.flush_size):
+            self.write(leftover[start:start + self.flush_size])
+
+    def set_runner(self, runner):
+        """Write batches by calling runner(write, rows) rather than
+        write(rows), e.g. to run them on an event loop."""
+
+        self.runner = runner
+
+    def write(self, rows):
+        """Insert rows in one statement, mark their commands updated, and
+        commit. If some commands were deleted since their notes were queued,
+        their notes are dropped and the rest written."""
+
+        if self.runner is not None:
+            return self.runner(self._write, rows)
+
+        self._write(rows)
+
+    def _write(self, rows):
+        with self.app.app_context():
+            try:
+                try:
+                    self._insert(rows)
+
+                except IntegrityError:
+                    db.session.rollback()
+                    rows = self._without_deleted_commands(rows)
+                    if rows:
+                        self._insert(rows)
+
+            except Exception:
+                db.session.rollback()
+                with self._lock:
+                    self.dropped += len(rows)
+                logger.exception("Could not write %s notes", len(rows))
+                return
+
+            finally:
+                db.session.remove()
+
+        with self._lock:
+            self.written += len(rows)
+            self.batches += 1
+
+    def _without_deleted_commands(self, rows):
+        """Return rows whose command still exists, counting the rest as
+        dropped."""
+
+        command_ids = {row["command_id"] for row in rows}
+        existing = set(db.session.scalars(
+            select(Command.id).where(Command.id.in_(command_ids))
+        ))
+        kept = [row for row in rows if row["command_id"] in existing]
+
+        with self._lock:
+            self.dropped += len(rows) - len(kept)
+        logger.warning(
+            "Dropped %s notes for deleted commands", len(rows) - len(kept))
+
+        return kept
+
+    def _insert(self, rows):
+        db.session.execute(insert(CommandNote), rows)
+
+        # notes are part of the commands' responses; move their versions on
+        db.session.execute(
+            update(Command)
+            .where(Command.id.in_(sorted({row["command_id"] for row in rows})))
+            .values(date_updated=datetime.utcnow())
+        )
+        db.session.commit()
+
+    def stop(self):
+        """Stop the flusher thread after writing every queued note."""
+
+        with self._thread_lock:
+            if self._thread is None:
+                return
+
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def snapshot(self):
+        """Return counters:
+        {
+            "pending": 12,
+            "accepted": 5210,
+            "rejected": 0,
+            "written": 5198,
+            "dropped": 0,
+            "batches": 61
+        }
+        """
+
+        with self._lock:
+            return {
+                "pending": self._queue.qsize(),
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "written": self.written,
+                "dropped": self.dropped,
+                "batches": self.batches,
+            }
+
+
+note_buffer = NoteBuffer()
+
+atexit.register(note_buffer.stop)
@@ -0,0 +1,238 @@
+"""Ownership checks for dog and command routes.
+
+Each lookup resolves user -> dog (-> command) in a single indexed query using
+the username from the token, so no user, dog or command collections are
+loaded just to check access."""
+
+from flask import g, abort
+from datetime import datetime
+from sqlalchemy import select, insert, delete, and_, func, literal
+from werkzeug.exceptions import BadRequest, Unauthorized
+
+from models import db, Dog, Command, CommandTemplate
+
+
+def owned_dog_stmt(dog_id, username, *options):
+    """Return SELECT for dog with dog_id if it belongs to username."""
+
+    return (
+        select(Dog)
+        .options(*options)
+        .where(Dog.id == dog_id, Dog.owner_username == username)
+    )
+
+
+def owned_command_stmt(dog_id, command_id, username, *options):
+    """Return SELECT of (dog id, command) for dog with dog_id belonging to
+    username. Command is None if command_id is not one of the dog's commands;
+    no row is returned if the dog does not belong to username."""
+
+    return (
+        select(Dog.id, Command)
+        .outerjoin(
+            Command,
+            and_(Command.dog_id == Dog.id, Command.id == command_id),
+        )
+        .options(*options)
+        .where(Dog.id == dog_id, Dog.owner_username == username)
+    )
+
+
+def get_owned_dog(dog_id, *options):
+    """Get dog with dog_id for current user. Loader options are applied to the
+    query.
+
+    Raise Unauthorized if dog doesn't exist or is not one of the user's dogs."""
+
+    dog = db.session.scalars(
+        owned_dog_stmt(dog_id, g.username, *options)
+    ).one_or_none()
+
+    if dog is None:
+        raise Unauthorized
+
+    return dog
+
+
+def get_owned_command(dog_id, command_id, *options):
+    """Get command with command_id for current user's dog with dog_id. Loader
+    options are applied to the query.
+
+    Raise Unauthorized if dog is not one of the user's dogs. Abort with 404 if
+    command is not one of the dog's commands."""
+
+    row = db.session.execute(
+        owned_command_stmt(dog_id, command_id, g.username, *options)
+    ).one_or_none()
+
+    if row is None:
+        raise Unauthorized
+
+    command = row[1]
+
+    if command is None:
+        abort(404)
+
+    return command
+
+
+def lock_owned_dog(dog_id):
+    """Lock current user's dog with dog_id (SELECT ... FOR UPDATE) until the
+    transaction ends. Command inserts for the dog check their foreign key
+    against the dog row, so they wait for the lock, and ones already made
+    commit first.
+
+    Raise Unauthorized if dog doesn't exist or is not one of the user's
+    dogs."""
+
+    locked_id = db.session.scalar(
+        select(Dog.id)
+        .where(Dog.id == dog_id, Dog.owner_username == g.username)
+        .with_for_update()
+    )
+
+    if locked_id is None:
+        raise Unauthorized
+
+
+def lock_owned_command(dog_id, command_id):
+    """Get command with command_id for current user's dog with dog_id, like
+    get_owned_command, locked (SELECT ... FOR UPDATE) until the transaction
+    ends and with its columns read after the lock was taken. Concurrent
+    writes of the command wait, so each sees the values the one before it
+    left."""
+
+    command = get_owned_command(dog_id, command_id)
+
+    return db.session.scalars(
+        select(Command)
+        .where(Command.id == command.id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).one()
+
+
+def owned_dog_version(dog_id):
+    """Get version of current user's dog with dog_id and its commands, without
+    loading them: (dog date_updated, latest command date_updated, number of
+    commands). Latest command date_updated is None if the dog has no commands.
+
+    Raise Unauthorized if dog doesn't exist or is not one of the user's dogs."""
+
+    row = db.session.execute(
+        select(
+            Dog.date_updated,
+            func.max(Command.date_updated),
+            func.count(Command.id),
+        )
+        .outerjoin(Command, Command.dog_id == Dog.id)
+        .where(Dog.id == dog_id, Dog.owner_username == g.username)
+        .group_by(Dog.id)
+    ).one_or_none()
+
+    if row is None:
+        raise Unauthorized
+
+    return tuple(row)
+
+
+# Command columns copied from the template of the same name
+TEMPLATE_COLUMNS = (
+    "name", "description", "voice_command", "visual_command",
+    "command_video_url", "proficiency", "performance_video_url", "type",
+)
+
+
+def add_owned_commands_from_templates(dog_id, template_ids):
+    """Add a command to current user's dog with dog_id for each template in
+    template_ids, in one INSERT ... SELECT ... RETURNING statement. Return the
+    new commands, ordered by id.
+
+    template_ids must not repeat an id. Raise Unauthorized if dog doesn't
+    exist or is not one of the user's dogs. Raise BadRequest if any template
+    id doesn't exist; nothing is added."""
+
+    now = datetime.utcnow()
+
+    templates = (
+        select(
+            *(getattr(CommandTemplate, name) for name in TEMPLATE_COLUMNS),
+            Dog.id,
+            literal(now, db.DateTime),
+            literal(now, db.DateTime),
+        )
+        .join(
+            Dog,
+            and_(Dog.id == dog_id, Dog.owner_username == g.username),
+        )
+        .where(CommandTemplate.id.in_(template_ids))
+        .order_by(CommandTemplate.id)
+    )
+
+    commands = db.session.scalars(
+        insert(Command)
+        .from_select(
+            [*TEMPLATE_COLUMNS, "dog_id", "date_introduced", "date_updated"],
+            templates,
+        )
+        .returning(Command)
+    ).all()
+
+    if len(commands) != len(template_ids):
+        db.session.rollback()
+        # only look up the dog to tell 401 from 400 when rows are missing
+        get_owned_dog(dog_id)
+        raise BadRequest("Unknown template id.")
+
+    return sorted(commands, key=lambda command: command.id)
+
+
+def delete_owned_dog(dog_id):
+    """Delete current user's dog with dog_id in one statement; the database
+    cascades the delete to its commands, their notes and its events.
+
+    Return deleted dog's name. Raise Unauthorized if dog doesn't exist or is
+    not one of the user's dogs."""
+
+    name = db.session.execute(
+        delete(Dog)
+        .where(Dog.id == dog_id, Dog.owner_username == g.username)
+        .returning(Dog.name)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+
+    if name is None:
+        raise Unauthorized
+
+    return name
+
+
+def delete_owned_command(dog_id, command_id):
+    """Delete command with command_id from current user's dog with dog_id in
+    one statement; the database cascades the delete to its notes.
+
+    Return deleted command's (name, type, proficiency) row. Raise Unauthorized
+    if dog is not one of the user's dogs. Abort with 404 if command is not one
+    of the dog's commands."""
+
+    owned_dog_id = (
+        select(Dog.id)
+        .where(Dog.id == dog_id, Dog.owner_username == g.username)
+        .scalar_subquery()
+    )
+
+    deleted = db.session.execute(
+        delete(Command)
+        .where(Command.id == command_id, Command.dog_id == owned_dog_id)
+        .returning(Command.name, Command.type, Command.proficiency)
+        # the default session sync adds the primary key to RETURNING, which
+        # shifts the returned columns
+        .execution_options(synchronize_session=False)
+    ).one_or_none()
+
+    if deleted is None:
+        # only look up the dog to tell 401 from 404 when nothing was deleted
+        get_owned_dog(dog_id)
+        abort(404)
+
+    return deleted
@@ -0,0 +1,166 @@
+"""Keyset pagination and streamed JSON lists for FetchFolio API."""
+
+import base64
+import json
+from datetime import datetime
+from flask import current_app, jsonify, request, url_for, stream_with_context
+from sqlalchemy import DateTime, tuple_
+from werkzeug.exceptions import BadRequest
+
+from models import db
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+STREAM_BATCH_SIZE = 500
+
+
+def encode_cursor(key):
+    """Make an opaque cursor string from the key of the last row on a page."""
+
+    raw = json.dumps([key], separators=(",", ":")).encode("UTF-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Get key back from cursor made by encode_cursor. Raise BadRequest if
+    cursor is not valid."""
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        [key] = json.loads(base64.urlsafe_b64decode(padded))
+        return key
+
+    except (ValueError, TypeError):
+        raise BadRequest("Invalid cursor.")
+
+
+def get_page_args():
+    """Get (limit, after key) from request query string:
+    ?limit=50&after=<cursor>
+
+    Limit defaults to DEFAULT_PAGE_LIMIT and may not exceed MAX_PAGE_LIMIT."""
+
+    try:
+        limit = int(request.args.get("limit", DEFAULT_PAGE_LIMIT))
+    except ValueError:
+        raise BadRequest("limit must be an integer.")
+
+    if not 1 <= limit <= MAX_PAGE_LIMIT:
+        raise BadRequest(f"limit must be between 1 and {MAX_PAGE_LIMIT}.")
+
+    after = request.args.get("after")
+    after_key = decode_cursor(after) if after else None
+
+    return limit, after_key
+
+
+def wants_stream():
+    """Return True if client asked for a streamed list with ?stream=true."""
+
+    return request.args.get("stream", "").lower() in ("1", "true")
+
+
+def keyset_page(stmt, key_column, limit, after_key=None):
+    """Run stmt ordered by unique key_column, starting after after_key.
+
+    Return (rows, next_cursor). next_cursor is None on the last page."""
+
+    if after_key is not None:
+        stmt = stmt.where(key_column > after_key)
+
+    stmt = stmt.order_by(key_column).limit(limit + 1)
+    rows = db.session.scalars(stmt).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(getattr(rows[-1], key_column.key))
+
+    return rows, next_cursor
+
+
+def newest_first_page(stmt, key_columns, limit, after_key=None):
+    """Run stmt ordered by key_columns descending, starting after after_key.
+    key_columns together must be unique, like (date, id), and should lead an
+    index so the page is read straight off it.
+
+    Return (rows, next_cursor). next_cursor is None on the last page."""
+
+    if after_key is not None:
+        try:
+            values = [
+                datetime.fromisoformat(value)
+                if isinstance(column.type, DateTime) else value
+                for column, value in zip(key_columns, after_key, strict=True)
+            ]
+        except (ValueError, TypeError):
+            raise BadRequest("Invalid cursor.")
+
+        stmt = stmt.where(tuple_(*key_columns) < tuple_(*values))
+
+    stmt = stmt.order_by(*(column.desc() for column in key_columns))
+    rows = db.session.scalars(stmt.limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([
+            _cursor_value(getattr(rows[-1], column.key))
+            for column in key_columns
+        ])
+
+    return rows, next_cursor
+
+
+def _cursor_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def page_response(items, next_cursor, limit):
+    """Return JSON list response for a page. If there is another page, add a
+    Link header pointing to it:
+    Link: </dogs?limit=50&after=WzUwXQ>; rel="next"
+    """
+
+    response = jsonify(items)
+
+    if next_cursor:
+        args = request.args.to_dict()
+        args.update(limit=limit, after=next_cursor)
+        next_url = url_for(request.endpoint, **request.view_args, **args)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+
+    return response
+
+
+def stream_response(stmt, key_column, serialize, after_key=None):
+    """Return response streaming stmt rows as a JSON list.
+
+    Rows are fetched in batches of STREAM_BATCH_SIZE from a server-side cursor
+    and each batch is written out as it arrives, so the full list is never held
+    in memory."""
+
+    if after_key is not None:
+        stmt = stmt.where(key_column > after_key)
+
+    stmt = stmt.order_by(key_column).execution_options(
+        yield_per=STREAM_BATCH_SIZE
+    )
+    dumps = current_app.json.dumps
+
+    def generate():
+        yield "["
+        separator = ""
+
+        result = db.session.scalars(stmt)
+        for batch in result.partitions():
+            chunk = ",".join(dumps(serialize(row)) for row in batch)
+            yield separator + chunk
+            separator = ","
+
+        yield "]"
+
+    return current_app.response_class(
+        stream_with_context(generate()),
+        mimetype="application/json",
+    )
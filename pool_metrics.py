@@ -0,0 +1,111 @@
+"""Connection pool instrumentation for FetchFolio API."""
+
+import threading
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+
+class PoolMetrics:
+    """Thread-safe counters for connection checkouts from the pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Zero all counters."""
+
+        with self._lock:
+            self.checkouts = 0
+            self.overflow_checkouts = 0
+            self.peak_overflow = 0
+            self.timeouts = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+    def record_checkout(self, wait, overflow):
+        """Record a connection handed out after waiting wait seconds, with
+        overflow connections beyond pool_size open."""
+
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if overflow > 0:
+                self.overflow_checkouts += 1
+                self.peak_overflow = max(self.peak_overflow, overflow)
+
+    def record_timeout(self, wait):
+        """Record a checkout that gave up after waiting wait seconds."""
+
+        with self._lock:
+            self.timeouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self, pool=None):
+        """Return dict of counters. If pool is given, add its live status:
+        {
+            "checkouts": 1042,
+            "overflow_checkouts": 12,
+            "peak_overflow": 3,
+            "timeouts": 0,
+            "wait_ms_total": 95.1,
+            "wait_ms_avg": 0.09,
+            "wait_ms_max": 41.7,
+            "pool_size": 5,
+            "checked_out": 2,
+            "overflow": 0
+        }
+        """
+
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            stats = {
+                "checkouts": self.checkouts,
+                "overflow_checkouts": self.overflow_checkouts,
+                "peak_overflow": self.peak_overflow,
+                "timeouts": self.timeouts,
+                "wait_ms_total": round(self.total_wait * 1000, 3),
+                "wait_ms_avg": round(
+                    self.total_wait * 1000 / attempts, 3) if attempts else 0,
+                "wait_ms_max": round(self.max_wait * 1000, 3),
+            }
+
+        if isinstance(pool, QueuePool):
+            stats.update(
+                pool_size=pool.size(),
+                checked_out=pool.checkedout(),
+                # negative while the pool hasn't opened pool_size connections
+                overflow=max(pool.overflow(), 0),
+            )
+
+        return stats
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records checkout wait time, overflow use and timeouts
+    in pool_metrics."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+
+        try:
+            connection = super()._do_get()
+
+        except PoolTimeoutError:
+            pool_metrics.record_timeout(time.perf_counter() - start)
+            raise
+
+        pool_metrics.record_checkout(
+            time.perf_counter() - start, self.overflow())
+        return connection
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """InstrumentedQueuePool for async drivers: waits for a connection on the
+    event loop instead of blocking it. See asgi.py."""
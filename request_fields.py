@@ -0,0 +1,27 @@
+"""Request body field parsing for FetchFolio API.
+
+Routes that take the same field parse it with the same function here, so
+every write path accepts the same input."""
+
+from datetime import datetime
+
+
+def parse_datetime_field(value):
+    """Return ISO 8601 string value from a request body as a datetime, or
+    None if None. Not every driver takes strings for datetime columns:
+    asyncpg (see asgi.py) and SQLite don't. Raise ValueError if invalid."""
+
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+def parse_proficiency_field(value):
+    """Return proficiency from a request body, an integer or a string of one
+    like "3", as an int, or None if None. Raise ValueError if invalid."""
+
+    if value is None:
+        return None
+
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"Invalid proficiency {value!r}")
+
+    return int(value)
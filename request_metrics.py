@@ -0,0 +1,269 @@
+"""Per-request timing and SQL statement counts for FetchFolio API.
+
+Every request gets a RequestTiming on g. SQLAlchemy engine events add each
+statement's count and duration to it, and code wrapped in timed(phase) adds
+to that phase:
+- auth: verifying the token and loading g.user
+- query: time spent executing SQL statements
+- serialize: building dicts from ORM instances
+- jsonify: encoding the response body
+- compress: compressing the response body (see compression.py)
+
+Phases can overlap: a lazy load while serializing counts toward both query
+and serialize, which is what makes hidden lazy loads stand out.
+
+The totals are sent back in a Server-Timing header, e.g.
+    Server-Timing: auth;dur=0.41, query;dur=3.12;desc="7 statements",
+        serialize;dur=0.83, jsonify;dur=0.20, compress;dur=0.11,
+        total;dur=6.15
+and added to per-endpoint aggregates (see RequestMetrics.snapshot).
+
+A request that runs the same SQL statement N_PLUS_ONE_THRESHOLD or more times
+is logged as a likely N+1 (a lazy load per row) and counted for its endpoint.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from json_provider import FetchFolioJSONProvider
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("auth", "query", "serialize", "jsonify", "compress")
+
+
+class RequestTiming:
+    """Phase durations and SQL statements for one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.statements = Counter()
+
+    def add(self, phase, seconds):
+        """Add seconds to phase."""
+
+        self.phases[phase] += seconds
+
+    def add_statement(self, statement, seconds):
+        """Record one execution of SQL statement taking seconds."""
+
+        self.statements[statement] += 1
+        self.phases["query"] += seconds
+
+    def repeated_statements(self, threshold):
+        """Return [(statement, count)] for statements run threshold or more
+        times, most repeated first."""
+
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+    def server_timing(self, total):
+        """Return Server-Timing header value, durations in ms."""
+
+        entries = []
+        for phase, seconds in self.phases.items():
+            entry = f"{phase};dur={seconds * 1000:.2f}"
+            if phase == "query":
+                entry += f';desc="{sum(self.statements.values())} statements"'
+            entries.append(entry)
+        entries.append(f"total;dur={total * 1000:.2f}")
+
+        return ", ".join(entries)
+
+
+def current_timing():
+    """Return RequestTiming for the current request, or None."""
+
+    if has_app_context():
+        return g.get("request_timing")
+
+    return None
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the with block to phase of the current request.
+    Does nothing outside a request."""
+
+    timing = current_timing()
+    if timing is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(phase, time.perf_counter() - start)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement(conn, cursor, statement, parameters, context,
+                     executemany):
+    conn.info.setdefault("statement_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _end_statement(conn, cursor, statement, parameters, context,
+                   executemany):
+    start = conn.info["statement_start"].pop()
+    timing = current_timing()
+
+    if timing is not None:
+        timing.add_statement(statement, time.perf_counter() - start)
+
+
+@event.listens_for(Engine, "handle_error")
+def _fail_statement(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("statement_start"):
+        connection.info["statement_start"].pop()
+
+
+class TimedJSONProvider(FetchFolioJSONProvider):
+    """Flask JSON provider that adds jsonify's encoding time to the
+    jsonify phase."""
+
+    def response(self, *args, **kwargs):
+        with timed("jsonify"):
+            return super().response(*args, **kwargs)
+
+
+class EndpointStats:
+    """Running totals for one endpoint."""
+
+    def __init__(self):
+        self.requests = 0
+        self.statements = 0
+        self.max_statements = 0
+        self.n_plus_one = 0
+        self.total = 0.0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+
+    def record(self, timing, total, n_plus_one):
+        statements = sum(timing.statements.values())
+
+        self.requests += 1
+        self.statements += statements
+        self.max_statements = max(self.max_statements, statements)
+        self.n_plus_one += n_plus_one
+        self.total += total
+        for phase, seconds in timing.phases.items():
+            self.phases[phase] += seconds
+
+    def snapshot(self):
+        per_request = 1000 / self.requests
+
+        return {
+            "requests": self.requests,
+            "statements_avg": round(self.statements / self.requests, 2),
+            "statements_max": self.max_statements,
+            "n_plus_one": self.n_plus_one,
+            "total_ms_avg": round(self.total * per_request, 3),
+            **{
+                f"{phase}_ms_avg": round(seconds * per_request, 3)
+                for phase, seconds in self.phases.items()
+            },
+        }
+
+
+class RequestMetrics:
+    """Time requests and aggregate the results per endpoint.
+
+    Settings come from app config in init_app:
+    - REQUEST_METRICS: turn timing on
+    - SERVER_TIMING: send the Server-Timing header
+    - N_PLUS_ONE_THRESHOLD: repeats of one statement that flag an N+1
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.threshold = 10
+        self.server_timing = True
+
+    def init_app(self, app):
+        """Register request hooks and the timed JSON provider on app. Call
+        before registering blueprints so timing starts before their
+        before_app_request hooks."""
+
+        if not app.config.get("REQUEST_METRICS", True):
+            return
+
+        self.threshold = app.config.get("N_PLUS_ONE_THRESHOLD", 10)
+        self.server_timing = app.config.get("SERVER_TIMING", True)
+
+        app.json = TimedJSONProvider(app)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def reset(self):
+        """Forget all endpoint stats."""
+
+        with self._lock:
+            self.endpoints = {}
+
+    def _start(self):
+        g.request_timing = RequestTiming()
+
+    def _finish(self, response):
+        timing = current_timing()
+        if timing is None:
+            return response
+
+        total = time.perf_counter() - timing.start
+        repeated = timing.repeated_statements(self.threshold)
+
+        for statement, count in repeated:
+            logger.warning(
+                "Possible N+1 in %s: statement ran %s times",
+                request.endpoint, count,
+                extra={"endpoint": request.endpoint,
+                       "repeats": count, "statement": statement},
+            )
+
+        with self._lock:
+            stats = self.endpoints.setdefault(request.endpoint, EndpointStats())
+            stats.record(timing, total, len(repeated))
+
+        if self.server_timing:
+            response.headers["Server-Timing"] = timing.server_timing(total)
+
+        return response
+
+    def snapshot(self):
+        """Return {endpoint: stats} for every endpoint seen:
+        {
+            "api.get_users_dog": {
+                "requests": 120,
+                "statements_avg": 3.0,
+                "statements_max": 3,
+                "n_plus_one": 0,
+                "total_ms_avg": 4.81,
+                "auth_ms_avg": 0.12,
+                "query_ms_avg": 1.94,
+                "serialize_ms_avg": 0.31,
+                "jsonify_ms_avg": 0.09
+            }, ...
+        }
+        """
+
+        with self._lock:
+            return {
+                endpoint: stats.snapshot()
+                for endpoint, stats in sorted(
+                    self.endpoints.items(), key=lambda item: str(item[0]))
+            }
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,411 @@
+"""Full-text search over dogs and commands for FetchFolio API.
+
+Dogs are searched by name, breed and bio; commands by name and description.
+Earlier fields weigh more in ranking. Every word of the query must match,
+and the last letters of a word may be left off ("bord coll" finds
+"Border Collie"). Results are ordered by rank, then id.
+
+Backends, picked by SEARCH_BACKEND:
+- "postgres": GIN indexes on weighted tsvector expressions (see
+  DOG_SEARCH_DOCUMENT and COMMAND_SEARCH_DOCUMENT in models.py), queried with
+  prefix tsqueries and ranked by ts_rank. PostgreSQL keeps the indexes up to
+  date itself.
+- "memory": an inverted index in this process, for SQLite and test
+  deployments. It is built from the database on the first search and then
+  updated by routes calling search_index.reindex_dogs(),
+  search_index.reindex_commands() or search_index.remove_user() after their writes commit. Other processes'
+  indexes only see those writes when restarted, so results are always
+  loaded with the user's visibility checked in SQL (see load_results).
+- "auto" (default): "postgres" on PostgreSQL, otherwise "memory".
+"""
+
+import re
+import threading
+from bisect import bisect_left, insort
+from flask import request
+from sqlalchemy import select, func, or_
+from sqlalchemy.engine import make_url
+from werkzeug.exceptions import BadRequest
+
+from models import (db, Dog, Command, DOG_SEARCH_DOCUMENT,
+                    COMMAND_SEARCH_DOCUMENT, SEARCH_CONFIG)
+from pagination import get_page_args, encode_cursor
+
+# words after this many in a query are ignored
+MAX_SEARCH_TERMS = 8
+
+# how much a word counts in ranking by field weight, like ts_rank's defaults
+WEIGHTS = {"A": 1.0, "B": 0.4, "C": 0.2, "D": 0.1}
+
+# (field, weight) pairs, matching the PostgreSQL search documents
+DOG_FIELDS = (("name", "A"), ("breed", "B"), ("bio", "C"))
+COMMAND_FIELDS = (("name", "A"), ("description", "B"))
+
+
+def tokenize(text):
+    """Return lowercase words in text."""
+
+    return re.findall(r"\w+", text.lower())
+
+
+def get_search_args():
+    """Get (terms, limit, offset) from request query string:
+    ?q=border collie&limit=20&after=<cursor>
+
+    Raise BadRequest if q has no words or the cursor is invalid."""
+
+    terms = tokenize(request.args.get("q", ""))[:MAX_SEARCH_TERMS]
+    if not terms:
+        raise BadRequest("q must contain at least one word.")
+
+    # ranked results are paged by position; the cursor holds the offset
+    limit, offset = get_page_args()
+    offset = offset or 0
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        raise BadRequest("Invalid cursor.")
+
+    return terms, limit, offset
+
+
+def load_results(model, ids, limit, offset, *options, where=()):
+    """Load model instances with ids (up to limit + 1 of them, in rank order)
+    in one query. Return (instances in rank order, next_cursor).
+
+    The ids are only a ranking hint: the memory backend can be behind writes
+    made by other processes, so the caller passes the visibility criteria
+    for the current user in where, and rows that no longer meet them are
+    left out."""
+
+    next_cursor = encode_cursor(offset + limit) if len(ids) > limit else None
+    ids = ids[:limit]
+
+    if not ids:
+        return [], next_cursor
+
+    by_id = {
+        instance.id: instance
+        for instance in db.session.scalars(
+            select(model).options(*options)
+            .where(model.id.in_(ids), *where))
+    }
+
+    # anything deleted or hidden since it was found is left out
+    return [by_id[i] for i in ids if i in by_id], next_cursor
+
+
+class PostgresBackend:
+    """Search with PostgreSQL's text search and GIN expression indexes."""
+
+    def tsquery(self, terms):
+        """Return tsquery matching documents with every term as a prefix."""
+
+        return func.to_tsquery(
+            SEARCH_CONFIG, " & ".join(f"{term}:*" for term in terms))
+
+    def dog_ids(self, terms, username, limit, offset):
+        query = self.tsquery(terms)
+
+        return db.session.scalars(
+            select(Dog.id)
+            .where(
+                DOG_SEARCH_DOCUMENT.op("@@")(query),
+                or_(Dog.private == False, Dog.owner_username == username),
+            )
+            .order_by(func.ts_rank(DOG_SEARCH_DOCUMENT, query).desc(), Dog.id)
+            .limit(limit)
+            .offset(offset)
+        ).all()
+
+    def command_ids(self, terms, dog_id, username, limit, offset):
+        query = self.tsquery(terms)
+
+        return db.session.scalars(
+            select(Command.id)
+            .join(Dog, Dog.id == Command.dog_id)
+            .where(
+                Dog.id == dog_id,
+                Dog.owner_username == username,
+                COMMAND_SEARCH_DOCUMENT.op("@@")(query),
+            )
+            .order_by(
+                func.ts_rank(COMMAND_SEARCH_DOCUMENT, query).desc(),
+                Command.id,
+            )
+            .limit(limit)
+            .offset(offset)
+        ).all()
+
+    def reindex_dogs(self, dog_ids):
+        """Nothing to do; the indexes are maintained by PostgreSQL."""
+
+    def reindex_commands(self, dog_id, command_ids):
+        """Nothing to do; the indexes are maintained by PostgreSQL."""
+
+    def remove_user(self, username):
+        """Nothing to do; the indexes are maintained by PostgreSQL."""
+
+
+class InvertedIndex:
+    """Map of word to {document id: score}, with words kept sorted so prefixes
+    can be looked up. Not thread-safe; MemoryBackend locks around it."""
+
+    def __init__(self):
+        self.postings = {}
+        self.words = []
+        self.document_words = {}
+
+    def add(self, document_id, weighted_texts):
+        """Index document from (text, weight) pairs, replacing any earlier
+        version of it."""
+
+        self.remove(document_id)
+
+        scores = {}
+        for text, weight in weighted_texts:
+            for word in tokenize(text or ""):
+                scores[word] = scores.get(word, 0) + WEIGHTS[weight]
+
+        for word, score in scores.items():
+            if word not in self.postings:
+                self.postings[word] = {}
+                insort(self.words, word)
+            self.postings[word][document_id] = score
+
+        self.document_words[document_id] = set(scores)
+
+    def remove(self, document_id):
+        """Remove document from the index, if it is in it."""
+
+        for word in self.document_words.pop(document_id, ()):
+            postings = self.postings[word]
+            del postings[document_id]
+
+            if not postings:
+                del self.postings[word]
+                del self.words[bisect_left(self.words, word)]
+
+    def search(self, terms):
+        """Return {document id: score} of documents with a word starting with
+        each of terms."""
+
+        results = None
+
+        for term in terms:
+            scores = {}
+            index = bisect_left(self.words, term)
+            while index < len(self.words) and \
+                    self.words[index].startswith(term):
+                word = self.words[index]
+                index += 1
+                for document_id, score in self.postings[word].items():
+                    scores[document_id] = scores.get(document_id, 0) + score
+
+            if results is None:
+                results = scores
+            else:
+                results = {
+                    document_id: score + scores[document_id]
+                    for document_id, score in results.items()
+                    if document_id in scores
+                }
+
+            if not results:
+                return {}
+
+        return results
+
+
+class MemoryBackend:
+    """Search with inverted indexes of dogs and commands held in this
+    process."""
+
+    def __init__(self):
+        self.dogs = InvertedIndex()
+        self.commands = InvertedIndex()
+        # dog id: (owner username, private)
+        self.dog_access = {}
+        # dog id: set of its command ids
+        self.dog_commands = {}
+        self.built = False
+        self._lock = threading.Lock()
+
+    def _index_dogs(self, dog_ids=None):
+        """Load dogs with dog_ids (all dogs if None) from the database into
+        the dog index. Return ids of the dogs found. Call with the lock
+        held."""
+
+        stmt = select(
+            Dog.id, Dog.owner_username, Dog.private,
+            *(getattr(Dog, name) for name, _ in DOG_FIELDS))
+        weights = [weight for _, weight in DOG_FIELDS]
+
+        if dog_ids is not None:
+            stmt = stmt.where(Dog.id.in_(dog_ids))
+
+        found = set()
+        for dog_id, owner, private, *texts in db.session.execute(
+                stmt.execution_options(yield_per=1000)):
+            self.dogs.add(dog_id, zip(texts, weights))
+            self.dog_access[dog_id] = (owner, private)
+            self.dog_commands.setdefault(dog_id, set())
+            found.add(dog_id)
+
+        return found
+
+    def _index_commands(self, *criteria):
+        """Load commands matching criteria (all commands if none) from the
+        database into the command index. Call with the lock held."""
+
+        stmt = select(
+            Command.id, Command.dog_id,
+            *(getattr(Command, name) for name, _ in COMMAND_FIELDS)
+        ).where(*criteria)
+        weights = [weight for _, weight in COMMAND_FIELDS]
+
+        for command_id, dog_id, *texts in db.session.execute(
+                stmt.execution_options(yield_per=1000)):
+            self.commands.add(command_id, zip(texts, weights))
+            self.dog_commands.setdefault(dog_id, set()).add(command_id)
+
+    def _remove_dog(self, dog_id):
+        """Remove dog and its commands from the indexes. Call with the lock
+        held."""
+
+        self.dogs.remove(dog_id)
+        self.dog_access.pop(dog_id, None)
+        for command_id in self.dog_commands.pop(dog_id, ()):
+            self.commands.remove(command_id)
+
+    def _ensure_built(self):
+        if not self.built:
+            self._index_dogs()
+            self._index_commands()
+            self.built = True
+
+    def dog_ids(self, terms, username, limit, offset):
+        with self._lock:
+            self._ensure_built()
+            scores = self.dogs.search(terms)
+            ids = [
+                dog_id for dog_id in scores
+                if not self.dog_access[dog_id][1]
+                or self.dog_access[dog_id][0] == username
+            ]
+
+        ids.sort(key=lambda dog_id: (-scores[dog_id], dog_id))
+        return ids[offset:offset + limit]
+
+    def command_ids(self, terms, dog_id, username, limit, offset):
+        with self._lock:
+            self._ensure_built()
+            if self.dog_access.get(dog_id, (None,))[0] != username:
+                return []
+
+            scores = self.commands.search(terms)
+            ids = [
+                command_id for command_id in scores
+                if command_id in self.dog_commands[dog_id]
+            ]
+
+        ids.sort(key=lambda command_id: (-scores[command_id], command_id))
+        return ids[offset:offset + limit]
+
+    def reindex_dogs(self, dog_ids):
+        """Reload the rows of dogs with dog_ids from the database, dropping
+        any that no longer exist along with their commands. Their commands
+        are left as they are."""
+
+        with self._lock:
+            if not self.built:
+                # the first search loads everything anyway
+                return
+
+            # read under the lock so an older read can't overwrite a newer one
+            found = self._index_dogs(dog_ids)
+            for dog_id in set(dog_ids) - found:
+                self._remove_dog(dog_id)
+
+    def reindex_commands(self, dog_id, command_ids):
+        """Reload commands with command_ids of dog with dog_id from the
+        database, dropping any that no longer exist."""
+
+        with self._lock:
+            if not self.built:
+                return
+
+            dog_commands = self.dog_commands.get(dog_id, set())
+            for command_id in command_ids:
+                self.commands.remove(command_id)
+                dog_commands.discard(command_id)
+
+            self._index_commands(
+                Command.dog_id == dog_id, Command.id.in_(command_ids))
+
+    def remove_user(self, username):
+        """Drop the dogs and commands of deleted user with username."""
+
+        with self._lock:
+            for dog_id, (owner, _) in list(self.dog_access.items()):
+                if owner == username:
+                    self._remove_dog(dog_id)
+
+
+class SearchIndex:
+    """Dog and command search with a backend picked from SEARCH_BACKEND in
+    init_app; see module docstring."""
+
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        """Create the backend from app config and the database's dialect."""
+
+        kind = app.config.get("SEARCH_BACKEND", "auto")
+        if kind == "auto":
+            url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+            is_postgres = url.get_backend_name() == "postgresql"
+            kind = "postgres" if is_postgres else "memory"
+
+        if kind == "postgres":
+            self.backend = PostgresBackend()
+        elif kind == "memory":
+            self.backend = MemoryBackend()
+        else:
+            raise ValueError(f"Unknown SEARCH_BACKEND {kind!r}")
+
+    def dog_ids(self, terms, username, limit, offset):
+        """Return ids of public dogs and username's dogs matching terms, in
+        rank order, skipping offset and returning at most limit."""
+
+        return self.backend.dog_ids(terms, username, limit, offset)
+
+    def command_ids(self, terms, dog_id, username, limit, offset):
+        """Return ids of commands of dog with dog_id matching terms, in rank
+        order, skipping offset and returning at most limit. Returns none
+        unless the dog belongs to username."""
+
+        return self.backend.command_ids(
+            terms, dog_id, username, limit, offset)
+
+    def reindex_dogs(self, dog_ids):
+        """Update the index for dogs with dog_ids, and for their commands if
+        the dogs were deleted. Call after a write that added, changed or
+        deleted the dogs is committed."""
+
+        self.backend.reindex_dogs(dog_ids)
+
+    def reindex_commands(self, dog_id, command_ids):
+        """Update the index for commands with command_ids of dog with dog_id.
+        Call after a write that added, changed or deleted them is
+        committed."""
+
+        self.backend.reindex_commands(dog_id, command_ids)
+
+    def remove_user(self, username):
+        """Update the index for a deleted user's dogs and commands. Call after
+        the delete is committed."""
+
+        self.backend.remove_user(username)
+
+
+search_index = SearchIndex()
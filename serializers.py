@@ -0,0 +1,67 @@
+"""Generated serializers for FetchFolio API.
+
+The marshmallow schemas in models.py stay the single source of truth for which
+fields are output. serializer() reads a schema's fields once and generates a
+plain function that builds the same dict directly from an ORM instance,
+skipping marshmallow's per-field machinery on every dump.
+
+Output matches schema.dump() once encoded as JSON:
+    - DateTime/Date fields are left as datetimes and dates, which the app's
+      JSON provider writes as the same ISO 8601 strings (see json_provider.py)
+    - Nested fields use their own generated serializer, honouring only=
+    - names in Meta.fields that are not attributes of the model are left out
+"""
+
+from functools import lru_cache
+from marshmallow import fields
+
+
+@lru_cache(maxsize=None)
+def serializer(schema_class, only=None):
+    """Return a function that turns one model instance into a dict, with the
+    same JSON as schema_class(only=only).dump(instance).
+
+    only is a tuple of field names. Serializers are cached per
+    (schema_class, only)."""
+
+    schema = schema_class(only=only)
+    model = schema.opts.model
+    namespace = {}
+    items = []
+
+    for name, field in schema.dump_fields.items():
+        attribute = field.attribute or name
+
+        # marshmallow skips attributes the object doesn't have
+        if model is None or not hasattr(model, attribute):
+            continue
+
+        value = f"obj.{attribute}"
+
+        if isinstance(field, fields.Nested):
+            nested_name = f"_nested_{name}"
+            namespace[nested_name] = serializer(
+                type(field.schema),
+                tuple(field.only) if field.only else None,
+            )
+            if field.many:
+                value = f"[{nested_name}(item) for item in {value}]"
+            else:
+                value = (
+                    f"None if {value} is None else {nested_name}({value})"
+                )
+
+        items.append(f"        {name!r}: {value},")
+
+    function_name = f"serialize_{schema_class.__name__}"
+    source = "\n".join([
+        f"def {function_name}(obj):",
+        "    return {",
+        *items,
+        "    }",
+    ])
+
+    exec(compile(source, f"<serializer {schema_class.__name__}>", "exec"),
+         namespace)
+
+    return namespace[function_name]
@@ -0,0 +1,241 @@
+"""Training progress summaries for FetchFolio API.
+
+A dog's summary (commands by type, proficiency histogram, mean proficiency,
+last update) is read from DogTrainingSummary rows, one per (type,
+proficiency) the dog has had commands at. A user's summary across all their
+dogs is read the same way from UserTrainingSummary. Either read is a single
+query over at most (command types x proficiency levels) rows, however many
+commands there are.
+
+Routes that add, change or delete commands call record() with the (type,
+proficiency) of commands removed and added, in the same transaction as the
+write. It upserts the changed counts into both tables in one statement
+each. Deleting a dog locks it and goes through remove_dog() first; deleting
+a user needs nothing, as the database cascades to their rows.
+
+`flask summaries rebuild` recomputes every row from the commands table, to
+repair summaries after commands are changed outside the API. Run it while
+nothing else writes commands.
+"""
+
+import click
+from collections import Counter
+from datetime import datetime
+from flask import g
+from flask.cli import with_appcontext
+from sqlalchemy import select, delete, insert, func, literal
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import (db, Dog, Command, DogTrainingSummary,
+                    UserTrainingSummary)
+
+
+def summary_key(command_type, proficiency):
+    """Return (type, proficiency) summary row key of a command."""
+
+    return (command_type, int(proficiency))
+
+
+def count_changes(removed=(), added=()):
+    """Return Counter of (type, proficiency): change in number of commands,
+    from (type, proficiency) keys of commands removed and added. Keys whose
+    changes cancel out are left out."""
+
+    changes = Counter()
+    for key in removed:
+        changes[summary_key(*key)] -= 1
+    for key in added:
+        changes[summary_key(*key)] += 1
+
+    return {key: change for key, change in changes.items() if change}
+
+
+def upsert(model, owner, changes, now):
+    """Add changes to the counts of owner's rows of model (a summary table
+    keyed by owner column, type and proficiency), creating missing rows, in
+    one INSERT ... ON CONFLICT DO UPDATE."""
+
+    owner_column, owner_value = owner
+    dialect = db.session.get_bind().dialect.name
+    insert_stmt = (postgresql if dialect == "postgresql" else sqlite).insert
+
+    stmt = insert_stmt(model).values([
+        {
+            owner_column: owner_value,
+            "type": command_type,
+            "proficiency": proficiency,
+            "count": change,
+            "date_updated": now,
+        }
+        # sorted so concurrent upserts lock rows in the same order
+        for (command_type, proficiency), change in sorted(changes.items())
+    ])
+
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[owner_column, "type", "proficiency"],
+        set_={
+            "count": model.count + stmt.excluded.count,
+            "date_updated": stmt.excluded.date_updated,
+        },
+    ))
+
+
+def record(dog_id, removed=(), added=()):
+    """Update summaries of current user and their dog with dog_id for
+    commands with (type, proficiency) keys removed and added. Caller
+    commits, with the write that removed and added them."""
+
+    changes = count_changes(removed, added)
+    if not changes:
+        return
+
+    now = datetime.utcnow()
+    upsert(DogTrainingSummary, ("dog_id", dog_id), changes, now)
+    upsert(UserTrainingSummary, ("owner_username", g.username), changes, now)
+
+
+def remove_dog(dog_id):
+    """Take current user's dog with dog_id's commands out of the user's
+    summary, deleting the dog's summary rows. Call with the dog row locked
+    (ownership.lock_owned_dog), in the transaction that deletes the dog.
+
+    The counts are taken from the DELETE itself rather than read first:
+    SQLite only starts the transaction at the first write, so a plain read
+    could miss a command added just before the delete."""
+
+    rows = db.session.execute(
+        delete(DogTrainingSummary)
+        .where(
+            DogTrainingSummary.dog_id == dog_id,
+            DogTrainingSummary.dog_id.in_(
+                select(Dog.id).where(Dog.owner_username == g.username)),
+        )
+        .returning(
+            DogTrainingSummary.type,
+            DogTrainingSummary.proficiency,
+            DogTrainingSummary.count,
+        )
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    changes = {
+        (command_type, proficiency): -count
+        for command_type, proficiency, count in rows if count
+    }
+    if changes:
+        upsert(
+            UserTrainingSummary, ("owner_username", g.username), changes,
+            datetime.utcnow())
+
+
+def summarize(rows):
+    """Return summary dict from (type, proficiency, count, date_updated)
+    rows:
+    {
+        "commands": 12,
+        "by_type": {"obedience": 10, "trick": 2},
+        "proficiency": {"1": 3, "2": 5, "3": 4},
+        "mean_proficiency": 2.08,
+        "last_updated": "2023-10-12T03:19:12.587643"
+    }
+    """
+
+    by_type = Counter()
+    histogram = Counter()
+    last_updated = None
+
+    for command_type, proficiency, count, date_updated in rows:
+        if count:
+            by_type[command_type] += count
+            histogram[proficiency] += count
+        if last_updated is None or date_updated > last_updated:
+            last_updated = date_updated
+
+    total = sum(histogram.values())
+    mean = sum(level * count for level, count in histogram.items()) / total \
+        if total else None
+
+    return {
+        "commands": total,
+        "by_type": dict(sorted(by_type.items())),
+        "proficiency": {
+            str(level): count for level, count in sorted(histogram.items())},
+        "mean_proficiency": round(mean, 2) if mean is not None else None,
+        "last_updated": last_updated.isoformat() if last_updated else None,
+    }
+
+
+def dog_summary_rows(dog_id, username):
+    """Return summary rows of dog with dog_id if it belongs to username."""
+
+    return db.session.execute(
+        select(
+            DogTrainingSummary.type,
+            DogTrainingSummary.proficiency,
+            DogTrainingSummary.count,
+            DogTrainingSummary.date_updated,
+        )
+        .join(Dog, Dog.id == DogTrainingSummary.dog_id)
+        .where(Dog.id == dog_id, Dog.owner_username == username)
+    ).all()
+
+
+def user_summary_rows(username):
+    """Return summary rows of all of username's dogs."""
+
+    return db.session.execute(
+        select(
+            UserTrainingSummary.type,
+            UserTrainingSummary.proficiency,
+            UserTrainingSummary.count,
+            UserTrainingSummary.date_updated,
+        )
+        .where(UserTrainingSummary.owner_username == username)
+    ).all()
+
+
+def rebuild():
+    """Recompute every summary row from the commands table. Caller
+    commits."""
+
+    now = datetime.utcnow()
+
+    db.session.execute(delete(DogTrainingSummary))
+    db.session.execute(delete(UserTrainingSummary))
+
+    db.session.execute(insert(DogTrainingSummary).from_select(
+        ["dog_id", "type", "proficiency", "count", "date_updated"],
+        select(
+            Command.dog_id, Command.type, Command.proficiency,
+            func.count(), literal(now),
+        )
+        .group_by(Command.dog_id, Command.type, Command.proficiency),
+    ))
+
+    db.session.execute(insert(UserTrainingSummary).from_select(
+        ["owner_username", "type", "proficiency", "count", "date_updated"],
+        select(
+            Dog.owner_username, Command.type, Command.proficiency,
+            func.count(), literal(now),
+        )
+        .join(Dog, Dog.id == Command.dog_id)
+        .group_by(Dog.owner_username, Command.type, Command.proficiency),
+    ))
+
+
+@click.group("summaries")
+def summaries_cli():
+    """Training progress summaries."""
+
+
+@summaries_cli.command("rebuild")
+@with_appcontext
+def rebuild_command():
+    """Recompute all training summaries from the commands."""
+
+    rebuild()
+    db.session.commit()
+
+    dogs = db.session.scalar(select(func.count()).select_from(
+        select(DogTrainingSummary.dog_id).distinct().subquery()))
+    click.echo(f"Rebuilt training summaries for {dogs} dogs.")
@@ -0,0 +1,67 @@
+"""Fixtures shared by the tests: an app on TEST_DATABASE_URL with fresh
+tables, and logged in users."""
+
+import pytest
+
+from app import create_app
+from models import db, User, CommandType
+
+
+@pytest.fixture
+def app():
+    app = create_app("test")
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all([
+            CommandType(type="obedience"),
+            CommandType(type="trick"),
+        ])
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(username):
+    """Sign up user username and return Authorization headers for them."""
+
+    user = User.signup(username, "password", username.title(),
+                       f"{username}@example.com", None)
+    db.session.commit()
+
+    return {"Authorization": User.create_token(user)}
+
+
+@pytest.fixture
+def headers(app):
+    return login("jules")
+
+
+@pytest.fixture
+def other_headers(app):
+    return login("bob")
+
+
+@pytest.fixture
+def dog_id(client, headers):
+    """Id of a public dog of jules' with no commands."""
+
+    response = client.post("/dogs/current", headers=headers, json={
+        "name": "Petey",
+        "breed": "Border Collie",
+        "size": "large",
+        "private": "false",
+        "birth_date": "2020-08-03T00:00:00",
+    })
+    assert response.status_code == 200
+
+    return response.json["id"]
@@ -0,0 +1,119 @@
+"""Command batches are validated as a whole and applied all or nothing."""
+
+import pytest
+
+from batch import MAX_BATCH_SIZE
+from models import db, Command
+
+
+def post_batch(client, headers, dog_id, commands):
+    return client.post(f"/dogs/current/{dog_id}/commands/batch",
+                       headers=headers, json={"commands": commands})
+
+
+@pytest.fixture
+def command_id(client, headers, dog_id):
+    response = client.post(f"/dogs/current/{dog_id}/commands",
+                           headers=headers,
+                           json={"name": "sit", "type": "obedience",
+                                 "proficiency": 1})
+    assert response.status_code == 200
+
+    return response.json["id"]
+
+
+def test_creates_and_updates_in_item_order(
+        client, headers, dog_id, command_id):
+    response = post_batch(client, headers, dog_id, [
+        {"name": "spin", "type": "trick", "proficiency": 2},
+        {"id": command_id, "proficiency": "4"},
+        {"name": "down", "type": "obedience"},
+    ])
+
+    assert response.status_code == 200
+    assert [(result["status"], result["command"]["name"],
+             result["command"]["proficiency"])
+            for result in response.json] == [
+        ("created", "spin", 2), ("updated", "sit", 4), ("created", "down", 1)]
+
+    summary = client.get(f"/dogs/current/{dog_id}/summary",
+                         headers=headers).json
+    assert summary["proficiency"] == {"1": 1, "2": 1, "4": 1}
+
+
+@pytest.mark.parametrize("item, field", [
+    ("sit", "item"),
+    ({"type": "obedience"}, "name"),
+    ({"name": "sit"}, "type"),
+    ({"name": "sit", "type": "unknown"}, "type"),
+    ({"name": "sit", "type": "obedience", "colour": "red"}, "colour"),
+    ({"name": "sit", "type": "obedience", "proficiency": "high"},
+     "proficiency"),
+    ({"name": "sit", "type": "obedience", "proficiency": True},
+     "proficiency"),
+    ({"name": "sit", "type": "obedience", "proficiency": None},
+     "proficiency"),
+    ({"name": "x" * 1000, "type": "obedience"}, "name"),
+    ({"name": 3, "type": "obedience"}, "name"),
+    ({"id": 999, "name": "sit"}, "id"),
+])
+def test_invalid_item_fails_the_whole_batch(
+        client, headers, dog_id, command_id, item, field):
+    response = post_batch(client, headers, dog_id, [
+        {"name": "spin", "type": "trick"},
+        {"id": command_id, "proficiency": 5},
+        item,
+    ])
+
+    assert response.status_code == 400
+    assert response.json[:2] == [{"status": "valid"}, {"status": "valid"}]
+    assert response.json[2]["status"] == "invalid"
+    assert field in response.json[2]["errors"]
+
+    # nothing applied, not even the valid items
+    assert [(command.name, command.proficiency)
+            for command in db.session.query(Command)] == [("sit", 1)]
+
+
+def test_repeated_command_id_is_invalid(client, headers, dog_id, command_id):
+    response = post_batch(client, headers, dog_id, [
+        {"id": command_id, "proficiency": 2},
+        {"id": command_id, "proficiency": 3},
+    ])
+
+    assert response.status_code == 400
+    assert response.json[1]["errors"] == {"id": "Command appears twice."}
+
+
+def test_other_dogs_command_is_invalid(
+        client, headers, other_headers, dog_id, command_id):
+    other_dog = client.post("/dogs/current", headers=other_headers, json={
+        "name": "Rex", "breed": "Mutt", "size": "small", "private": "false",
+        "birth_date": "2021-01-01T00:00:00",
+    }).json["id"]
+
+    response = post_batch(client, other_headers, other_dog,
+                          [{"id": command_id, "proficiency": 5}])
+
+    assert response.status_code == 400
+    assert "id" in response.json[0]["errors"]
+
+
+def test_other_users_dog_gets_401(client, other_headers, dog_id):
+    response = post_batch(client, other_headers, dog_id,
+                          [{"name": "spin", "type": "trick"}])
+
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize("commands", [
+    None,
+    [],
+    {"name": "spin"},
+    [{"name": "spin", "type": "trick"}] * (MAX_BATCH_SIZE + 1),
+])
+def test_malformed_batch_gets_400(client, headers, dog_id, commands):
+    response = post_batch(client, headers, dog_id, commands)
+
+    assert response.status_code == 400
+    assert db.session.query(Command).count() == 0
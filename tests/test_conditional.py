@@ -0,0 +1,95 @@
+"""Dog and command list routes answer conditional GETs with 304 until the
+dog or its commands change."""
+
+import pytest
+
+URLS = [
+    "/dogs/current/{dog_id}",
+    "/dogs/current/{dog_id}/commands",
+]
+
+
+def add_command(client, headers, dog_id, **fields):
+    response = client.post(f"/dogs/current/{dog_id}/commands",
+                           headers=headers,
+                           json={"name": "sit", "type": "obedience", **fields})
+    assert response.status_code == 200
+
+    return response.json["id"]
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_full_response_has_validators(client, headers, dog_id, url):
+    response = client.get(url.format(dog_id=dog_id), headers=headers)
+
+    assert response.status_code == 200
+    assert response.headers["ETag"]
+    assert response.headers["Last-Modified"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_unchanged_etag_gets_304(client, headers, dog_id, url):
+    url = url.format(dog_id=dog_id)
+    etag = client.get(url, headers=headers).headers["ETag"]
+
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_unchanged_last_modified_gets_304(client, headers, dog_id, url):
+    url = url.format(dog_id=dog_id)
+    last_modified = client.get(url, headers=headers).headers["Last-Modified"]
+
+    response = client.get(
+        url, headers={**headers, "If-Modified-Since": last_modified})
+
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_command_writes_change_etag(client, headers, dog_id, url):
+    url = url.format(dog_id=dog_id)
+    etags = [client.get(url, headers=headers).headers["ETag"]]
+
+    command_id = add_command(client, headers, dog_id)
+    etags.append(client.get(url, headers=headers).headers["ETag"])
+
+    client.patch(f"/dogs/current/{dog_id}/commands/{command_id}",
+                 headers=headers, json={"proficiency": 4})
+    etags.append(client.get(url, headers=headers).headers["ETag"])
+
+    client.delete(f"/dogs/current/{dog_id}/commands/{command_id}",
+                  headers=headers)
+    response = client.get(
+        url, headers={**headers, "If-None-Match": etags[-1]})
+
+    assert response.status_code == 200
+    assert len(set(etags + [response.headers["ETag"]])) == 4
+
+
+def test_query_string_changes_etag(client, headers, dog_id):
+    url = f"/dogs/current/{dog_id}"
+    etag = client.get(url, headers=headers).headers["ETag"]
+
+    response = client.get(f"{url}?fields=id,name",
+                          headers={**headers, "If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert "breed" not in response.json
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_other_users_dog_is_not_revalidated(
+        client, headers, other_headers, dog_id, url):
+    url = url.format(dog_id=dog_id)
+    etag = client.get(url, headers=headers).headers["ETag"]
+
+    response = client.get(
+        url, headers={**other_headers, "If-None-Match": etag})
+
+    assert response.status_code == 401
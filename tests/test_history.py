@@ -0,0 +1,143 @@
+"""Proficiency changes made through the command routes are recorded in the
+history, packed into one row per command per day."""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, ProficiencyHistory
+
+
+def add_command(client, headers, dog_id, **fields):
+    response = client.post(f"/dogs/current/{dog_id}/commands",
+                           headers=headers,
+                           json={"name": "sit", "type": "obedience", **fields})
+    assert response.status_code == 200
+
+    return response.json["id"]
+
+
+def update_command(client, headers, dog_id, command_id, **fields):
+    response = client.patch(f"/dogs/current/{dog_id}/commands/{command_id}",
+                            headers=headers, json=fields)
+    assert response.status_code == 200
+
+
+def history_rows():
+    return [
+        (row.command_id, row.proficiency, row.min_proficiency,
+         row.max_proficiency, row.changes)
+        for row in db.session.query(ProficiencyHistory)
+        .order_by(ProficiencyHistory.command_id, ProficiencyHistory.day)
+    ]
+
+
+def today():
+    return datetime.utcnow().date()
+
+
+def test_changes_on_one_day_share_a_row(client, headers, dog_id):
+    sit = add_command(client, headers, dog_id, proficiency=2)
+    update_command(client, headers, dog_id, sit, proficiency=4)
+    update_command(client, headers, dog_id, sit, proficiency=1)
+    update_command(client, headers, dog_id, sit, proficiency="3")
+
+    assert history_rows() == [(sit, 3, 1, 4, 4)]
+    assert db.session.query(ProficiencyHistory).one().day == today()
+
+
+@pytest.mark.parametrize("fields", [
+    {"name": "sit pretty"},
+    {"proficiency": 2},
+    {"proficiency": "2"},
+])
+def test_unchanged_proficiency_is_not_recorded(
+        client, headers, dog_id, fields):
+    sit = add_command(client, headers, dog_id, proficiency=2)
+    update_command(client, headers, dog_id, sit, **fields)
+
+    assert history_rows() == [(sit, 2, 2, 2, 1)]
+
+
+def test_batch_records_created_and_changed_commands(client, headers, dog_id):
+    sit = add_command(client, headers, dog_id, proficiency=2)
+    down = add_command(client, headers, dog_id, name="down", proficiency=3)
+
+    response = client.post(
+        f"/dogs/current/{dog_id}/commands/batch", headers=headers,
+        json={"commands": [
+            {"id": sit, "proficiency": 5},
+            {"id": down, "name": "lie down", "proficiency": "3"},
+            {"name": "spin", "type": "trick", "proficiency": 1},
+        ]})
+    assert response.status_code == 200
+    spin = response.json[2]["command"]["id"]
+
+    assert history_rows() == [
+        (sit, 5, 2, 5, 2), (down, 3, 3, 3, 1), (spin, 1, 1, 1, 1)]
+
+
+def test_deleting_a_command_deletes_its_history(client, headers, dog_id):
+    sit = add_command(client, headers, dog_id)
+    client.delete(f"/dogs/current/{dog_id}/commands/{sit}", headers=headers)
+
+    assert history_rows() == []
+
+
+def test_command_series_starts_from_earlier_history(
+        client, headers, dog_id):
+    sit = add_command(client, headers, dog_id, proficiency=4)
+    db.session.add(ProficiencyHistory(
+        command_id=sit, dog_id=dog_id, day=today() - timedelta(days=30),
+        proficiency=2, min_proficiency=1, max_proficiency=2, changes=2))
+    db.session.commit()
+
+    start = today() - timedelta(days=1)
+    response = client.get(
+        f"/dogs/current/{dog_id}/commands/{sit}/history"
+        f"?bucket=day&from={start.isoformat()}", headers=headers)
+
+    assert response.status_code == 200
+    assert response.json["series"] == [
+        {"date": start.isoformat(), "proficiency": 2, "min_proficiency": 2,
+         "max_proficiency": 2, "changes": 0},
+        {"date": today().isoformat(), "proficiency": 4, "min_proficiency": 2,
+         "max_proficiency": 4, "changes": 1},
+    ]
+
+
+def test_dog_series(client, headers, dog_id):
+    add_command(client, headers, dog_id, proficiency=2)
+    add_command(client, headers, dog_id, name="down", proficiency=4)
+
+    response = client.get(
+        f"/dogs/current/{dog_id}/history"
+        f"?bucket=day&from={today().isoformat()}", headers=headers)
+
+    assert response.status_code == 200
+    assert response.json["series"] == [
+        {"date": today().isoformat(), "commands": 2, "mean_proficiency": 3.0,
+         "changes": 2},
+    ]
+
+
+@pytest.mark.parametrize("query", [
+    "",
+    "?from=yesterday",
+    "?from=2023-01-01&bucket=month",
+    "?from=2023-02-01&to=2023-01-01",
+    "?from=2000-01-01&to=2023-01-01&bucket=day",
+])
+def test_invalid_window_gets_400(client, headers, dog_id, query):
+    response = client.get(f"/dogs/current/{dog_id}/history{query}",
+                          headers=headers)
+
+    assert response.status_code == 400
+
+
+def test_other_users_dog_gets_401(client, other_headers, dog_id):
+    response = client.get(
+        f"/dogs/current/{dog_id}/history?from={today().isoformat()}",
+        headers=other_headers)
+
+    assert response.status_code == 401
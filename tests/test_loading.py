@@ -0,0 +1,49 @@
+"""Loading plans keep dog and command dumps to a fixed number of queries."""
+
+import re
+import pytest
+
+from models import db, Dog, Command, CommandNote
+
+
+def add_dog(commands, notes):
+    """Add a dog of jules' with commands commands of notes notes each.
+    Return its id."""
+
+    dog = Dog(name="Petey", breed="Border Collie", size="large",
+              owner_username="jules", private=False)
+    db.session.add(dog)
+    db.session.flush()
+
+    for i in range(commands):
+        command = Command(name=f"command {i}", type="obedience",
+                          dog_id=dog.id)
+        command.notes = [CommandNote(note=f"note {j}") for j in range(notes)]
+        db.session.add(command)
+
+    db.session.commit()
+    return dog.id
+
+
+def statement_count(client, url, headers):
+    """GET url and return how many SQL statements it ran, from the
+    Server-Timing header."""
+
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+
+    timing = response.headers["Server-Timing"]
+    return int(re.search(r'desc="(\d+) statements"', timing).group(1))
+
+
+@pytest.mark.parametrize("url", [
+    "/dogs/current/{dog_id}",
+    "/dogs/current/{dog_id}/commands",
+])
+def test_statements_dont_grow_with_commands_or_notes(app, headers, url):
+    small = add_dog(commands=1, notes=1)
+    large = add_dog(commands=25, notes=5)
+    client = app.test_client()
+
+    assert (statement_count(client, url.format(dog_id=small), headers)
+            == statement_count(client, url.format(dog_id=large), headers))
@@ -0,0 +1,127 @@
+"""Training summaries kept up to date by the command routes match the ones
+rebuilt from the commands table."""
+
+import pytest
+
+import summaries
+from models import db
+
+DOG = {"breed": "Mutt", "size": "small", "private": "false",
+       "birth_date": "2021-01-01T00:00:00"}
+
+
+def add_command(client, headers, dog_id, **fields):
+    response = client.post(f"/dogs/current/{dog_id}/commands",
+                           headers=headers,
+                           json={"name": "sit", "type": "obedience", **fields})
+    assert response.status_code == 200
+
+    return response.json["id"]
+
+
+def get_summaries(client, headers, dog_ids):
+    """Return user summary and summaries of dogs with dog_ids, without their
+    last_updated."""
+
+    urls = ["/users/current/summary",
+            *(f"/dogs/current/{dog_id}/summary" for dog_id in dog_ids)]
+    results = []
+
+    for url in urls:
+        summary = client.get(url, headers=headers).json
+        del summary["last_updated"]
+        results.append(summary)
+
+    return results
+
+
+def assert_no_drift(client, headers, dog_ids):
+    kept = get_summaries(client, headers, dog_ids)
+
+    summaries.rebuild()
+    db.session.commit()
+
+    assert kept == get_summaries(client, headers, dog_ids)
+
+
+def test_add_update_and_delete_commands(client, headers, dog_id):
+    sit = add_command(client, headers, dog_id, proficiency=1)
+    spin = add_command(client, headers, dog_id, name="spin", type="trick",
+                       proficiency="3")
+    add_command(client, headers, dog_id, name="down", proficiency=3)
+
+    client.patch(f"/dogs/current/{dog_id}/commands/{sit}", headers=headers,
+                 json={"proficiency": 3})
+    client.patch(f"/dogs/current/{dog_id}/commands/{spin}", headers=headers,
+                 json={"type": "obedience", "proficiency": 5})
+    client.delete(f"/dogs/current/{dog_id}/commands/{sit}", headers=headers)
+
+    user_summary, dog_summary = get_summaries(client, headers, [dog_id])
+    assert dog_summary == {
+        "commands": 2,
+        "by_type": {"obedience": 2},
+        "proficiency": {"3": 1, "5": 1},
+        "mean_proficiency": 4.0,
+    }
+    assert user_summary == dog_summary
+
+    assert_no_drift(client, headers, [dog_id])
+
+
+def test_batch(client, headers, dog_id):
+    sit = add_command(client, headers, dog_id, proficiency=2)
+
+    response = client.post(
+        f"/dogs/current/{dog_id}/commands/batch", headers=headers,
+        json={"commands": [
+            {"id": sit, "type": "trick", "proficiency": 4},
+            {"name": "spin", "type": "trick", "proficiency": 4},
+        ]})
+    assert response.status_code == 200
+
+    dog_summary = get_summaries(client, headers, [dog_id])[1]
+    assert dog_summary["by_type"] == {"trick": 2}
+    assert dog_summary["proficiency"] == {"4": 2}
+
+    assert_no_drift(client, headers, [dog_id])
+
+
+def test_delete_dog(client, headers, dog_id):
+    other_dog = client.post("/dogs/current", headers=headers,
+                            json={"name": "Rex", **DOG}).json["id"]
+    add_command(client, headers, dog_id, proficiency=2)
+    add_command(client, headers, other_dog, proficiency=5)
+
+    response = client.delete(f"/dogs/current/{dog_id}", headers=headers)
+    assert response.status_code == 200
+
+    user_summary = get_summaries(client, headers, [])[0]
+    assert user_summary["proficiency"] == {"5": 1}
+
+    assert_no_drift(client, headers, [other_dog])
+
+
+@pytest.mark.parametrize("fields", [
+    {"proficiency": "high"},
+    {"type": "unknown"},
+])
+def test_failed_write_leaves_summaries(client, headers, dog_id, fields):
+    sit = add_command(client, headers, dog_id, proficiency=2)
+
+    response = client.patch(f"/dogs/current/{dog_id}/commands/{sit}",
+                            headers=headers, json=fields)
+    assert response.status_code == 400
+
+    assert get_summaries(client, headers, [dog_id])[1]["proficiency"] == {
+        "2": 1}
+    assert_no_drift(client, headers, [dog_id])
+
+
+def test_other_users_summaries_are_separate(
+        client, headers, other_headers, dog_id):
+    add_command(client, headers, dog_id)
+
+    assert client.get("/users/current/summary",
+                      headers=other_headers).json["commands"] == 0
+    assert client.get(f"/dogs/current/{dog_id}/summary",
+                      headers=other_headers).status_code == 401
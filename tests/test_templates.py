@@ -0,0 +1,90 @@
+"""Adding commands from templates is all or nothing."""
+
+import pytest
+
+from models import db, Command, CommandTemplate, ProficiencyHistory
+
+
+@pytest.fixture
+def template_ids(app):
+    templates = [
+        CommandTemplate(name="sit", type="obedience", proficiency=1,
+                        description="standard sit"),
+        CommandTemplate(name="spin", type="trick", proficiency=2),
+    ]
+    db.session.add_all(templates)
+    db.session.commit()
+
+    return [template.id for template in templates]
+
+
+def add_templates(client, headers, dog_id, template_ids):
+    return client.post(f"/dogs/current/{dog_id}/commands/templates",
+                       headers=headers, json={"template_ids": template_ids})
+
+
+def assert_nothing_added(client, headers, dog_id):
+    assert db.session.query(Command).count() == 0
+    assert db.session.query(ProficiencyHistory).count() == 0
+
+    summary = client.get(f"/dogs/current/{dog_id}/summary",
+                         headers=headers).json
+    assert summary["commands"] == 0
+    assert client.get("/users/current/summary",
+                      headers=headers).json["commands"] == 0
+
+
+def test_adds_a_command_per_template(client, headers, dog_id, template_ids):
+    response = add_templates(client, headers, dog_id, template_ids)
+
+    assert response.status_code == 200
+    assert [(command["name"], command["type"], command["notes"])
+            for command in response.json] == [
+        ("sit", "obedience", []), ("spin", "trick", [])]
+    assert response.json[0]["description"] == "standard sit"
+
+    summary = client.get(f"/dogs/current/{dog_id}/summary",
+                         headers=headers).json
+    assert summary["by_type"] == {"obedience": 1, "trick": 1}
+    assert summary["proficiency"] == {"1": 1, "2": 1}
+    assert db.session.query(ProficiencyHistory).count() == 2
+
+
+def test_repeated_template_id_adds_nothing(
+        client, headers, dog_id, template_ids):
+    response = add_templates(
+        client, headers, dog_id, [template_ids[0], *template_ids])
+
+    assert response.status_code == 400
+    assert "must not repeat" in response.text
+    assert_nothing_added(client, headers, dog_id)
+
+
+def test_unknown_template_id_adds_nothing(
+        client, headers, dog_id, template_ids):
+    response = add_templates(
+        client, headers, dog_id, [*template_ids, max(template_ids) + 1])
+
+    assert response.status_code == 400
+    assert_nothing_added(client, headers, dog_id)
+
+
+def test_other_users_dog_gets_401(
+        client, headers, other_headers, dog_id, template_ids):
+    response = add_templates(client, other_headers, dog_id, template_ids)
+
+    assert response.status_code == 401
+    assert_nothing_added(client, headers, dog_id)
+
+
+@pytest.mark.parametrize("body", [
+    {},
+    {"template_ids": []},
+    {"template_ids": "1"},
+    {"template_ids": [1, "2"]},
+])
+def test_invalid_template_ids_get_400(client, headers, dog_id, body):
+    response = client.post(f"/dogs/current/{dog_id}/commands/templates",
+                           headers=headers, json=body)
+
+    assert response.status_code == 400